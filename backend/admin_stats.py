@@ -0,0 +1,187 @@
+"""Platform rollups for the admin dashboard.
+
+Every figure is computed inside Mongo with aggregation pipelines that project
+only the fields they group on, so the API never pulls whole collections into
+Python. With tenant shards each shard runs the same pipelines and the small
+per-shard results are merged here. Archived websites (``websites_archive``)
+count as deleted websites and their bytes as storage until they are purged.
+Results are cached for ``ADMIN_STATS_TTL``
+seconds; at millions of documents the dashboard reads a cached rollup instead
+of re-scanning.
+"""
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import orjson
+
+from archive import ARCHIVE_COLLECTION
+
+ADMIN_STATS_TTL = int(os.environ.get('ADMIN_STATS_TTL', '60'))
+ADMIN_STATS_TAG = "admin-stats"
+
+
+def _count(match: Optional[dict] = None) -> list:
+    return ([{"$match": match}] if match else []) + [{"$count": "n"}]
+
+
+def _first_count(bucket: list) -> int:
+    return bucket[0]["n"] if bucket else 0
+
+
+class AdminStats:
+    def __init__(self, dbs: List, cache, ttl: int = ADMIN_STATS_TTL):
+        self.dbs = dbs
+        self.cache = cache
+        self.ttl = ttl
+
+    async def ensure_indexes(self):
+        for db in self.dbs:
+            await db.websites.create_index([("is_active", 1), ("industry", 1)])
+            await db.websites.create_index("user_id")
+            await db.media.create_index("user_id")
+
+    async def _cached(self, key: str, compute) -> str:
+        """JSON text for a rollup, recomputed at most once per TTL."""
+        cache_key = f"admin:{key}"
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        data = {**await compute(), "generated_at": datetime.utcnow()}
+        body = orjson.dumps(data).decode("utf-8")
+        await self.cache.set(cache_key, body, ttl=self.ttl, tags=[ADMIN_STATS_TAG])
+        return body
+
+    async def invalidate(self):
+        await self.cache.invalidate_tags([ADMIN_STATS_TAG])
+
+    async def overview(self) -> str:
+        return await self._cached("overview", self._overview)
+
+    async def storage(self, skip: int = 0, limit: int = 50) -> str:
+        return await self._cached(f"storage:{skip}:{limit}", lambda: self._storage(skip, limit))
+
+    async def _overview(self) -> dict:
+        since = datetime.utcnow() - timedelta(days=30)
+        users_pipeline = [
+            {"$project": {"_id": 0, "is_active": 1, "created_at": 1}},
+            {"$facet": {
+                "total": _count(),
+                "active": _count({"is_active": True}),
+                "new_last_30_days": _count({"created_at": {"$gte": since}}),
+            }},
+        ]
+        websites_pipeline = [
+            {"$project": {"_id": 0, "is_active": 1, "industry": 1}},
+            {"$facet": {
+                "status": [{"$group": {"_id": "$is_active", "count": {"$sum": 1}}}],
+                "industries": [
+                    {"$match": {"is_active": True}},
+                    {"$group": {"_id": "$industry", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}},
+                ],
+            }},
+        ]
+        users, by_status, industries = Counter(), Counter(), Counter()
+        for db in self.dbs:
+            # Archived sites are deleted ones that moved out of the hot collection
+            shard_users, *shard_websites = await asyncio.gather(
+                db.users.aggregate(users_pipeline).to_list(1),
+                db.websites.aggregate(websites_pipeline, allowDiskUse=True).to_list(1),
+                db[ARCHIVE_COLLECTION].aggregate(websites_pipeline, allowDiskUse=True).to_list(1),
+            )
+            for key, bucket in shard_users[0].items():
+                users[key] += _first_count(bucket)
+            for result in shard_websites:
+                for bucket in result[0]["status"]:
+                    by_status[bucket["_id"]] += bucket["count"]
+                for bucket in result[0]["industries"]:
+                    industries[bucket["_id"]] += bucket["count"]
+        return {
+            "users": {
+                "total": users["total"],
+                "active": users["active"],
+                "new_last_30_days": users["new_last_30_days"],
+            },
+            "websites": {
+                "total": sum(by_status.values()),
+                "active": by_status.get(True, 0),
+                "deleted": by_status.get(False, 0),
+            },
+            "industries": [
+                {"industry": industry, "count": count}
+                for industry, count in sorted(industries.items(), key=lambda item: (-item[1], item[0] or ""))
+            ],
+        }
+
+    async def _storage(self, skip: int, limit: int) -> dict:
+        """Bytes per user: website documents ($bsonSize) plus uploaded media files."""
+        website_sizes = {"$project": {"_id": 0, "user_id": 1, "bytes": {"$bsonSize": "$$ROOT"}}}
+        pipeline = [
+            website_sizes,
+            {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": [website_sizes]}},
+            {"$group": {"_id": "$user_id", "website_bytes": {"$sum": "$bytes"}, "websites": {"$sum": 1}}},
+            {"$unionWith": {"coll": "media", "pipeline": [
+                {"$group": {"_id": "$user_id", "media_bytes": {"$sum": "$size"}, "media_files": {"$sum": 1}}},
+            ]}},
+            {"$group": {
+                "_id": "$_id",
+                "website_bytes": {"$sum": "$website_bytes"},
+                "websites": {"$sum": "$websites"},
+                "media_bytes": {"$sum": "$media_bytes"},
+                "media_files": {"$sum": "$media_files"},
+            }},
+            {"$addFields": {"total_bytes": {"$add": ["$website_bytes", "$media_bytes"]}}},
+            {"$facet": {
+                "totals": [{"$group": {
+                    "_id": None,
+                    "users": {"$sum": 1},
+                    "website_bytes": {"$sum": "$website_bytes"},
+                    "media_bytes": {"$sum": "$media_bytes"},
+                    "total_bytes": {"$sum": "$total_bytes"},
+                }}],
+                # Every shard returns its first skip + limit; the page is cut after merging
+                "users": [
+                    {"$sort": {"total_bytes": -1, "_id": 1}},
+                    {"$limit": skip + limit},
+                    {"$lookup": {
+                        "from": "users",
+                        "localField": "_id",
+                        "foreignField": "id",
+                        "pipeline": [{"$project": {"_id": 0, "name": 1, "email": 1}}],
+                        "as": "owner",
+                    }},
+                ],
+            }},
+        ]
+        results = await asyncio.gather(*(
+            db.websites.aggregate(pipeline, allowDiskUse=True).to_list(1) for db in self.dbs
+        ))
+        totals = Counter({"users": 0, "website_bytes": 0, "media_bytes": 0, "total_bytes": 0})
+        rows = []
+        for result in results:
+            for shard_totals in result[0]["totals"]:
+                shard_totals.pop("_id", None)
+                totals.update(shard_totals)
+            rows.extend(result[0]["users"])
+        rows.sort(key=lambda row: (-row["total_bytes"], row["_id"]))
+        return {
+            "totals": dict(totals),
+            "users": [
+                {
+                    "user_id": row["_id"],
+                    "name": row["owner"][0].get("name") if row["owner"] else None,
+                    "email": row["owner"][0].get("email") if row["owner"] else None,
+                    "websites": row["websites"],
+                    "media_files": row["media_files"],
+                    "website_bytes": row["website_bytes"],
+                    "media_bytes": row["media_bytes"],
+                    "total_bytes": row["total_bytes"],
+                }
+                for row in rows[skip:skip + limit]
+            ],
+            "skip": skip,
+            "limit": limit,
+        }
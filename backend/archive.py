@@ -0,0 +1,203 @@
+"""Archival of soft-deleted websites.
+
+Deleting a website only marks it inactive (``deleted_at`` records when), so it
+can be undone. After ``ARCHIVE_GRACE_DAYS`` the document is moved out of the
+hot ``websites`` collection into ``websites_archive``, and the same sweep
+purges it ``ARCHIVE_RETENTION_DAYS`` later. Both steps are idempotent
+(upsert into the archive, then delete from the hot collection), so several
+workers can run the sweep and a crash in between loses nothing; an archive
+copy whose site was restored in between is removed again.
+
+Purging also deletes the site's imported products and inquiries, and calls
+``on_purge`` with the purged ids for data kept elsewhere (revision history).
+Media is not purged: it belongs to the user's library, not to one website,
+and other sites may reference the same files.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_GRACE_DAYS = float(os.environ.get('ARCHIVE_GRACE_DAYS', '7'))
+ARCHIVE_RETENTION_DAYS = float(os.environ.get('ARCHIVE_RETENTION_DAYS', '90'))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '200'))
+# Suggest `compact` once this share of a collection's storage is reusable free space
+COMPACT_FREE_RATIO = float(os.environ.get('COMPACT_FREE_RATIO', '0.3'))
+
+ARCHIVE_COLLECTION = "websites_archive"
+DELETED_FILTER = {"is_active": False, "deleted_at": {"$type": "date"}}
+
+
+# Collections holding per-website data, keyed by website_id, purged with the site
+PURGED_WITH_WEBSITE = ("products", "inquiries")
+
+
+class WebsiteArchiver:
+    def __init__(self, db, on_purge: Optional[Callable[[List[str]], Awaitable]] = None):
+        self.db = db
+        self.on_purge = on_purge
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def archive(self):
+        return self.db[ARCHIVE_COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.db.websites.create_index(
+            "deleted_at", partialFilterExpression={"deleted_at": {"$type": "date"}}
+        )
+        await self.archive.create_index("id", unique=True)
+        await self.archive.create_index("user_id")
+        # purge_at used to be a TTL index, which deleted archived sites without their data
+        indexes = await self.archive.index_information()
+        if "expireAfterSeconds" in indexes.get("purge_at_1", {}):
+            await self.archive.drop_index("purge_at_1")
+        await self.archive.create_index("purge_at")
+
+    async def archive_expired(self) -> int:
+        """Move sites deleted longer than the grace period into the archive."""
+        # Sites deleted before deleted_at existed start their grace period now
+        await self.db.websites.update_many(
+            {"is_active": False, "deleted_at": {"$not": {"$type": "date"}}},
+            {"$set": {"deleted_at": datetime.utcnow()}},
+        )
+        cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_GRACE_DAYS)
+        query = {**DELETED_FILTER, "deleted_at": {"$lte": cutoff}}
+        moved = 0
+        while True:
+            batch = await self.db.websites.find(query).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+            if not batch:
+                return moved
+            now = datetime.utcnow()
+            purge_at = now + timedelta(days=ARCHIVE_RETENTION_DAYS)
+            await self.archive.bulk_write(
+                [
+                    ReplaceOne({"id": doc["id"]}, {**doc, "archived_at": now, "purge_at": purge_at}, upsert=True)
+                    for doc in batch
+                ],
+                ordered=False,
+            )
+            # Only remove documents that are still expired, in case one was restored meanwhile
+            ids = [doc["id"] for doc in batch]
+            result = await self.db.websites.delete_many({"id": {"$in": ids}, **query})
+            moved += result.deleted_count
+            if result.deleted_count < len(batch):
+                # Restored between the two writes: the archive copy is stale, drop it
+                live = await self.db.websites.distinct("id", {"id": {"$in": ids}})
+                if live:
+                    await self.archive.delete_many({"id": {"$in": live}, "archived_at": now})
+            if len(batch) < ARCHIVE_BATCH_SIZE:
+                return moved
+
+    async def purge_expired(self) -> int:
+        """Delete archived sites past their retention, with their products and inquiries."""
+        purged = 0
+        while True:
+            expired = await self.archive.find(
+                {"purge_at": {"$lte": datetime.utcnow()}}, {"_id": 0, "id": 1}
+            ).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+            if not expired:
+                return purged
+            ids = [doc["id"] for doc in expired]
+            # Dependent data first, so a crash never leaves it without its archived site
+            for collection in PURGED_WITH_WEBSITE:
+                await self.db[collection].delete_many({"website_id": {"$in": ids}})
+            if self.on_purge is not None:
+                await self.on_purge(ids)
+            result = await self.archive.delete_many({"id": {"$in": ids}})
+            purged += result.deleted_count
+            if len(expired) < ARCHIVE_BATCH_SIZE:
+                return purged
+
+    async def list_deleted(self, user_id: str, projection: dict) -> List[dict]:
+        """Deleted sites for a user, whether still in the grace period or archived."""
+        recent = await self.db.websites.find({"user_id": user_id, **DELETED_FILTER}, projection).to_list(100)
+        archived = await self.archive.find({"user_id": user_id}, projection).to_list(100)
+        return sorted(recent + archived, key=lambda doc: doc.get("deleted_at") or datetime.min, reverse=True)
+
+    async def restore(self, website_id: str, user_id: str, slug_taken) -> Optional[dict]:
+        """Bring a deleted website back; returns its document or None if unknown.
+
+        ``slug_taken(user_id, slug)`` decides whether an archived site needs a
+        new slug because another site took it after the original moved out.
+        """
+        restore_fields = {"is_active": True, "deleted_at": None, "updated_at": datetime.utcnow()}
+        result = await self.db.websites.update_one(
+            {"id": website_id, "user_id": user_id, "is_active": False}, {"$set": restore_fields}
+        )
+        if result.matched_count:
+            return await self.db.websites.find_one({"id": website_id})
+
+        doc = await self.archive.find_one({"id": website_id, "user_id": user_id})
+        if doc is None:
+            return None
+        doc.pop("archived_at", None)
+        doc.pop("purge_at", None)
+        doc.update(restore_fields)
+        if await slug_taken(user_id, doc["slug"]):
+            doc["slug"] = f"{doc['slug']}-{website_id[:8]}"
+        await self.db.websites.replace_one({"id": website_id}, doc, upsert=True)
+        await self.archive.delete_one({"id": website_id})
+        return doc
+
+    async def compaction_report(self) -> dict:
+        """collStats for the hot and archive collections, flagging ones worth compacting."""
+        collections = {}
+        for name in ("websites", ARCHIVE_COLLECTION):
+            try:
+                stats = await self.db.command("collStats", name)
+            except OperationFailure:
+                stats = {}
+            storage = stats.get("storageSize", 0)
+            free = stats.get("freeStorageSize", 0)
+            collections[name] = {
+                "count": stats.get("count", 0),
+                "size_bytes": stats.get("size", 0),
+                "avg_document_bytes": stats.get("avgObjSize", 0),
+                "storage_bytes": storage,
+                "free_storage_bytes": free,
+                "index_bytes": stats.get("totalIndexSize", 0),
+                "index_sizes": stats.get("indexSizes", {}),
+                "compact_recommended": bool(storage) and free / storage >= COMPACT_FREE_RATIO,
+            }
+        cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_GRACE_DAYS)
+        return {
+            "collections": collections,
+            "pending_archive": await self.db.websites.count_documents(
+                {**DELETED_FILTER, "deleted_at": {"$lte": cutoff}}
+            ),
+            "in_grace_period": await self.db.websites.count_documents(
+                {**DELETED_FILTER, "deleted_at": {"$gt": cutoff}}
+            ),
+            "grace_days": ARCHIVE_GRACE_DAYS,
+            "retention_days": ARCHIVE_RETENTION_DAYS,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                moved = await self.archive_expired()
+                if moved:
+                    logger.info("Archived %d deleted websites", moved)
+                purged = await self.purge_expired()
+                if purged:
+                    logger.info("Purged %d archived websites", purged)
+            except Exception:
+                logger.exception("Website archival sweep failed")
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
@@ -0,0 +1,117 @@
+"""Byte and Lighthouse-style savings of html_optimizer on a sample corpus.
+
+    cd backend && python benchmarks/bench_html_optimizer.py [--runs 20]
+
+Renders every registered template with 0, 3 and 6 products (the showcase
+limit) and 0 or 4 social links, then reports raw and gzipped sizes before and
+after the optimizer, its CPU cost per page, and the audits Lighthouse would flag:
+offscreen images without lazy loading, images without explicit dimensions,
+render-blocking scripts, and inline SVG markup repeated on the page.
+"""
+import argparse
+import gzip
+import os
+import re
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+import site_templates  # noqa: E402
+from html_optimizer import optimize_html  # noqa: E402
+from server import Website, generate_website_html  # noqa: E402
+
+_IMG = re.compile(r"<img\b[^>]*>", re.I)
+_SCRIPT_HEAD = re.compile(r"<head\b.*?</head>", re.S | re.I)
+_SVG = re.compile(r"<svg\b[^>]*>.*?</svg>", re.S | re.I)
+
+
+def make_corpus() -> List[Tuple[str, str]]:
+    corpus = []
+    for template in site_templates.registry:
+        for products in (0, 3, 6):
+            for socials in (0, 4):
+                website = Website(
+                    user_id="bench-user",
+                    business_name="Benchmark Business",
+                    business_description="We make benchmark things for discerning customers. " * 3,
+                    industry=template.key,
+                    contact_email="owner@example.com",
+                    contact_phone="+1 555 0100",
+                    address="1 Benchmark Way",
+                    logo_media_id="logo",
+                    hero_image_media_id="hero",
+                    products=[
+                        {"name": f"Product {i}", "price": "9.99", "description": "A fine item",
+                         "image_media_id": f"product-{i}"}
+                        for i in range(products)
+                    ],
+                    social_links={f"network{i}": f"https://example.com/{i}" for i in range(socials)},
+                    slug="benchmark",
+                )
+                html = generate_website_html(website, media_url=lambda user_id, media_id: f"/media/{media_id}")
+                corpus.append((f"{template.key}/{products}p/{socials}s", html))
+    return corpus
+
+
+def audit(html: str) -> Dict[str, int]:
+    images = _IMG.findall(html)
+    # Everything after the hero section counts as offscreen, as in the optimizer
+    fold = html.lower().find("</section")
+    offscreen = _IMG.findall(html[fold:]) if fold >= 0 else []
+    head = _SCRIPT_HEAD.search(html)
+    head_scripts = re.findall(r"<script\b[^>]*>", head.group(0) if head else "", re.I)
+    svgs = [re.sub(r"\s+", " ", svg) for svg in _SVG.findall(html)]
+    return {
+        "offscreen_eager": sum("loading=" not in img for img in offscreen),
+        "unsized": sum("width=" not in img or "height=" not in img for img in images),
+        "blocking_scripts": sum("defer" not in tag and "async" not in tag for tag in head_scripts),
+        "repeated_svg_bytes": sum(len(svg) for svg in svgs) - sum(len(svg) for svg in set(svgs)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = make_corpus()
+    totals = {"raw": 0, "optimized": 0, "raw_gzip": 0, "optimized_gzip": 0}
+    before: Dict[str, int] = {}
+    after: Dict[str, int] = {}
+    timings = []
+    print(f"{'page':24} {'raw':>8} {'opt':>8} {'saved':>7} {'gz raw':>8} {'gz opt':>8} {'saved':>7}")
+    for label, html in corpus:
+        optimized = optimize_html(html)
+        started = time.perf_counter()
+        for _ in range(args.runs):
+            optimize_html(html)
+        timings.append((time.perf_counter() - started) / args.runs)
+
+        sizes = (len(html.encode()), len(optimized.encode()),
+                 len(gzip.compress(html.encode())), len(gzip.compress(optimized.encode())))
+        for key, size in zip(totals, sizes):
+            totals[key] += size
+        for name, value in audit(html).items():
+            before[name] = before.get(name, 0) + value
+        for name, value in audit(optimized).items():
+            after[name] = after.get(name, 0) + value
+        print(f"{label:24} {sizes[0]:8} {sizes[1]:8} {1 - sizes[1] / sizes[0]:7.1%} "
+              f"{sizes[2]:8} {sizes[3]:8} {1 - sizes[3] / sizes[2]:7.1%}")
+
+    print(f"\n{len(corpus)} pages: {totals['raw']} -> {totals['optimized']} bytes "
+          f"({1 - totals['optimized'] / totals['raw']:.1%} smaller), gzipped {totals['raw_gzip']} -> "
+          f"{totals['optimized_gzip']} ({1 - totals['optimized_gzip'] / totals['raw_gzip']:.1%} smaller)")
+    print(f"optimizer: median {statistics.median(timings) * 1e3:.2f} ms/page, "
+          f"max {max(timings) * 1e3:.2f} ms/page")
+    print("\nLighthouse-style audits (summed over the corpus)")
+    for name in before:
+        print(f"  {name:22} {before[name]:8} -> {after[name]}")
+
+
+if __name__ == "__main__":
+    main()
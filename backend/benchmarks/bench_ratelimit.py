@@ -0,0 +1,84 @@
+"""Per-request overhead of RateLimitMiddleware with the in-memory limiter.
+
+    cd backend && python benchmarks/bench_ratelimit.py [--requests 200000] [--clients 10000]
+
+Drives the middleware directly as an ASGI callable around a no-op app, so the
+numbers are the limiter's own cost: rule matching, key extraction and the
+token bucket update. Also times a sweep over ``--clients`` idle buckets.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import InMemoryRateLimiter, RateLimitMiddleware  # noqa: E402
+
+
+async def noop_app(scope, receive, send):
+    pass
+
+
+async def noop_send(message):
+    pass
+
+
+def make_scope(path: str, client: str, method: str = "GET") -> dict:
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "client": (client, 50000),
+        "headers": [
+            (b"host", b"example.com"),
+            (b"user-agent", b"bench"),
+            (b"accept", b"*/*"),
+            (b"authorization", b"Bearer aaaa.bbbb.sig-" + client.replace(".", "-").encode()),
+        ],
+    }
+
+
+async def run(middleware: RateLimitMiddleware, scopes: list, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        await middleware(scopes[i % len(scopes)], None, noop_send)
+    return (time.perf_counter() - started) / requests
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=10_000)
+    args = parser.parse_args()
+
+    clients = [f"10.0.{i // 256}.{i % 256}" for i in range(args.clients)]
+    baseline = RateLimitMiddleware(noop_app, InMemoryRateLimiter(), rules=[])
+    cases = [
+        ("no matching rule", "/api/websites", "GET", "ip"),
+        ("public page (ip)", "/api/sites/owner@example.com/shop", "GET", "ip"),
+        ("preview (tenant)", "/api/websites/abc/preview", "GET", "tenant"),
+    ]
+    base = await run(baseline, [make_scope("/api/websites", c) for c in clients], args.requests)
+    print(f"{'pass-through (no rules)':28} {base * 1e6:7.2f} us/request")
+    for label, path, method, _ in cases:
+        limiter = InMemoryRateLimiter()
+        middleware = RateLimitMiddleware(noop_app, limiter)
+        scopes = [make_scope(path, c, method) for c in clients]
+        per_request = await run(middleware, scopes, args.requests)
+        print(f"{label:28} {per_request * 1e6:7.2f} us/request "
+              f"(+{(per_request - base) * 1e6:.2f}), {len(limiter)} buckets")
+
+    limiter = InMemoryRateLimiter()
+    for client in clients:
+        limiter.hit_local(f"sites:{client}", 300, 60)
+    started = time.perf_counter()
+    limiter.sweep(limiter.clock() + 120)
+    print(f"sweep of {args.clients} idle buckets: {(time.perf_counter() - started) * 1e3:.2f} ms, "
+          f"{len(limiter)} left")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""CPU time per website list call: pydantic response_model path vs. orjson from Mongo docs.
+
+    cd backend && python benchmarks/bench_serialization.py [--sites 100] [--calls 20]
+
+Both routes serve the same in-memory documents through FastAPI, so the numbers
+include routing, validation, encoding and response construction but no I/O.
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import ORJSONResponse  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from server import Website  # noqa: E402
+
+
+def make_image(size_bytes: int) -> str:
+    return base64.b64encode(os.urandom(size_bytes)).decode('ascii')
+
+
+def make_sites(count: int) -> List[dict]:
+    logo, hero, product = make_image(20_000), make_image(400_000), make_image(60_000)
+    sites = []
+    for i in range(count):
+        sites.append({
+            "id": f"site-{i}",
+            "user_id": "bench-user",
+            "business_name": f"Business {i}",
+            "business_description": "A benchmark business " * 10,
+            "industry": "ecommerce",
+            "contact_email": "owner@example.com",
+            "contact_phone": "+1 555 0100",
+            "address": "1 Benchmark Way",
+            "logo_base64": logo,
+            "hero_image_base64": hero,
+            "products": [
+                {"name": f"Product {j}", "price": "9.99", "description": "Item", "image_base64": product}
+                for j in range(6)
+            ],
+            "colors": {"primary": "#3B82F6", "secondary": "#1E40AF", "accent": "#F59E0B"},
+            "social_links": {"instagram": "https://instagram.com/bench"},
+            "slug": f"business-{i}",
+            "is_active": True,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+        })
+    return sites
+
+
+def build_app(sites: List[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/pydantic", response_model=List[Website])
+    async def pydantic_path():
+        return [Website(**site) for site in sites]
+
+    @app.get("/orjson", response_model=List[Website])
+    async def orjson_path():
+        return ORJSONResponse(sites)
+
+    return app
+
+
+def measure(client: TestClient, path: str, calls: int):
+    client.get(path)  # warm up
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    size = 0
+    for _ in range(calls):
+        size = len(client.get(path).content)
+    return (
+        (time.process_time() - cpu_start) / calls * 1000,
+        (time.perf_counter() - wall_start) / calls * 1000,
+        size,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    sites = make_sites(args.sites)
+    client = TestClient(build_app(sites))
+    results = {path: measure(client, path, args.calls) for path in ("/pydantic", "/orjson")}
+
+    print(f"{args.sites} sites with images, {args.calls} calls per path")
+    print(f"{'path':<10} {'cpu ms/call':>12} {'wall ms/call':>13} {'body MB':>9}")
+    for path, (cpu_ms, wall_ms, size) in results.items():
+        print(f"{path:<10} {cpu_ms:>12.1f} {wall_ms:>13.1f} {size / 1e6:>9.1f}")
+    print(f"speedup (cpu): {results['/pydantic'][0] / results['/orjson'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
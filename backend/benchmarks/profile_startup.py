@@ -0,0 +1,94 @@
+"""Import-time profile of the API process against its startup budget.
+
+    cd backend && python benchmarks/profile_startup.py [--runs 5] [--top 25] [--budget 1.5]
+
+Imports ``server`` in fresh interpreters with ``-X importtime`` and reports
+the median wall-clock import time, the slowest modules by cumulative import
+time, and whether any optional heavy dependency was pulled in at import.
+Exits non-zero when the median exceeds the budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', '1.5'))
+
+# Installed for optional subsystems; none may load before first use
+LAZY_MODULES = ("boto3", "botocore", "redis", "pandas", "numpy", "jq", "openpyxl")
+
+_PROBE = (
+    "import sys, time; start = time.perf_counter(); import server; "
+    "print(time.perf_counter() - start); "
+    "print('loaded:' + ','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    env.setdefault('DB_NAME', 'startup_profile')
+    return env
+
+
+def measure_import(importtime: bool = False):
+    """Import ``server`` in a fresh interpreter; returns (seconds, lazy modules loaded, stderr)."""
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", _PROBE.format(lazy=LAZY_MODULES)]
+    result = subprocess.run(cmd, cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True)
+    seconds, loaded = result.stdout.strip().splitlines()[-2:]
+    return float(seconds), [m for m in loaded[len("loaded:"):].split(",") if m], result.stderr
+
+
+def parse_importtime(stderr: str):
+    """(cumulative_us, self_us, module) rows from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_SECONDS)
+    args = parser.parse_args()
+
+    wall = time.perf_counter()
+    timings = [measure_import()[0] for _ in range(args.runs)]
+    _, loaded, stderr = measure_import(importtime=True)
+    rows = parse_importtime(stderr)
+    median = statistics.median(timings)
+
+    print(f"import server: median {median * 1000:.0f} ms, min {min(timings) * 1000:.0f} ms, "
+          f"max {max(timings) * 1000:.0f} ms over {args.runs} runs "
+          f"(budget {args.budget * 1000:.0f} ms)")
+    print("\nslowest imports (cumulative ms, self ms):")
+    for cumulative_us, self_us, module in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {module}")
+
+    first_party = sorted(
+        (row for row in rows if os.path.exists(os.path.join(BACKEND_DIR, row[2].strip() + ".py"))),
+        reverse=True,
+    )
+    print("\nfirst-party modules (cumulative ms):")
+    for cumulative_us, _, module in first_party:
+        print(f"  {cumulative_us / 1000:8.1f}  {module.strip()}")
+
+    print(f"\noptional dependencies loaded at import: {', '.join(loaded) or 'none'}")
+    print(f"(profiled in {time.perf_counter() - wall:.1f} s)")
+    if median > args.budget or loaded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
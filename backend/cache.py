@@ -0,0 +1,231 @@
+"""Pluggable cache backends shared by the API workers.
+
+``InProcessCache`` is a bounded LRU with TTLs and tag-based invalidation; it is
+the default and is correct for a single worker. With several workers, set
+CACHE_BACKEND=redis: entries then live in a Redis-compatible server shared by
+all processes, each worker keeps a small in-process copy in front of it, and
+invalidations are broadcast over pub/sub so every worker drops its local copy.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '2048'))
+CACHE_LOCAL_TTL = int(os.environ.get('CACHE_LOCAL_TTL', '30'))
+INVALIDATION_CHANNEL = os.environ.get('CACHE_INVALIDATION_CHANNEL', 'webcraft:invalidate')
+
+
+class CacheBackend(abc.ABC):
+    # Bumped by every invalidation or delete, including ones broadcast by other workers
+    generation = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[int] = None, tags: Iterable[str] = ()):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    async def invalidate_tags(self, tags: Iterable[str]):
+        ...
+
+
+class InProcessCache(CacheBackend):
+    """LRU bounded by entry count and, with ``max_bytes``, by the total length of its values."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.generation = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.get_local(key)
+
+    def get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None, tags: Iterable[str] = ()):
+        self.set_local(key, value, ttl, tags)
+
+    def set_local(self, key: str, value: str, ttl: Optional[int] = None, tags: Iterable[str] = ()):
+        if key in self._entries:
+            self._remove(key)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        tags = tuple(tags)
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[key] = (value, expires_at, tags)
+        self.size_bytes += len(value)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self.size_bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+
+    async def delete(self, key: str):
+        self.generation += 1
+        self._remove(key)
+
+    async def invalidate_tags(self, tags: Iterable[str]):
+        self.invalidate_tags_local(tags)
+
+    def invalidate_tags_local(self, tags: Iterable[str]):
+        self.generation += 1
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size_bytes -= len(entry[0])
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisCache(CacheBackend):
+    """Shared cache in a Redis-compatible server with a per-worker near cache."""
+
+    def __init__(self, url: str = CACHE_REDIS_URL, prefix: str = "webcraft:",
+                 local_ttl: int = CACHE_LOCAL_TTL, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.redis = client
+        self.prefix = prefix
+        self.local_ttl = local_ttl
+        self.local = InProcessCache()
+        self.worker_id = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        self._pubsub = None
+
+    @property
+    def generation(self) -> int:
+        return self.local.generation
+
+    async def start(self):
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(INVALIDATION_CHANNEL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(INVALIDATION_CHANNEL)
+            await self._pubsub.close()
+        await self.redis.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.local.get_local(key)
+        if value is not None:
+            return value
+        raw = await self.redis.get(self.prefix + key)
+        if raw is None:
+            return None
+        value = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+        # Tags are tracked in Redis; invalidations name the keys, so none are kept here
+        self.local.set_local(key, value, self.local_ttl)
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None, tags: Iterable[str] = ()):
+        tags = tuple(tags)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.prefix + key, value, ex=ttl)
+            for tag in tags:
+                pipe.sadd(self.prefix + "tag:" + tag, key)
+                if ttl:
+                    pipe.expire(self.prefix + "tag:" + tag, ttl * 2)
+            await pipe.execute()
+        self.local.set_local(key, value, min(ttl or self.local_ttl, self.local_ttl), tags)
+
+    async def delete(self, key: str):
+        await self.redis.delete(self.prefix + key)
+        await self.local.delete(key)
+        await self._publish({"keys": [key]})
+
+    async def invalidate_tags(self, tags: Iterable[str]):
+        tags = list(tags)
+        keys = []
+        for tag in tags:
+            tag_key = self.prefix + "tag:" + tag
+            members = await self.redis.smembers(tag_key)
+            keys.extend(k.decode('utf-8') if isinstance(k, bytes) else k for k in members)
+            await self.redis.delete(tag_key)
+        if keys:
+            await self.redis.delete(*[self.prefix + key for key in keys])
+        self.local.invalidate_tags_local(tags)
+        for key in keys:
+            self.local._remove(key)
+        # Other workers may hold untagged near-cache copies, so send the resolved keys too
+        await self._publish({"tags": tags, "keys": keys})
+
+    async def _publish(self, message: dict):
+        message["origin"] = self.worker_id
+        await self.redis.publish(INVALIDATION_CHANNEL, json.dumps(message))
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                payload = json.loads(message["data"])
+                if payload.get("origin") == self.worker_id:
+                    continue
+                self.local.invalidate_tags_local(payload.get("tags", ()))
+                for key in payload.get("keys", ()):
+                    self.local._remove(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener failed; retrying")
+                await asyncio.sleep(1)
+
+
+def create_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    if backend == "redis":
+        return RedisCache()
+    if backend != "memory":
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+    return InProcessCache()
@@ -0,0 +1,269 @@
+"""Bulk product catalog import from CSV and XLSX files.
+
+Uploaded files are parsed in chunks of ``IMPORT_CHUNK_ROWS`` rows (pandas'
+chunked CSV reader, openpyxl's read-only row iterator for XLSX), so memory
+stays flat regardless of file size. Each chunk is validated with vectorized
+pandas checks and written to the ``products`` collection as one unordered
+bulk upsert keyed by (website_id, sku). pandas and openpyxl are imported on
+first use, not at API start-up.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Iterator, List, Optional, Set, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+from jobs import PermanentJobError
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_ROWS = int(os.environ.get('IMPORT_CHUNK_ROWS', '5000'))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+MAX_IMPORT_FILE_BYTES = int(os.environ.get('MAX_IMPORT_FILE_BYTES', str(50 * 1024 * 1024)))
+
+IMPORT_CONTENT_TYPES = {
+    "text/csv",
+    "text/plain",
+    "application/csv",
+    "application/vnd.ms-excel",
+    "application/octet-stream",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+REQUIRED_COLUMNS = ("name", "price")
+OPTIONAL_COLUMNS = ("sku", "description", "category", "stock")
+COLUMN_ALIASES = {
+    "title": "name",
+    "product": "name",
+    "product_name": "name",
+    "unit_price": "price",
+    "cost": "price",
+    "sku_code": "sku",
+    "product_id": "sku",
+    "quantity": "stock",
+    "qty": "stock",
+}
+
+PRODUCT_PROJECTION = {
+    "_id": 0, "sku": 1, "name": 1, "description": 1, "price": 1, "category": 1, "stock": 1, "position": 1,
+}
+
+
+class ImportFileError(PermanentJobError):
+    """The file as a whole can't be imported (unknown format, missing columns)."""
+
+
+def file_format(filename: str) -> Optional[str]:
+    extension = os.path.splitext(filename.lower())[1]
+    return {".csv": "csv", ".txt": "csv", ".xlsx": "xlsx"}.get(extension)
+
+
+async def ensure_indexes(db):
+    await db.products.create_index([("website_id", ASCENDING), ("sku", ASCENDING)], unique=True)
+    await db.products.create_index([("website_id", ASCENDING), ("position", ASCENDING)])
+
+
+def _xlsx_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _iter_frames(path, fmt: str, chunk_rows: int) -> Iterator:
+    import pandas as pd
+
+    if fmt == "csv":
+        yield from pd.read_csv(
+            path, dtype=str, keep_default_na=False, chunksize=chunk_rows,
+            encoding="utf-8-sig", skipinitialspace=True,
+        )
+        return
+
+    import openpyxl
+
+    # openpyxl refuses paths without an .xlsx extension, which staged uploads lack
+    with open(path, "rb") as f:
+        workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_xlsx_cell(cell) for cell in next(rows, ())]
+            batch: List[List[str]] = []
+            for row in rows:
+                # Read-only sheets drop trailing empty cells; pad so every row has every column
+                cells = [_xlsx_cell(cell) for cell in row[:len(header)]]
+                batch.append(cells + [""] * (len(header) - len(cells)))
+                if len(batch) >= chunk_rows:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch or not header:
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            workbook.close()
+
+
+def iter_chunks(path, fmt: str, chunk_rows: int = IMPORT_CHUNK_ROWS) -> Iterator:
+    """DataFrames of string cells, ``chunk_rows`` rows at a time; blocking.
+
+    A file that can't be parsed raises ImportFileError, so the job isn't retried.
+    """
+    try:
+        yield from _iter_frames(path, fmt, chunk_rows)
+    except OSError:
+        raise
+    except Exception as e:
+        raise ImportFileError(f"Could not read the {fmt.upper()} file: {e}") from e
+
+
+def normalize_columns(frame):
+    columns = [str(column).strip().lower().replace(" ", "_") for column in frame.columns]
+    frame.columns = [COLUMN_ALIASES.get(column, column) for column in columns]
+    missing = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ImportFileError(f"Missing required columns: {', '.join(missing)}")
+    # Duplicate headers (e.g. both "title" and "name") keep the first one
+    return frame.loc[:, ~frame.columns.duplicated()]
+
+
+def parse_prices(raw):
+    """Numeric prices from strings like "$5", "1,299.00" or "1.299,50"; NaN if unparseable."""
+    import pandas as pd
+
+    cleaned = raw.str.replace(r"[^\d,.\-]", "", regex=True)
+    # A comma is the decimal separator when it comes last and isn't grouping thousands
+    comma_decimal = (cleaned.str.rfind(",") > cleaned.str.rfind(".")) & \
+        ~cleaned.str.fullmatch(r"-?\d{1,3}(?:,\d{3})+")
+    cleaned = cleaned.where(
+        ~comma_decimal, cleaned.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    )
+    cleaned = cleaned.where(comma_decimal, cleaned.str.replace(",", "", regex=False))
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+def validate_chunk(frame, first_row: int, seen_skus: Set[str]) -> Tuple[list, List[dict]]:
+    """Vectorized checks over one chunk; returns (valid product records, row errors).
+
+    ``first_row`` is the spreadsheet row number of the chunk's first data row.
+    """
+    import pandas as pd
+
+    frame = normalize_columns(frame)
+    # Short rows leave missing cells, which astype(str) would turn into "nan"
+    frame = frame.reset_index(drop=True).fillna("")
+    text = {column: frame[column].astype(str).str.strip() for column in frame.columns
+            if column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+
+    name = text["name"]
+    price = parse_prices(text["price"])
+    sku = text["sku"] if "sku" in text else pd.Series("", index=frame.index)
+    sku = sku.where(sku != "", name.str.lower())
+    stock = text.get("stock", pd.Series("", index=frame.index))
+    stock_value = pd.to_numeric(stock, errors="coerce")
+
+    checks = [
+        ("name", name == "", "Name is required"),
+        ("price", price.isna(), "Price is not a number"),
+        ("price", price < 0, "Price can't be negative"),
+        ("stock", (stock != "") & (stock_value.isna() | (stock_value < 0)), "Stock must be a non-negative number"),
+        ("sku", (sku != "") & (sku.duplicated(keep="first") | sku.isin(seen_skus)), "Duplicate product"),
+    ]
+    invalid = pd.Series(False, index=frame.index)
+    errors = []
+    for column, mask, message in checks:
+        mask = mask.fillna(False)
+        invalid |= mask
+        for index in frame.index[mask]:
+            errors.append({"row": first_row + int(index), "column": column, "message": message})
+    errors.sort(key=lambda error: error["row"])
+
+    valid = ~invalid
+    seen_skus.update(sku[valid])
+    count = int(valid.sum())
+    blank = [""] * count
+    columns = {
+        "sku": sku[valid].tolist(),
+        "name": name[valid].tolist(),
+        "description": text["description"][valid].tolist() if "description" in text else blank,
+        "category": text["category"][valid].tolist() if "category" in text else blank,
+        "price": price[valid].map("{:.2f}".format).tolist(),
+        "stock": (
+            [None if pd.isna(value) else int(value) for value in stock_value[valid].tolist()]
+            if "stock" in text else [None] * count
+        ),
+        "position": (frame.index[valid] + first_row).tolist(),
+    }
+    records = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return records, errors
+
+
+def _upserts(records: list, website_id: str, user_id: str, import_id: str) -> List[UpdateOne]:
+    now = datetime.utcnow()
+    # One urandom call per chunk instead of one per row
+    random_bytes = os.urandom(16 * len(records))
+    return [
+        UpdateOne(
+            {"website_id": website_id, "sku": record["sku"]},
+            {
+                "$set": {**record, "user_id": user_id, "import_id": import_id, "updated_at": now},
+                "$setOnInsert": {
+                    "id": str(uuid.UUID(bytes=random_bytes[i * 16:i * 16 + 16], version=4)),
+                    "created_at": now,
+                },
+            },
+            upsert=True,
+        )
+        for i, record in enumerate(records)
+    ]
+
+
+async def run_import(db, storage, job: dict, ctx) -> dict:
+    """Job handler body: import the uploaded file named in ``job['payload']``."""
+    payload = job["payload"]
+    website_id, user_id = job["website_id"], job["user_id"]
+    fmt = file_format(payload["filename"])
+    if fmt is None:
+        raise ImportFileError("Unsupported file type; upload a .csv or .xlsx file")
+
+    import_id = job["id"]
+    rows = imported = failed = total_errors = 0
+    errors: List[dict] = []
+    seen_skus: Set[str] = set()
+    path = await storage.fetch_to_file(payload["key"])
+    try:
+        chunks = iter_chunks(path, fmt)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            # Header is row 1; data starts on row 2
+            records, chunk_errors = await asyncio.to_thread(validate_chunk, chunk, rows + 2, seen_skus)
+            rows += len(chunk)
+            if records:
+                await db.products.bulk_write(_upserts(records, website_id, user_id, import_id), ordered=False)
+            imported += len(records)
+            failed += len({error["row"] for error in chunk_errors})
+            total_errors += len(chunk_errors)
+            errors.extend(chunk_errors[:max(0, IMPORT_MAX_ERRORS - len(errors))])
+            await ctx.progress(rows, None, imported=imported, failed=failed)
+
+        if payload.get("mode") == "replace" and imported:
+            await db.products.delete_many({"website_id": website_id, "import_id": {"$ne": import_id}})
+    except ImportFileError:
+        await storage.delete(payload["key"])
+        raise
+    finally:
+        await storage.release_file(payload["key"], path)
+    # Kept until now so a transient failure can be retried from the same file
+    await storage.delete(payload["key"])
+
+    return {
+        "rows": rows,
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": len(errors) < total_errors,
+    }
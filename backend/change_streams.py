@@ -0,0 +1,161 @@
+"""Change-stream driven invalidation of cached site pages.
+
+Watches the ``websites`` and ``users`` collections (requires a replica set)
+and invalidates exactly the cached pages tagged with the changed document, so
+edits made outside the API (admin scripts, other workers, restores) are never
+served stale. Updated websites can optionally be re-rendered straight away.
+
+The resume token is persisted in ``change_stream_state`` so a restarted
+process picks up where the previous one stopped. Only one process holds the
+watcher lease at a time; the others stand by and take over if it expires.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAMS_ENABLED = os.environ.get('CHANGE_STREAMS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CHANGE_STREAM_RERENDER = os.environ.get('CHANGE_STREAM_RERENDER', 'true').lower() in ('1', 'true', 'yes')
+LEASE_SECONDS = int(os.environ.get('CHANGE_STREAM_LEASE_SECONDS', '30'))
+TOKEN_SAVE_INTERVAL = float(os.environ.get('CHANGE_STREAM_TOKEN_SAVE_INTERVAL', '1.0'))
+
+WATCHED_COLLECTIONS = ["websites", "users"]
+ALL_PAGES_TAG = "pages"
+STATE_ID = "page-cache"
+
+# Resume tokens that fell off the oplog or no longer match the stream
+_RESUME_ERRORS = {260, 280, 286}
+
+
+def document_tag(collection: str, object_id) -> str:
+    """Cache tag for every page rendered from the given Mongo document."""
+    return f"{collection}:{object_id}"
+
+
+class ChangeStreamInvalidator:
+    def __init__(self, db, cache,
+                 rerender: Optional[Callable[[dict], Awaitable[None]]] = None):
+        self.db = db
+        self.cache = cache
+        self.rerender = rerender if CHANGE_STREAM_RERENDER else None
+        self.owner = uuid.uuid4().hex
+        self.listeners: List[Callable[[dict], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: Callable[[dict], Awaitable[None]]):
+        """Register a coroutine called with every change event after invalidation."""
+        self.listeners.append(listener)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.db.change_stream_state.update_one(
+            {"_id": STATE_ID, "owner": self.owner},
+            {"$set": {"lease_until": datetime.utcnow()}},
+        )
+
+    async def _acquire_lease(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        try:
+            return await self.db.change_stream_state.find_one_and_update(
+                {"_id": STATE_ID, "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+                upsert=True,
+                return_document=True,
+            )
+        except PyMongoError:
+            # Duplicate key on upsert: another process holds a live lease
+            return None
+
+    async def _run(self):
+        while True:
+            try:
+                state = await self._acquire_lease()
+                if state is None:
+                    await asyncio.sleep(LEASE_SECONDS / 2)
+                    continue
+                await self._watch(state.get("resume_token"))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change stream watcher failed; restarting")
+                await asyncio.sleep(5)
+
+    async def _watch(self, resume_token):
+        pipeline = [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]
+        try:
+            stream = self.db.watch(pipeline, full_document="updateLookup", resume_after=resume_token)
+            await self._consume(stream)
+        except OperationFailure as e:
+            if resume_token is None or e.code not in _RESUME_ERRORS:
+                raise
+            # Missed events can't be replayed: drop every cached page and start fresh
+            logger.warning("Change stream resume token is no longer valid; clearing page cache")
+            await self.cache.invalidate_tags([ALL_PAGES_TAG])
+            await self._save_token(None)
+
+    async def _consume(self, stream):
+        loop = asyncio.get_running_loop()
+        last_saved = loop.time()
+        async with stream:
+            while True:
+                change = await stream.try_next()
+                now = loop.time()
+                if change is not None:
+                    await self._handle(change)
+                if now - last_saved >= TOKEN_SAVE_INTERVAL:
+                    if not await self._save_token(stream.resume_token):
+                        return
+                    last_saved = now
+                if change is None:
+                    await asyncio.sleep(0.1)
+
+    async def _save_token(self, token) -> bool:
+        """Persist the resume token and renew the lease; False if the lease was lost."""
+        result = await self.db.change_stream_state.update_one(
+            {"_id": STATE_ID, "owner": self.owner},
+            {"$set": {
+                "resume_token": token,
+                "lease_until": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS),
+                "updated_at": datetime.utcnow(),
+            }},
+        )
+        return result.matched_count == 1
+
+    async def _handle(self, change: dict):
+        collection = change["ns"]["coll"]
+        object_id = change["documentKey"]["_id"]
+        await self.cache.invalidate_tags([document_tag(collection, object_id)])
+        for listener in self.listeners:
+            try:
+                await listener(change)
+            except Exception:
+                logger.exception("Change stream listener failed")
+
+        full_document = change.get("fullDocument")
+        if (
+            self.rerender is not None
+            and collection == "websites"
+            and change["operationType"] in ("insert", "update", "replace")
+            and full_document
+            and full_document.get("is_active", True)
+        ):
+            try:
+                await self.rerender(full_document)
+            except Exception:
+                logger.exception("Failed to re-render website %s", full_document.get("id"))
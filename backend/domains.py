@@ -0,0 +1,162 @@
+"""Custom domain routing for hosted websites.
+
+``DomainMap`` keeps every active custom domain in a dict, loaded at startup
+and kept current by the website write handlers (plus change-stream events and
+a periodic refresh for writes made by other workers). With tenant shards the
+map is loaded from every shard. Resolving a ``Host``
+header is a single dict lookup; together with the page cache, a custom-domain
+request for a cached site never touches Mongo.
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DOMAIN_MAP_REFRESH_SECONDS = int(os.environ.get('DOMAIN_MAP_REFRESH_SECONDS', '60'))
+
+_HOSTNAME = re.compile(r'^(?=.{1,253}$)(?!-)[a-z0-9-]{1,63}(?<!-)(\.(?!-)[a-z0-9-]{1,63}(?<!-))+$')
+
+
+class DomainTarget(NamedTuple):
+    website_id: str
+    user_id: str
+    username: str
+    slug: str
+
+
+def normalize_domain(domain: str) -> Optional[str]:
+    """Lowercase a hostname and strip any port and trailing dot; None if it isn't valid."""
+    domain = domain.strip().lower().rstrip(".")
+    if domain.startswith("["):
+        return None
+    domain = domain.split(":", 1)[0]
+    return domain if _HOSTNAME.match(domain) else None
+
+
+class DomainMap:
+    def __init__(self, dbs: List):
+        self.dbs = dbs
+        self._domains: Dict[str, DomainTarget] = {}
+        self._by_website: Dict[str, str] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+    def resolve(self, host: str) -> Optional[DomainTarget]:
+        target = self._domains.get(host)
+        if target is None and ":" in host:
+            target = self._domains.get(host.split(":", 1)[0])
+        return target
+
+    def set(self, domain: Optional[str], website_id: str, user_id: str, username: str, slug: str):
+        self.remove(website_id)
+        if domain:
+            self._domains[domain] = DomainTarget(website_id, user_id, username, slug)
+            self._by_website[website_id] = domain
+
+    def remove(self, website_id: str):
+        domain = self._by_website.pop(website_id, None)
+        if domain is not None:
+            self._domains.pop(domain, None)
+
+    async def ensure_index(self):
+        for db in self.dbs:
+            await db.websites.create_index(
+                "custom_domain",
+                unique=True,
+                partialFilterExpression={"custom_domain": {"$type": "string"}},
+            )
+
+    async def load(self):
+        pipeline = [
+            {"$match": {"custom_domain": {"$type": "string"}, "is_active": True}},
+            {"$project": {"_id": 0, "id": 1, "user_id": 1, "slug": 1, "custom_domain": 1}},
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "id", "as": "owner"}},
+            {"$project": {"id": 1, "user_id": 1, "slug": 1, "custom_domain": 1, "owner.email": 1}},
+        ]
+        domains, by_website = {}, {}
+        for db in self.dbs:
+            async for doc in db.websites.aggregate(pipeline):
+                if not doc["owner"]:
+                    continue
+                domains[doc["custom_domain"]] = DomainTarget(
+                    doc["id"], doc["user_id"], doc["owner"][0]["email"], doc["slug"]
+                )
+                by_website[doc["id"]] = doc["custom_domain"]
+        # Swap in one step so lookups never see a half-built map
+        self._domains, self._by_website = domains, by_website
+
+    def start_refresh(self):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop_refresh(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(DOMAIN_MAP_REFRESH_SECONDS)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Failed to refresh the custom domain map")
+
+    async def apply_change(self, change: dict, db=None):
+        """Change-stream hook keeping the map current for writes made elsewhere.
+
+        ``db`` is the shard the change was observed on (the first one by default).
+        """
+        db = self.dbs[0] if db is None else db
+        if change["ns"]["coll"] != "websites":
+            return
+        website = change.get("fullDocument")
+        if not website:
+            return
+        if website.get("is_active", True) and website.get("custom_domain"):
+            user = await db.users.find_one({"id": website["user_id"]}, {"_id": 0, "email": 1})
+            if user:
+                self.set(website["custom_domain"], website["id"], website["user_id"], user["email"], website["slug"])
+                return
+        self.remove(website["id"])
+
+
+class CustomDomainMiddleware:
+    """Serves a mapped website for any non-API request on a custom domain."""
+
+    def __init__(self, app, domain_map: DomainMap,
+                 serve: Callable[[DomainTarget], Awaitable[Optional[str]]]):
+        self.app = app
+        self.domain_map = domain_map
+        self.serve = serve
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        target = None
+        for key, value in scope.get("headers", ()):
+            if key == b"host":
+                target = self.domain_map.resolve(value.decode("latin-1").lower())
+                break
+        if target is None:
+            await self.app(scope, receive, send)
+            return
+
+        html_content = await self.serve(target)
+        if html_content is None:
+            await self.app(scope, receive, send)
+            return
+        body = html_content.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/html; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
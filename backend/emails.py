@@ -0,0 +1,85 @@
+"""Account and inquiry emails, built as outbox messages (see outbox.py)."""
+import hashlib
+import os
+from urllib.parse import urlencode
+
+from outbox import message
+
+# Base URL of the web app; links in emails point at its pages
+APP_URL = os.environ.get('APP_URL', 'http://localhost:3000').rstrip('/')
+EMAIL_VERIFICATION_HOURS = int(os.environ.get('EMAIL_VERIFICATION_HOURS', '48'))
+PASSWORD_RESET_MINUTES = int(os.environ.get('PASSWORD_RESET_MINUTES', '60'))
+
+
+def app_link(path: str, **params) -> str:
+    return f"{APP_URL}{path}?{urlencode(params)}"
+
+
+def verification(user: dict, token: str) -> dict:
+    return message(
+        "verify_email",
+        to=user["email"],
+        subject="Confirm your email address",
+        text=(
+            f"Hi {user['name']},\n\n"
+            "Please confirm your email address by opening this link:\n\n"
+            f"{app_link('/verify-email', token=token)}\n\n"
+            f"The link expires in {EMAIL_VERIFICATION_HOURS} hours.\n"
+        ),
+        user_id=user["id"],
+        # One pending verification email per account
+        dedup_key=f"verify_email:{user['id']}",
+    )
+
+
+def password_reset(user: dict, token: str) -> dict:
+    return message(
+        "password_reset",
+        to=user["email"],
+        subject="Reset your password",
+        text=(
+            f"Hi {user['name']},\n\n"
+            "Someone asked to reset the password for your account. If it was you, "
+            "choose a new password here:\n\n"
+            f"{app_link('/reset-password', token=token)}\n\n"
+            f"The link expires in {PASSWORD_RESET_MINUTES} minutes. "
+            "If you didn't ask for this, you can ignore this email.\n"
+        ),
+        user_id=user["id"],
+        dedup_key=f"password_reset:{user['id']}",
+    )
+
+
+def password_changed(user: dict) -> dict:
+    return message(
+        "password_changed",
+        to=user["email"],
+        subject="Your password was changed",
+        text=(
+            f"Hi {user['name']},\n\n"
+            "The password for your account was just changed. If this wasn't you, "
+            "reset your password right away and contact support.\n"
+        ),
+        user_id=user["id"],
+    )
+
+
+def inquiry_notification(website: dict, inquiry: dict) -> dict:
+    fingerprint = hashlib.sha256(
+        "\0".join((inquiry["email"], inquiry["subject"], inquiry["message"])).encode("utf-8")
+    ).hexdigest()[:16]
+    return message(
+        "inquiry",
+        to=website["contact_email"],
+        subject=f"New inquiry from {inquiry['name']}: {inquiry['subject']}",
+        text=(
+            f"{inquiry['name']} <{inquiry['email']}> sent a message through "
+            f"{website['business_name']}:\n\n"
+            f"{inquiry['message']}\n\n"
+            "Reply to this email to answer them.\n"
+        ),
+        user_id=website["user_id"],
+        reply_to=inquiry["email"],
+        # Collapses double submits of the same form
+        dedup_key=f"inquiry:{website['id']}:{fingerprint}",
+    )
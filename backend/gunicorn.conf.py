@@ -0,0 +1,28 @@
+# Multi-process serving: gunicorn -c gunicorn.conf.py server:app
+#
+# Each worker imports server.py itself (no preload), so every process gets its
+# own Motor client and event loop. Run with CACHE_BACKEND=redis so cached pages
+# are shared and invalidated across workers.
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8001')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get(
+    'WEB_CONCURRENCY',
+    multiprocessing.cpu_count() * int(os.environ.get('WORKERS_PER_CORE', '1'))
+))
+preload_app = False
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.environ.get('WORKER_TIMEOUT', '60'))
+keepalive = 5
+accesslog = '-'
+
+
+def when_ready(server):
+    if workers > 1 and os.environ.get('CACHE_BACKEND', 'memory') == 'memory':
+        server.log.warning(
+            "Running %d workers with the in-process cache; pages cached by one "
+            "worker are not invalidated in the others. Set CACHE_BACKEND=redis.",
+            workers,
+        )
@@ -0,0 +1,228 @@
+"""Post-render optimization of generated site pages.
+
+Runs once per render that is cached or exported (not for previews), so its
+cost is paid once per page version rather than per request:
+
+- minify: drop comments, collapse whitespace and remove whitespace next to
+  block-level tags, where browsers ignore it anyway. A dropped comment joins
+  the text on either side, so the space around it survives as one space.
+  ``<pre>``/``<textarea>`` and inline script bodies are kept verbatim.
+- images below the fold (after the first ``</section>``, i.e. the hero) get
+  ``loading="lazy"`` and ``decoding="async"``, and every image without
+  dimensions gets ``width``/``height`` from its Tailwind size classes, so the
+  browser can reserve its box before the file arrives.
+- identical inline SVG icons used more than once become one ``<symbol>`` in
+  a hidden sprite, referenced with ``<use>``.
+- inline scripts move to the end of ``<body>``; external ones get ``defer``.
+
+The optimizer only understands the markup our templates emit (no nested
+``<svg>``, no unquoted attributes containing ``>``; quoted values may hold
+any text, user data included); it is not a general HTML minifier.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+SITE_HTML_OPTIMIZE = os.environ.get('SITE_HTML_OPTIMIZE', 'true').lower() in ('1', 'true', 'yes')
+# Rendered width assumed for "w-full" images with a fixed height (a product card
+# in the 3-column grid at the lg breakpoint); only the aspect ratio matters
+FULL_WIDTH_IMAGE_PX = int(os.environ.get('SITE_HTML_FULL_WIDTH_IMAGE_PX', '384'))
+
+# The inside of a tag: a ">" in a quoted attribute value doesn't end it
+_IN_TAG = r"""(?:[^>"']|"[^"]*"|'[^']*')"""
+_TOKEN = re.compile(
+    r"<!--.*?-->"
+    rf"|<(script|style|pre|textarea)\b{_IN_TAG}*>.*?</\1\s*>"
+    rf"|<svg\b{_IN_TAG}*>.*?</svg\s*>"
+    rf"|<{_IN_TAG}+>",
+    re.S | re.I,
+)
+_OPEN_TAG = re.compile(rf"<{_IN_TAG}*>")
+_TAG_NAME = re.compile(r"</?\s*([a-zA-Z][\w:-]*)")
+_ATTRIBUTE = re.compile(r"""([^\s=/>]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+_TAG_WHITESPACE = re.compile(r"""("[^"]*"|'[^']*')|\s+""")
+_SPACES = re.compile(r"\s+")
+_SVG = re.compile(rf"<svg\b({_IN_TAG}*)>(.*?)</svg\s*>", re.S | re.I)
+_TAILWIND_SIZE = re.compile(r"(?:^|\s)(w|h|size)-(\d+(?:\.5)?)(?=\s|$)")
+
+# Whitespace touching these tags never renders (outside white-space: pre)
+_BLOCK_TAGS = frozenset("""
+    !doctype html head body title meta link script style base noscript template
+    div section nav header footer main article aside address blockquote figure figcaption
+    h1 h2 h3 h4 h5 h6 p hr ul ol li dl dt dd table thead tbody tfoot tr td th caption
+    form fieldset legend option optgroup details summary dialog
+""".split())
+_JS_TYPES = {"", "text/javascript", "application/javascript", "module"}
+
+
+def _tag_name(tag: str) -> str:
+    if tag.startswith("<!"):
+        return "!doctype" if tag[2:9].lower() == "doctype" else "!"
+    match = _TAG_NAME.match(tag)
+    return match.group(1).lower() if match else ""
+
+
+def _attributes(tag: str) -> Dict[str, Optional[str]]:
+    body = tag[1 + len(_TAG_NAME.match(tag).group(1)):].rstrip(">").rstrip("/")
+    attributes = {}
+    for name, value in _ATTRIBUTE.findall(body):
+        attributes[name.lower()] = value.strip("\"'") if value else None
+    return attributes
+
+
+def _add_attributes(tag: str, additions: Dict[str, str]) -> str:
+    extra = "".join(f' {name}="{value}"' for name, value in additions.items())
+    if tag.endswith("/>"):
+        return tag[:-2].rstrip() + extra + "/>"
+    return tag[:-1] + extra + ">"
+
+
+def _minify_tag(tag: str) -> str:
+    tag = _TAG_WHITESPACE.sub(lambda m: m.group(1) or " ", tag)
+    # Only the tag's own closing bracket; quoted values keep their spaces
+    if tag.endswith(" >"):
+        return tag[:-2] + ">"
+    if tag.endswith(" />"):
+        return tag[:-3] + "/>"
+    return tag
+
+
+def _tailwind_dimensions(classes: str) -> Tuple[Optional[int], Optional[int]]:
+    width = height = None
+    for axis, value in _TAILWIND_SIZE.findall(classes):
+        pixels = int(float(value) * 4)
+        if axis in ("w", "size"):
+            width = pixels
+        if axis in ("h", "size"):
+            height = pixels
+    if width is None and height is not None and re.search(r"(?:^|\s)w-full(?:\s|$)", classes):
+        width = FULL_WIDTH_IMAGE_PX
+    return width, height
+
+
+def _svg_key(match) -> Tuple[str, str]:
+    view_box = _attributes(f"<svg{match.group(1)}>").get("viewbox") or ""
+    return view_box, _SPACES.sub(" ", match.group(2)).strip()
+
+
+def _sprite(html: str) -> Dict[Tuple[str, str], str]:
+    """Symbol ids for SVGs that occur more than once."""
+    counts: Dict[Tuple[str, str], int] = {}
+    for match in _SVG.finditer(html):
+        key = _svg_key(match)
+        counts[key] = counts.get(key, 0) + 1
+    repeated = [key for key, count in counts.items() if count > 1 and key[1]]
+    return {key: f"icon-{index}" for index, key in enumerate(repeated)}
+
+
+def optimize_html(html: str, minify: bool = True, lazy_images: bool = True,
+                  svg_sprite: bool = True, move_scripts: bool = True) -> str:
+    symbols = _sprite(html) if svg_sprite else {}
+    out: List[str] = []
+    moved_scripts: List[str] = []
+    below_fold = False
+    # Whether the last tag was block-level, so whitespace after it can go
+    previous_block = True
+
+    def emit_text(text: str, next_block: bool):
+        if not minify:
+            out.append(text)
+            return
+        text = _SPACES.sub(" ", text)
+        if previous_block:
+            text = text.lstrip(" ")
+        if next_block:
+            text = text.rstrip(" ")
+        if text:
+            out.append(text)
+
+    position = 0
+    # Text before a dropped comment, held back to join the text after it
+    pending = ""
+    for match in _TOKEN.finditer(html):
+        token = match.group(0)
+        name = _tag_name(token) if not token.startswith("<!--") else "!--"
+        is_block = name in _BLOCK_TAGS or name == "!--"
+        text = pending + html[position:match.start()]
+        position = match.end()
+        if name == "!--" and minify and not token.startswith("<!--[if"):
+            pending = text
+            continue
+        pending = ""
+        if text:
+            emit_text(text, is_block)
+
+        if name == "!--":
+            out.append(token)
+        elif name == "script":
+            attributes = _attributes(token)
+            open_tag_end = _OPEN_TAG.match(token).end()
+            open_tag = token[:open_tag_end]
+            if "src" in attributes:
+                if "defer" not in attributes and "async" not in attributes and attributes.get("type") != "module":
+                    open_tag = open_tag[:-1] + " defer>"
+                token = open_tag + token[open_tag_end:]
+                out.append(_minify_tag(token) if minify else token)
+            elif (attributes.get("type") or "").lower() in _JS_TYPES:
+                # The body is left alone: template literals and regexes make line-based minifying unsafe
+                script = (_minify_tag(open_tag) + token[open_tag_end:]) if minify else token
+                if move_scripts:
+                    moved_scripts.append(script)
+                else:
+                    out.append(script)
+            else:
+                out.append(token)
+        elif name == "style" and minify:
+            open_tag_end = _OPEN_TAG.match(token).end()
+            body = token[open_tag_end:token.lower().rindex("</style")]
+            out.append(_minify_tag(token[:open_tag_end]) + _SPACES.sub(" ", body).strip() + "</style>")
+        elif name in ("pre", "textarea"):
+            out.append(token)
+        elif name == "svg":
+            svg = _SVG.match(token)
+            symbol = symbols.get(_svg_key(svg)) if svg else None
+            if symbol is not None:
+                token = f'<svg{svg.group(1)}><use href="#{symbol}"/></svg>'
+            out.append(_SPACES.sub(" ", token).replace("> <", "><") if minify else token)
+        elif name == "img":
+            attributes = _attributes(token)
+            additions = {}
+            if lazy_images and below_fold and "loading" not in attributes:
+                additions["loading"] = "lazy"
+            if lazy_images and below_fold and "decoding" not in attributes:
+                additions["decoding"] = "async"
+            if "width" not in attributes and "height" not in attributes:
+                width, height = _tailwind_dimensions(attributes.get("class") or "")
+                if width and height:
+                    additions.update(width=str(width), height=str(height))
+            token = _add_attributes(token, additions) if additions else token
+            out.append(_minify_tag(token) if minify else token)
+        elif name == "body" and not token.startswith("</"):
+            out.append(_minify_tag(token) if minify else token)
+            if symbols:
+                out.append(_sprite_markup(symbols))
+        elif name == "body" and moved_scripts:
+            out.extend(moved_scripts)
+            moved_scripts = []
+            out.append(token)
+        else:
+            if token.lower().startswith("</section"):
+                below_fold = True
+            out.append(_minify_tag(token) if minify else token)
+        previous_block = is_block
+
+    if pending or position < len(html):
+        emit_text(pending + html[position:], True)
+    out.extend(moved_scripts)
+    return "".join(out)
+
+
+def _sprite_markup(symbols: Dict[Tuple[str, str], str]) -> str:
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" style="display:none">'
+        + "".join(
+            f'<symbol id="{symbol}"' + (f' viewBox="{view_box}"' if view_box else "") + f">{inner.replace('> <', '><')}</symbol>"
+            for (view_box, inner), symbol in symbols.items()
+        )
+        + "</svg>"
+    )
@@ -0,0 +1,284 @@
+"""Persistent background job queue.
+
+Jobs are stored in the ``jobs`` collection and executed by a pool of asyncio
+workers inside each API process, so heavy work (re-rendering, exports, ...)
+never runs inside a request handler. Jobs have priorities, are retried with
+exponential backoff, and at most one queued-or-running job exists per
+(website_id, type) thanks to a unique partial index on ``dedup_key``.
+Enqueueing while the job is already running marks it ``rerun`` instead, since
+it may have read the data before the change; the worker queues it again when
+it finishes. Workers claim jobs with an expiring lease; jobs held by a crashed process are
+requeued once their lease runs out, or failed if that was their last attempt.
+"""
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2.0'))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+JOB_BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', '5'))
+JOB_BACKOFF_MAX = float(os.environ.get('JOB_BACKOFF_MAX', '600'))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Job priorities; higher runs first
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+JOB_PROJECTION = {"_id": 0, "locked_by": 0, "lease_until": 0, "dedup_key": 0, "active": 0, "rerun": 0}
+
+
+class PermanentJobError(Exception):
+    """Raised by handlers for failures that retrying can't fix."""
+
+
+class JobContext:
+    """Passed to handlers so long-running jobs can report progress."""
+
+    def __init__(self, queue: "JobQueue", job: dict):
+        self.queue = queue
+        self.job = job
+
+    async def progress(self, done: int, total: Optional[int] = None, **details):
+        await self.queue.db.jobs.update_one(
+            {"id": self.job["id"], "locked_by": self.queue.worker_id},
+            {"$set": {
+                "progress": {"done": done, "total": total, **details},
+                "lease_until": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+                "updated_at": datetime.utcnow(),
+            }},
+        )
+
+
+JobHandler = Callable[[dict, JobContext], Awaitable[Any]]
+
+
+class JobQueue:
+    def __init__(self, db, workers: int = JOB_WORKERS):
+        self.db = db
+        self.workers = workers
+        self.worker_id = uuid.uuid4().hex
+        self.handlers: Dict[str, JobHandler] = {}
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    def register(self, job_type: str, handler: JobHandler):
+        self.handlers[job_type] = handler
+
+    async def ensure_indexes(self):
+        await self.db.jobs.create_index("id", unique=True)
+        await self.db.jobs.create_index(
+            "dedup_key", unique=True, partialFilterExpression={"active": True}
+        )
+        await self.db.jobs.create_index(
+            [("status", ASCENDING), ("priority", DESCENDING), ("run_at", ASCENDING)]
+        )
+        await self.db.jobs.create_index([("website_id", ASCENDING), ("created_at", DESCENDING)])
+
+    async def enqueue(self, job_type: str, website_id: Optional[str] = None,
+                      user_id: Optional[str] = None, payload: Optional[dict] = None,
+                      priority: int = PRIORITY_NORMAL, max_attempts: int = JOB_MAX_ATTEMPTS,
+                      delay: float = 0, rerun: bool = True) -> dict:
+        """Queue a job, or return the already active job for the same website and type.
+
+        With ``rerun=False`` a job already running is returned as is, for jobs
+        whose payload is consumed by the run (a rerun would repeat the old
+        payload rather than pick up the caller's).
+        """
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "website_id": website_id,
+            "user_id": user_id,
+            "payload": payload or {},
+            "priority": priority,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+            "updated_at": now,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "dedup_key": f"{website_id or user_id or uuid.uuid4()}:{job_type}",
+            "active": True,
+        }
+        while True:
+            try:
+                await self.db.jobs.insert_one(job)
+                break
+            except DuplicateKeyError:
+                existing = await self.db.jobs.find_one(
+                    {"dedup_key": job["dedup_key"], "active": True}, JOB_PROJECTION
+                )
+            if existing is None:
+                continue
+            if existing["status"] == RUNNING and rerun:
+                # The run in progress may predate this request; have it run once more
+                marked = await self.db.jobs.update_one(
+                    {"id": existing["id"], "status": RUNNING}, {"$set": {"rerun": True}}
+                )
+                if not marked.matched_count:
+                    continue  # it just finished; queue a fresh job
+            elif existing["status"] == QUEUED and priority > existing["priority"]:
+                # A more urgent request bumps the queued job's priority
+                await self.db.jobs.update_one(
+                    {"id": existing["id"], "status": QUEUED}, {"$set": {"priority": priority}}
+                )
+                existing["priority"] = priority
+            return existing
+        self._wakeup.set()
+        return {k: v for k, v in job.items() if k not in JOB_PROJECTION}
+
+    async def get(self, job_id: str, **filters) -> Optional[dict]:
+        return await self.db.jobs.find_one({"id": job_id, **filters}, JOB_PROJECTION)
+
+    async def list_for_website(self, website_id: str, limit: int = 20):
+        return await self.db.jobs.find({"website_id": website_id}, JOB_PROJECTION) \
+            .sort("created_at", DESCENDING).to_list(limit)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Hand unfinished jobs back to the queue for the next process
+        await self.db.jobs.update_many(
+            {"status": RUNNING, "locked_by": self.worker_id},
+            {"$set": {"status": QUEUED, "run_at": datetime.utcnow(), "locked_by": None}},
+        )
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.db.jobs.find_one_and_update(
+            {"status": QUEUED, "run_at": {"$lte": now}},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "locked_by": self.worker_id,
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "started_at": now,
+                    "updated_at": now,
+                    "rerun": False,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to claim a job")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: dict):
+        handler = self.handlers.get(job["type"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job type {job['type']!r}")
+            result = await handler(job, JobContext(self, job))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job["id"], job["type"])
+            await self._fail(job, f"{type(e).__name__}: {e}", retry=not isinstance(e, PermanentJobError))
+            return
+        await self._finish(job, {
+            "status": SUCCEEDED,
+            "active": False,
+            "result": result,
+            "error": None,
+            "finished_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+        })
+
+    async def _finish(self, job: dict, update: dict):
+        finished = await self.db.jobs.find_one_and_update(
+            {"id": job["id"], "locked_by": self.worker_id}, {"$set": update},
+            return_document=ReturnDocument.AFTER,
+        )
+        if finished is not None and not finished["active"] and finished.get("rerun"):
+            await self.enqueue(
+                job["type"], job["website_id"], job["user_id"], job["payload"],
+                job["priority"], job["max_attempts"],
+            )
+
+    async def _fail(self, job: dict, error: str, retry: bool = True):
+        now = datetime.utcnow()
+        if retry and job["attempts"] < job["max_attempts"]:
+            backoff = min(JOB_BACKOFF_BASE * 2 ** (job["attempts"] - 1), JOB_BACKOFF_MAX)
+            update = {
+                "status": QUEUED,
+                "run_at": now + timedelta(seconds=backoff * random.uniform(0.8, 1.2)),
+                "locked_by": None,
+            }
+        else:
+            update = {"status": FAILED, "active": False, "finished_at": now}
+        update.update({"error": error, "updated_at": now})
+        await self._finish(job, update)
+
+    async def requeue_expired(self) -> int:
+        """Requeue jobs whose worker died; those on their last attempt are failed instead."""
+        now = datetime.utcnow()
+        expired = {"status": RUNNING, "lease_until": {"$lt": now}}
+        failed = await self.db.jobs.update_many(
+            {**expired, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"status": FAILED, "active": False, "finished_at": now, "locked_by": None,
+                      "error": "Lease expired on the last attempt", "updated_at": now}},
+        )
+        if failed.modified_count:
+            logger.warning("Failed %d jobs whose lease expired on the last attempt", failed.modified_count)
+        result = await self.db.jobs.update_many(
+            expired, {"$set": {"status": QUEUED, "run_at": now, "locked_by": None, "updated_at": now}},
+        )
+        return result.modified_count
+
+    async def _reaper(self):
+        while True:
+            try:
+                requeued = await self.requeue_expired()
+                if requeued:
+                    logger.warning("Requeued %d jobs with expired leases", requeued)
+                    self._wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to requeue expired jobs")
+            await asyncio.sleep(JOB_LEASE_SECONDS / 4)
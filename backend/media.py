@@ -0,0 +1,257 @@
+"""Streaming multipart uploads for website media.
+
+Request bodies are fed to python-multipart's push parser chunk by chunk, and
+each file part is written to a staging file as it arrives, then committed to
+the storage backend. Peak memory per upload is bounded by the chunk size, and
+size limits are enforced from the Content-Length header and while streaming,
+before the whole body is read. Image types are taken from each file's leading
+bytes, not from the type the client declares.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from fastapi import HTTPException, Request, status
+
+from storage import StorageBackend, media_key
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_FILE_BYTES = int(os.environ.get('MAX_UPLOAD_FILE_BYTES', str(10 * 1024 * 1024)))
+MAX_UPLOAD_FILES = int(os.environ.get('MAX_UPLOAD_FILES', '20'))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(64 * 1024)))
+
+# No SVG: it can carry scripts, and media is served from the API's origin
+ALLOWED_CONTENT_TYPES = {
+    "image/jpeg", "image/png", "image/gif", "image/webp", "image/avif",
+}
+# Bytes needed to recognize every allowed type
+SNIFF_BYTES = 12
+
+
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Content type of an image from its first SNIFF_BYTES bytes, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return None
+
+
+class UploadPolicy(NamedTuple):
+    """What an upload endpoint accepts and where its files are stored."""
+    allowed_types: Set[str]
+    max_file_bytes: int
+    max_files: int
+    key: Callable[[str, str], str]
+    # Detects the real type from a file's leading bytes; None trusts the declared type
+    sniff: Optional[Callable[[bytes], Optional[str]]] = None
+
+
+MEDIA_UPLOADS = UploadPolicy(
+    ALLOWED_CONTENT_TYPES, MAX_UPLOAD_FILE_BYTES, MAX_UPLOAD_FILES, media_key, sniff_image_type,
+)
+
+
+def media_url(storage: StorageBackend, user_id: str, media_id: str) -> str:
+    """URL emitted in rendered pages; the API only serves media when the store can't."""
+    return storage.url(media_key(user_id, media_id)) or f"/api/media/{media_id}"
+
+
+class _FilePart:
+    def __init__(self, storage: StorageBackend, key: str, media_id: str, filename: str, content_type: str):
+        self.id = media_id
+        self.key = key
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.head = b""
+        self.sniffed = False
+        self.sha256 = hashlib.sha256()
+        self.path = storage.staging_path(self.key)
+        self.file = open(self.path, "wb")
+
+
+class _UploadParser:
+    """Collects parser callbacks; data is buffered only until the next flush."""
+
+    def __init__(self, storage: StorageBackend, user_id: str, boundary: bytes, policy: UploadPolicy):
+        self.storage = storage
+        self.user_id = user_id
+        self.policy = policy
+        self.parts: List[_FilePart] = []
+        self.pending: List[tuple] = []
+        self.current: Optional[_FilePart] = None
+        self.error: Optional[HTTPException] = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._field = self._value = b""
+
+    def _on_header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _on_headers_finished(self):
+        self.current = None
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename is None:
+            return  # plain form fields are ignored
+        content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+        if content_type not in self.policy.allowed_types:
+            self._fail(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f"Unsupported media type: {content_type}")
+            return
+        if len(self.parts) >= self.policy.max_files:
+            self._fail(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Too many files in one upload")
+            return
+        media_id = str(uuid.uuid4())
+        self.current = _FilePart(
+            self.storage, self.policy.key(self.user_id, media_id), media_id,
+            filename.decode("utf-8", "replace"), content_type,
+        )
+        self.parts.append(self.current)
+
+    def _on_part_data(self, data, start, end):
+        part = self.current
+        if part is None or self.error is not None:
+            return
+        part.size += end - start
+        if part.size > self.policy.max_file_bytes:
+            self._fail(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "File exceeds the upload size limit")
+            return
+        chunk = bytes(data[start:end])
+        if not part.sniffed:
+            part.head += chunk[:SNIFF_BYTES - len(part.head)]
+            if len(part.head) >= SNIFF_BYTES:
+                self._sniff(part)
+                if self.error is not None:
+                    return
+        part.sha256.update(chunk)
+        self.pending.append((part, chunk))
+
+    def _on_part_end(self):
+        if self.current is not None and not self.current.sniffed:
+            self._sniff(self.current)
+        self.current = None
+
+    def _sniff(self, part: _FilePart):
+        part.sniffed = True
+        if self.policy.sniff is None:
+            return
+        content_type = self.policy.sniff(part.head)
+        if content_type not in self.policy.allowed_types:
+            self._fail(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f"File content is not a supported type: {part.filename}")
+            return
+        part.content_type = content_type
+
+    def _fail(self, status_code: int, detail: str):
+        if self.error is None:
+            self.error = HTTPException(status_code=status_code, detail=detail)
+        self.current = None
+
+    def flush(self):
+        for part, chunk in self.pending:
+            part.file.write(chunk)
+        self.pending = []
+
+    def close(self, discard: bool):
+        for part in self.parts:
+            part.file.close()
+            if discard:
+                part.path.unlink(missing_ok=True)
+
+
+async def receive_uploads(request: Request, user_id: str, storage: StorageBackend,
+                          policy: UploadPolicy = MEDIA_UPLOADS) -> List[dict]:
+    """Stream every file part of a multipart request to the storage backend.
+
+    Returns media documents (not yet persisted) for the stored files, which
+    are stored under ``policy.key(user_id, id)``.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected multipart/form-data")
+
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Content-Length")
+    if content_length > policy.max_file_bytes * policy.max_files:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload too large")
+
+    upload = _UploadParser(storage, user_id, boundary, policy)
+    try:
+        buffer = bytearray()
+        async for data in request.stream():
+            buffer += data
+            while len(buffer) >= UPLOAD_CHUNK_SIZE:
+                chunk, buffer = bytes(buffer[:UPLOAD_CHUNK_SIZE]), buffer[UPLOAD_CHUNK_SIZE:]
+                upload.parser.write(chunk)
+                if upload.error is not None:
+                    raise upload.error
+                await asyncio.to_thread(upload.flush)
+        if buffer:
+            upload.parser.write(bytes(buffer))
+            if upload.error is not None:
+                raise upload.error
+            await asyncio.to_thread(upload.flush)
+        upload.parser.finalize()
+        if upload.error is not None:
+            raise upload.error
+        upload.close(discard=False)
+        await asyncio.gather(*(
+            storage.commit(part.key, part.path, part.content_type, MEDIA_CACHE_CONTROL)
+            for part in upload.parts
+        ))
+    except BaseException:
+        upload.close(discard=True)
+        raise
+
+    now = datetime.utcnow()
+    return [
+        {
+            "id": part.id,
+            "user_id": user_id,
+            "filename": part.filename,
+            "content_type": part.content_type,
+            "size": part.size,
+            "sha256": part.sha256.hexdigest(),
+            "created_at": now,
+        }
+        for part in upload.parts
+    ]
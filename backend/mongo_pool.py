@@ -0,0 +1,173 @@
+"""Motor connection pool settings and pool metrics.
+
+All pool, compression and read-preference options come from the environment
+so they can be tuned per deployment without code changes. Pool activity is
+recorded by a pymongo ``ConnectionPoolListener`` and exposed as a snapshot.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+from pymongo.read_preferences import ReadPreference
+
+_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# Upper bounds (ms) of the checkout wait histogram buckets
+_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def read_preference(name: Optional[str]):
+    if not name:
+        return None
+    if name not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    return _READ_PREFERENCES[name]
+
+
+def client_options(listener: Optional["PoolMetricsListener"] = None) -> Dict[str, Any]:
+    """Build AsyncIOMotorClient keyword arguments from MONGO_* settings."""
+    options: Dict[str, Any] = {}
+    for option, env in (
+        ("maxPoolSize", "MONGO_MAX_POOL_SIZE"),
+        ("minPoolSize", "MONGO_MIN_POOL_SIZE"),
+        ("maxIdleTimeMS", "MONGO_MAX_IDLE_TIME_MS"),
+        ("maxConnecting", "MONGO_MAX_CONNECTING"),
+        ("waitQueueTimeoutMS", "MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        ("serverSelectionTimeoutMS", "MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        ("connectTimeoutMS", "MONGO_CONNECT_TIMEOUT_MS"),
+    ):
+        value = _int_env(env)
+        if value is not None:
+            options[option] = value
+
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+    compressors = os.environ.get('MONGO_COMPRESSORS')
+    if compressors:
+        options["compressors"] = compressors
+        zlib_level = _int_env('MONGO_ZLIB_COMPRESSION_LEVEL')
+        if zlib_level is not None:
+            options["zlibCompressionLevel"] = zlib_level
+
+    default_read_preference = read_preference(os.environ.get('MONGO_READ_PREFERENCE'))
+    if default_read_preference is not None:
+        options["read_preference"] = default_read_preference
+
+    if listener is not None:
+        options["event_listeners"] = [listener]
+    return options
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection counts and checkout wait times per server address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, Dict[str, Any]] = {}
+        self._checkout_started: Dict[int, float] = {}
+
+    def _pool(self, address) -> Dict[str, Any]:
+        key = "%s:%s" % address
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "open_connections": 0,
+                "checked_out": 0,
+                "checkouts": 0,
+                "checkout_failures": 0,
+                "wait_queue_timeouts": 0,
+                "pool_cleared": 0,
+                "wait_ms_total": 0.0,
+                "wait_ms_max": 0.0,
+                "wait_ms_buckets": [0] * (len(_WAIT_BUCKETS_MS) + 1),
+            }
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)["pool_cleared"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)["open_connections"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._pool(event.address)["open_connections"] -= 1
+
+    # Checkouts happen synchronously on the calling thread, so the thread id pairs
+    # each "started" event with its matching "checked out" or "failed" event.
+    def connection_check_out_started(self, event):
+        self._checkout_started[threading.get_ident()] = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._checkout_started.pop(threading.get_ident(), None)
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkout_failures"] += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                pool["wait_queue_timeouts"] += 1
+
+    def connection_checked_out(self, event):
+        started = self._checkout_started.pop(threading.get_ident(), None)
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checked_out"] += 1
+            pool["checkouts"] += 1
+            if started is not None:
+                wait_ms = (time.perf_counter() - started) * 1000
+                pool["wait_ms_total"] += wait_ms
+                pool["wait_ms_max"] = max(pool["wait_ms_max"], wait_ms)
+                for i, bound in enumerate(_WAIT_BUCKETS_MS):
+                    if wait_ms <= bound:
+                        pool["wait_ms_buckets"][i] += 1
+                        break
+                else:
+                    pool["wait_ms_buckets"][-1] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event.address)["checked_out"] -= 1
+
+    def snapshot(self, max_pool_size: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            pools = {}
+            for address, pool in self._pools.items():
+                stats = dict(pool)
+                stats["wait_ms_buckets"] = {
+                    **{f"le_{bound}": count for bound, count
+                       in zip(_WAIT_BUCKETS_MS, pool["wait_ms_buckets"])},
+                    "le_inf": pool["wait_ms_buckets"][-1],
+                }
+                stats["wait_ms_avg"] = (
+                    pool["wait_ms_total"] / pool["checkouts"] if pool["checkouts"] else 0.0
+                )
+                if max_pool_size:
+                    stats["saturation"] = pool["checked_out"] / max_pool_size
+                pools[address] = stats
+        return {"max_pool_size": max_pool_size, "pools": pools}
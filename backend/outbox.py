@@ -0,0 +1,472 @@
+"""Transactional outbox for outgoing email.
+
+Routes never talk to SMTP. They add messages to the ``outbox`` collection of
+the shard holding the change that triggered them (a new user, an inquiry, ...)
+inside the same transaction, so a message exists if and only if its change was
+committed. ``OutboxDispatcher`` then claims pending messages in batches and
+sends them over a small pool of persistent SMTP connections.
+
+Delivery is at-least-once: a worker that dies between the SMTP server
+accepting a message and recording it as sent leaves it to be retried once its
+lease expires. Every attempt carries the same Message-ID, derived from the
+outbox id, so receivers can drop the repeat. Messages may carry a
+``dedup_key``; at most one message per key is pending at a time, which
+collapses repeated requests (e.g. password resets) into one email.
+
+Transactions need a replica set. On a standalone server the change is written
+first and its messages right after it, without atomicity between the two.
+"""
+import abc
+import asyncio
+import logging
+import os
+import queue
+import random
+import smtplib
+import ssl
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime, parseaddr
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.environ.get('SMTP_HOST', '')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+# "starttls", "ssl" (implicit TLS, usually port 465) or "none"
+SMTP_SECURITY = os.environ.get('SMTP_SECURITY', 'starttls')
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '10'))
+SMTP_CONNECTIONS = int(os.environ.get('SMTP_CONNECTIONS', '2'))
+# Pooled connections idle longer than this are closed instead of reused
+SMTP_IDLE_SECONDS = float(os.environ.get('SMTP_IDLE_SECONDS', '30'))
+MAIL_FROM = os.environ.get('MAIL_FROM', 'WebCraft <no-reply@localhost>')
+
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', '120'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', '30'))
+OUTBOX_BACKOFF_MAX = float(os.environ.get('OUTBOX_BACKOFF_MAX', '3600'))
+# Sent and failed messages are removed by a TTL index after this long
+OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', '7'))
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def message(kind: str, to: str, subject: str, text: str, user_id: Optional[str] = None,
+            dedup_key: Optional[str] = None, html: Optional[str] = None,
+            reply_to: Optional[str] = None) -> dict:
+    """An outbox document, ready for ``Outbox.write``."""
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "user_id": user_id,
+        "to": to,
+        "reply_to": reply_to,
+        "subject": subject,
+        "text": text,
+        "html": html,
+        "status": PENDING,
+        "attempts": 0,
+        "max_attempts": OUTBOX_MAX_ATTEMPTS,
+        "run_at": now,
+        "created_at": now,
+        "updated_at": now,
+        "error": None,
+        "dedup_key": dedup_key or None,
+        "active": True,
+    }
+
+
+def _is_dedup_conflict(error: DuplicateKeyError) -> bool:
+    details = error.details or {}
+    return "dedup_key" in (details.get("keyPattern") or details.get("keyValue") or {}) \
+        or "dedup_key" in str(error)
+
+
+def _transactions_unsupported(error: Exception) -> bool:
+    # IllegalOperation: "Transaction numbers are only allowed on a replica set member or mongos"
+    return isinstance(error, OperationFailure) and error.code == 20
+
+
+class Outbox:
+    """The ``outbox`` collection of one shard database."""
+
+    def __init__(self, db, transactions: Optional[bool] = None):
+        self.db = db
+        # Whether the server supports transactions; None until the first write finds out
+        self.transactions = transactions
+
+    async def ensure_indexes(self):
+        await self.db.outbox.create_index("id", unique=True)
+        await self.db.outbox.create_index(
+            "dedup_key", unique=True,
+            partialFilterExpression={"active": True, "dedup_key": {"$type": "string"}},
+        )
+        await self.db.outbox.create_index([("status", ASCENDING), ("run_at", ASCENDING)])
+        await self.db.outbox.create_index("locked_by")
+        await self.db.outbox.create_index(
+            "finished_at", expireAfterSeconds=OUTBOX_RETENTION_DAYS * 86400
+        )
+
+    async def write(self, messages: List[dict],
+                    change: Optional[Callable[[Optional[object]], Awaitable]] = None) -> bool:
+        """Store ``messages``, atomically with ``change(session)`` when given.
+
+        ``change`` must pass the session to every write it makes. Returns False,
+        without writing anything, when a message's ``dedup_key`` is already
+        pending (without transactions ``change`` has been applied by then).
+        """
+        if self.transactions is not False:
+            try:
+                await self._write_in_transaction(messages, change)
+                self.transactions = True
+                return True
+            except DuplicateKeyError as e:
+                if _is_dedup_conflict(e):
+                    return False
+                raise
+            except Exception as e:
+                if self.transactions or not _transactions_unsupported(e):
+                    raise
+                logger.warning("MongoDB transactions unavailable; outbox writes are not atomic")
+                self.transactions = False
+
+        if change is not None:
+            await change(None)
+        written = True
+        for doc in messages:
+            try:
+                await self.db.outbox.insert_one(doc)
+            except DuplicateKeyError as e:
+                if not _is_dedup_conflict(e):
+                    raise
+                written = False
+        return written
+
+    async def _write_in_transaction(self, messages, change):
+        async def callback(session):
+            if change is not None:
+                await change(session)
+            for doc in messages:
+                # Copies: a retried transaction must not reuse the _id of an aborted insert
+                await self.db.outbox.insert_one(dict(doc), session=session)
+
+        async with await self.db.client.start_session() as session:
+            await session.with_transaction(callback)
+
+    async def claim(self, worker_id: str, limit: int) -> List[dict]:
+        """Lease up to ``limit`` due messages to this worker."""
+        now = datetime.utcnow()
+        candidates = await self.db.outbox.find(
+            {"status": PENDING, "run_at": {"$lte": now}}, {"_id": 0, "id": 1}
+        ).sort("run_at", ASCENDING).limit(limit).to_list(None)
+        if not candidates:
+            return []
+        claim_id = f"{worker_id}:{uuid.uuid4().hex}"
+        await self.db.outbox.update_many(
+            {"id": {"$in": [doc["id"] for doc in candidates]}, "status": PENDING},
+            {
+                "$set": {
+                    "status": SENDING,
+                    "locked_by": claim_id,
+                    "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+        )
+        # Another worker may have claimed some of them in between
+        return await self.db.outbox.find({"locked_by": claim_id}).to_list(None)
+
+    async def complete(self, claimed: List[dict], errors: List[Optional[Exception]]):
+        """Record the outcome of sending each claimed message."""
+        now = datetime.utcnow()
+        updates = []
+        for doc, error in zip(claimed, errors):
+            if error is None:
+                update = {"status": SENT, "active": False, "error": None, "finished_at": now}
+            elif is_permanent(error) or doc["attempts"] >= doc["max_attempts"]:
+                update = {"status": FAILED, "active": False, "finished_at": now}
+            else:
+                backoff = min(OUTBOX_BACKOFF_BASE * 2 ** (doc["attempts"] - 1), OUTBOX_BACKOFF_MAX)
+                update = {
+                    "status": PENDING,
+                    "run_at": now + timedelta(seconds=backoff * random.uniform(0.8, 1.2)),
+                }
+            if error is not None:
+                update["error"] = f"{type(error).__name__}: {error}"
+            update.update({"locked_by": None, "updated_at": now})
+            updates.append(UpdateOne({"id": doc["id"], "locked_by": doc["locked_by"]}, {"$set": update}))
+        if updates:
+            await self.db.outbox.bulk_write(updates, ordered=False)
+
+    async def requeue_expired(self) -> int:
+        """Release messages whose sender died; those out of attempts are failed instead."""
+        now = datetime.utcnow()
+        expired = {"status": SENDING, "lease_until": {"$lt": now}}
+        await self.db.outbox.update_many(
+            {**expired, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"status": FAILED, "active": False, "finished_at": now, "locked_by": None,
+                      "error": "Lease expired on the last attempt", "updated_at": now}},
+        )
+        result = await self.db.outbox.update_many(
+            expired, {"$set": {"status": PENDING, "run_at": now, "locked_by": None, "updated_at": now}},
+        )
+        return result.modified_count
+
+
+def is_permanent(error: Exception) -> bool:
+    """SMTP 5xx replies won't succeed on retry; everything else might."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return isinstance(error, ValueError)
+
+
+def build_email(doc: dict, sender: str = MAIL_FROM) -> EmailMessage:
+    email = EmailMessage()
+    email["From"] = sender
+    email["To"] = doc["to"]
+    if doc.get("reply_to"):
+        email["Reply-To"] = doc["reply_to"]
+    email["Subject"] = doc["subject"]
+    email["Date"] = format_datetime(doc["created_at"])
+    domain = parseaddr(sender)[1].rpartition("@")[2] or "localhost"
+    # Stable across retries so a repeated delivery can be recognised
+    email["Message-ID"] = f"<{doc['id']}@{domain}>"
+    email.set_content(doc["text"])
+    if doc.get("html"):
+        email.add_alternative(doc["html"], subtype="html")
+    return email
+
+
+class MailTransport(abc.ABC):
+    @abc.abstractmethod
+    async def send_many(self, emails: List[EmailMessage]) -> List[Optional[Exception]]:
+        """Send each email; the result has None or the error for each, in order."""
+
+    async def close(self):
+        pass
+
+
+class LoggingTransport(MailTransport):
+    """Used when SMTP_HOST is unset (development): logs instead of sending."""
+
+    async def send_many(self, emails):
+        for email in emails:
+            logger.info("Email to %s: %s\n%s", email["To"], email["Subject"], email.get_body().get_content())
+        return [None] * len(emails)
+
+
+class SMTPTransport(MailTransport):
+    """Sends over up to ``connections`` persistent SMTP connections.
+
+    smtplib is blocking, so each connection works in a thread; a batch is
+    split across the pool and every connection sends its share back to back
+    without reconnecting or repeating the handshake.
+    """
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, username: str = SMTP_USERNAME,
+                 password: str = SMTP_PASSWORD, security: str = SMTP_SECURITY,
+                 timeout: float = SMTP_TIMEOUT, connections: int = SMTP_CONNECTIONS,
+                 idle_seconds: float = SMTP_IDLE_SECONDS):
+        if security not in ("starttls", "ssl", "none"):
+            raise ValueError(f"Unknown SMTP_SECURITY: {security}")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.timeout = timeout
+        self.connections = max(1, connections)
+        self.idle_seconds = idle_seconds
+        # (connection, last used) pairs not currently checked out
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self.connects = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+        if self.username:
+            smtp.login(self.username, self.password)
+        self.connects += 1
+        return smtp
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            try:
+                smtp, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < self.idle_seconds:
+                return smtp
+            self._quit(smtp)
+
+    @staticmethod
+    def _quit(smtp: smtplib.SMTP):
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _send_chunk(self, emails: List[EmailMessage]) -> List[Optional[Exception]]:
+        results: List[Optional[Exception]] = []
+        smtp = None
+        for email in emails:
+            # A pooled connection may have been dropped by the server; reconnect once
+            for attempt in (1, 2):
+                try:
+                    if smtp is None:
+                        smtp = self._checkout()
+                    smtp.send_message(email)
+                    results.append(None)
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    smtp = None
+                    if attempt == 2:
+                        results.append(e)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                        smtplib.SMTPDataError, ValueError) as e:
+                    # smtplib resets the transaction; the connection stays usable
+                    results.append(e)
+                    break
+                except Exception as e:
+                    if smtp is not None:
+                        smtp.close()
+                        smtp = None
+                    results.append(e)
+                    break
+        if smtp is not None:
+            self._idle.put((smtp, time.monotonic()))
+        return results
+
+    async def send_many(self, emails):
+        if not emails:
+            return []
+        chunks = [emails[i::self.connections] for i in range(min(self.connections, len(emails)))]
+        chunk_results = await asyncio.gather(*(asyncio.to_thread(self._send_chunk, chunk) for chunk in chunks))
+        # Undo the round-robin split
+        results: List[Optional[Exception]] = [None] * len(emails)
+        for offset, chunk_result in enumerate(chunk_results):
+            results[offset::len(chunks)] = chunk_result
+        return results
+
+    async def close(self):
+        def close_all():
+            while True:
+                try:
+                    smtp, _ = self._idle.get_nowait()
+                except queue.Empty:
+                    return
+                self._quit(smtp)
+        await asyncio.to_thread(close_all)
+
+
+def create_transport(host: str = SMTP_HOST) -> MailTransport:
+    if not host:
+        return LoggingTransport()
+    return SMTPTransport(host)
+
+
+class OutboxDispatcher:
+    """Background sender draining the outboxes of every shard."""
+
+    def __init__(self, outboxes: Dict[str, Outbox], transport: MailTransport,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.outboxes = outboxes
+        self.transport = transport
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = uuid.uuid4().hex
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Call after writing messages so they go out without waiting for the next poll."""
+        self._wakeup.set()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._reaper())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.transport.close()
+
+    async def dispatch_once(self) -> int:
+        """Send one batch from each outbox; returns how many messages were claimed."""
+        claimed_total = 0
+        for name, outbox in self.outboxes.items():
+            claimed = await outbox.claim(self.worker_id, self.batch_size)
+            if not claimed:
+                continue
+            claimed_total += len(claimed)
+            emails, errors = [], []
+            for doc in claimed:
+                try:
+                    emails.append(build_email(doc))
+                    errors.append(None)
+                except Exception as e:
+                    emails.append(None)
+                    errors.append(e)
+            sendable = [email for email in emails if email is not None]
+            sent = iter(await self.transport.send_many(sendable))
+            errors = [next(sent) if email is not None else error for email, error in zip(emails, errors)]
+            await outbox.complete(claimed, errors)
+            failures = sum(error is not None for error in errors)
+            if failures:
+                logger.warning("Outbox %s: %d of %d emails failed", name, failures, len(claimed))
+        return claimed_total
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self.dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                claimed = 0
+            if claimed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reaper(self):
+        while True:
+            for name, outbox in self.outboxes.items():
+                try:
+                    requeued = await outbox.requeue_expired()
+                    if requeued:
+                        logger.warning("Requeued %d outbox messages with expired leases on %s", requeued, name)
+                        self._wakeup.set()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Failed to requeue expired outbox messages")
+            await asyncio.sleep(OUTBOX_LEASE_SECONDS / 4)
@@ -0,0 +1,119 @@
+"""Live preview sessions for the website builder.
+
+The builder opens one WebSocket per editing session instead of fetching the
+full preview after every edit. The session keeps the website document and the
+input hash of every rendered section in memory; an edit re-renders only the
+sections whose inputs changed (unchanged product cards and other fragments
+come straight from the fragment cache) and sends them back as patches.
+
+Protocol (JSON messages):
+
+- server -> client ``{"type": "page", "html": ...}``: the full preview page,
+  sent on connect, after a template switch and on ``reload``. Body sections are
+  wrapped in ``<!--section:NAME-->`` / ``<!--/section:NAME-->`` comments.
+- client -> server ``{"type": "update", "seq": n, "changes": {...}}`` with
+  WebsiteUpdate fields; answered by ``{"type": "patch", "seq": n, "patches":
+  [{"section": ..., "html": ...}]}``, or ``{"type": "error", ...}``.
+- client -> server ``{"type": "reload"}``: reread the saved website.
+
+Edits are never persisted here; saving still goes through ``PUT /websites``.
+The page embeds a small script that applies patch messages posted to its
+window by the parent frame, so the builder can forward them to an iframe.
+"""
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from site_templates import SECTIONS, SiteTemplate
+
+PREVIEW_IDLE_SECONDS = float(os.environ.get('PREVIEW_IDLE_SECONDS', '900'))
+
+# Sections that aren't wrapped in markers: their markup spans <head>/<body> boundaries
+_UNWRAPPED = {"head", "scripts"}
+
+PATCH_CLIENT_SCRIPT = """
+        <script>
+            (function () {
+                function bounds(name) {
+                    var walker = document.createTreeWalker(document.body, NodeFilter.SHOW_COMMENT);
+                    var start = null;
+                    while (walker.nextNode()) {
+                        var value = walker.currentNode.nodeValue;
+                        if (value === "section:" + name) start = walker.currentNode;
+                        else if (start && value === "/section:" + name) return [start, walker.currentNode];
+                    }
+                    return null;
+                }
+                window.addEventListener("message", function (event) {
+                    var message = event.data;
+                    if (event.source !== window.parent || !message || message.type !== "patch") return;
+                    message.patches.forEach(function (patch) {
+                        if (patch.section === "head") {
+                            var head = new DOMParser().parseFromString(patch.html, "text/html");
+                            document.title = head.title;
+                            var link = head.querySelector('link[rel="stylesheet"]');
+                            var current = document.querySelector('link[rel="stylesheet"]');
+                            if (link && current) current.href = link.getAttribute("href");
+                            return;
+                        }
+                        var found = bounds(patch.section);
+                        if (!found) return;
+                        var range = document.createRange();
+                        range.setStartAfter(found[0]);
+                        range.setEndBefore(found[1]);
+                        range.deleteContents();
+                        range.insertNode(range.createContextualFragment(patch.html));
+                    });
+                });
+            })();
+        </script>
+"""
+
+ContextBuilder = Callable[[dict], Tuple[SiteTemplate, Dict[str, str]]]
+
+
+class PreviewSession:
+    """In-memory state of one builder preview; not shared between connections."""
+
+    def __init__(self, website: dict, build_context: ContextBuilder, cache=None):
+        self.website = dict(website)
+        self.build_context = build_context
+        self.cache = cache
+        self.template: Optional[SiteTemplate] = None
+        self._hashes: Dict[str, str] = {}
+
+    def page(self) -> str:
+        """Render the whole preview page and remember what each section was built from."""
+        template, context = self.build_context(self.website)
+        self.template = template
+        parts = []
+        for name in SECTIONS:
+            section = template.sections[name]
+            self._hashes[name] = section.inputs_hash(context)
+            html = template.render_fragment(name, context, self.cache)
+            if name == "scripts":
+                parts.append(PATCH_CLIENT_SCRIPT)
+            if name in _UNWRAPPED:
+                parts.append(html)
+            else:
+                parts.append(f"<!--section:{name}-->{html}<!--/section:{name}-->")
+        return "".join(parts)
+
+    def apply(self, changes: dict) -> Optional[List[dict]]:
+        """Apply field changes; returns section patches, or None if the page must be resent."""
+        website = {**self.website, **changes}
+        template, context = self.build_context(website)
+        self.website = website
+        if template is not self.template:
+            return None
+        patches = []
+        for name in SECTIONS:
+            digest = template.sections[name].inputs_hash(context)
+            if digest != self._hashes.get(name):
+                self._hashes[name] = digest
+                patches.append({"section": name, "html": template.render_fragment(name, context, self.cache)})
+        return patches
+
+    def reset(self, website: dict):
+        self.website = dict(website)
+        self.template = None
+        self._hashes = {}
@@ -0,0 +1,266 @@
+"""Rate limiting for expensive or abusable routes.
+
+``RateLimitMiddleware`` matches each request against a short list of route
+groups (login, preview, public site pages, ...) and charges one request to
+the caller's bucket for that group: the client IP, or for ``tenant`` groups
+the bearer token so one account's previews don't starve another's behind the
+same NAT. Rejected requests get a 429 with a ``Retry-After`` header before any
+routing, auth or database work happens.
+
+Behind a reverse proxy or ingress every request comes from the proxy's
+address, so list the proxies in RATE_LIMIT_TRUSTED_PROXIES (addresses or
+CIDR ranges, comma-separated): for requests they forward, the client is the
+right-most ``X-Forwarded-For`` address that isn't itself a trusted proxy.
+Without that list everyone behind the proxy shares one bucket.
+
+The default limiter is an in-process token bucket per key; idle buckets are
+swept out periodically, so memory tracks active clients only. With several
+workers set RATE_LIMIT_BACKEND=redis: a sliding-window counter in Redis (one
+pipelined round trip per request) then enforces the limits across processes.
+"""
+import abc
+import ipaddress
+import logging
+import math
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+RATE_LIMIT_SWEEP_SECONDS = float(os.environ.get('RATE_LIMIT_SWEEP_SECONDS', '60'))
+# Proxies whose X-Forwarded-For is believed; anyone else could forge it
+RATE_LIMIT_TRUSTED_PROXIES = os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '')
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    """Parse "10/minute" (or "10/60") into (requests, period seconds)."""
+    count, _, period = spec.partition("/")
+    seconds = _PERIODS.get(period.strip().lower())
+    if seconds is None:
+        seconds = float(period)
+    return int(count), float(seconds)
+
+
+class RateLimitRule(NamedTuple):
+    name: str
+    pattern: Pattern
+    methods: Optional[frozenset]
+    limit: int
+    period: float
+    key: str = "ip"  # "ip" or "tenant"
+
+
+def parse_networks(spec: str) -> Tuple[Union[ipaddress.IPv4Network, ipaddress.IPv6Network], ...]:
+    """Parse "10.0.0.0/8, 127.0.0.1" into networks; a bare address is a /32 (or /128)."""
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip())
+
+
+def rule(name: str, pattern: str, spec: str, methods=None, key: str = "ip") -> RateLimitRule:
+    limit, period = parse_limit(os.environ.get(f'RATE_LIMIT_{name.upper()}', spec))
+    return RateLimitRule(name, re.compile(pattern), frozenset(methods) if methods else None, limit, period, key)
+
+
+# First match wins
+DEFAULT_RULES = [
+    # bcrypt makes every attempt cost ~100 ms of CPU
+    rule("login", r"^/api/auth/(login|register)$", "10/minute", methods={"POST"}),
+    # Each of these sends an email
+    rule("email", r"^/api/auth/(password-reset|verify-email/resend)$", "5/minute", methods={"POST"}),
+    rule("inquiry", r"^/api/websites/[^/]+/inquiries$", "5/minute", methods={"POST"}),
+    rule("preview", r"^/api/websites/[^/]+/preview(/live)?$", "120/minute", key="tenant"),
+    rule("import", r"^/api/websites/[^/]+/(products/import|export)$", "10/minute", methods={"POST"}, key="tenant"),
+    # Public pages, by slug or on a custom domain
+    rule("sites", r"^/api/sites/|^/(?!api/)", "300/minute", methods={"GET", "HEAD"}),
+]
+
+
+class RateLimiter(abc.ABC):
+    @abc.abstractmethod
+    async def hit(self, key: str, limit: int, period: float) -> float:
+        """Charge one request to ``key``; 0 if allowed, else seconds until it would be."""
+
+    async def close(self):
+        pass
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """Token bucket per key: ``limit`` tokens, refilled at ``limit / period`` per second."""
+
+    def __init__(self, sweep_interval: float = RATE_LIMIT_SWEEP_SECONDS, clock=time.monotonic):
+        self.clock = clock
+        self.sweep_interval = sweep_interval
+        # key -> [tokens, last refill, seconds to refill completely]
+        self._buckets: Dict[str, list] = {}
+        self._next_sweep = clock() + sweep_interval
+
+    async def hit(self, key: str, limit: int, period: float) -> float:
+        return self.hit_local(key, limit, period)
+
+    def hit_local(self, key: str, limit: int, period: float) -> float:
+        now = self.clock()
+        if now >= self._next_sweep:
+            self.sweep(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = [limit - 1.0, now, period]
+            return 0.0
+        rate = limit / period
+        tokens = min(float(limit), bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / rate
+
+    def sweep(self, now: Optional[float] = None):
+        """Drop buckets that have refilled completely; they are equivalent to no bucket."""
+        now = self.clock() if now is None else now
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < bucket[2]
+        }
+        self._next_sweep = now + self.sweep_interval
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisRateLimiter(RateLimiter):
+    """Sliding-window counter shared by every worker.
+
+    The current fixed window's count plus the previous window's, weighted by
+    how much of it still overlaps the sliding window. Rejected requests are
+    counted too, so a client that keeps hammering stays limited. Errors fail
+    open.
+    """
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "webcraft:rl:", client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.redis = client
+        self.prefix = prefix
+
+    async def hit(self, key: str, limit: int, period: float) -> float:
+        now = time.time()
+        window = int(now // period)
+        elapsed = now - window * period
+        current_key = f"{self.prefix}{key}:{window}"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.incr(current_key)
+                pipe.expire(current_key, int(period * 2) + 1)
+                pipe.get(f"{self.prefix}{key}:{window - 1}")
+                current, _, previous = await pipe.execute()
+        except Exception:
+            logger.exception("Rate limit backend unavailable; allowing request")
+            return 0.0
+        previous = int(previous or 0)
+        weight = 1.0 - elapsed / period
+        if previous * weight + current <= limit:
+            return 0.0
+        if current > limit or not previous:
+            return period - elapsed
+        # When the previous window's share has decayed enough for this request to fit
+        return max(period * (1.0 + (current - limit) / previous) - elapsed, 0.001)
+
+    async def close(self):
+        await self.redis.close()
+
+
+def create_rate_limiter(backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    if backend == "redis":
+        return RedisRateLimiter()
+    if backend != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    return InMemoryRateLimiter()
+
+
+def _is_trusted(address: str, trusted_proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def _client_key(scope, headers, trusted_proxies=()) -> str:
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not trusted_proxies or not _is_trusted(address, trusted_proxies):
+        return address
+    # Each proxy appends the address it got the request from; walk back past our own
+    for hop in reversed(headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",")):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if not _is_trusted(hop, trusted_proxies):
+            break
+    return address
+
+
+def _tenant_key(scope, headers, trusted_proxies=()) -> str:
+    # The token's signature identifies the session without decoding the JWT;
+    # forged tokens only spend their own bucket and are rejected by the route
+    authorization = headers.get(b"authorization", b"")
+    if authorization[:7].lower() == b"bearer ":
+        return "t:" + authorization.rsplit(b".", 1)[-1][-32:].decode("latin-1")
+    for name, _, value in (part.partition(b"=") for part in scope.get("query_string", b"").split(b"&")):
+        if name == b"token" and value:
+            return "t:" + value.rsplit(b".", 1)[-1][-32:].decode("latin-1")
+    return _client_key(scope, headers, trusted_proxies)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: RateLimiter, rules: List[RateLimitRule] = DEFAULT_RULES,
+                 trusted_proxies: str = RATE_LIMIT_TRUSTED_PROXIES):
+        self.app = app
+        self.limiter = limiter
+        self.rules = rules
+        self.trusted_proxies = parse_networks(trusted_proxies)
+
+    def match(self, path: str, method: str) -> Optional[RateLimitRule]:
+        for candidate in self.rules:
+            if (candidate.methods is None or method in candidate.methods) and candidate.pattern.match(path):
+                return candidate
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        matched = self.match(scope["path"], scope.get("method", "GET"))
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", ()))
+        key_for = _tenant_key if matched.key == "tenant" else _client_key
+        client = key_for(scope, headers, self.trusted_proxies)
+        retry_after = await self.limiter.hit(f"{matched.name}:{client}", matched.limit, matched.period)
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
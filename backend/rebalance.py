@@ -0,0 +1,102 @@
+"""Tenant shard maintenance.
+
+    cd backend && python rebalance.py shards
+    python rebalance.py backfill               # record existing tenants and domains
+    python rebalance.py move USER_ID SHARD     # move one tenant online
+    python rebalance.py plan [--apply]         # move tenants to their ring shard
+
+Run ``backfill`` once before adding the first entry to TENANT_SHARDS, so
+tenants created before the directory keep resolving to the primary shard even
+while other tenants move. Moves pause the tenant's writes for a little over
+2 x TENANT_CACHE_TTL seconds; reads continue throughout.
+"""
+import asyncio
+import os
+from pathlib import Path
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import mongo_pool
+import tenancy
+
+load_dotenv(Path(__file__).parent / '.env')
+
+cli = typer.Typer(help=__doc__.split("\n\n")[0])
+
+
+def _router() -> tenancy.TenantRouter:
+    options = mongo_pool.client_options()
+    db = AsyncIOMotorClient(os.environ['MONGO_URL'], **options)[os.environ['DB_NAME']]
+    return tenancy.create_router(db, db, lambda url: AsyncIOMotorClient(url, **options))
+
+
+@cli.command()
+def shards():
+    """Tenants per shard."""
+    async def run():
+        router = _router()
+        counts = {
+            row["_id"]: row["tenants"]
+            async for row in router.directory.tenants.aggregate(
+                [{"$group": {"_id": "$shard", "tenants": {"$sum": 1}}}]
+            )
+        }
+        for shard in router.all():
+            typer.echo(f"{shard.name:20} {counts.pop(shard.name, 0):10}")
+        for name, count in counts.items():
+            typer.echo(f"{name:20} {count:10}  (not configured in TENANT_SHARDS)")
+    asyncio.run(run())
+
+
+@cli.command()
+def backfill():
+    """Record directory entries and domain claims for existing tenants."""
+    async def run():
+        router = _router()
+        for shard in router.all():
+            users = 0
+            async for user in shard.db.users.find({}, {"_id": 0, "id": 1, "email": 1}):
+                await router.backfill_user(user["id"], user["email"], shard.name)
+                users += 1
+            domains = 0
+            async for website in shard.db.websites.find(
+                {"custom_domain": {"$type": "string"}}, {"_id": 0, "id": 1, "user_id": 1, "custom_domain": 1}
+            ):
+                await router.claim_domain(website["custom_domain"], website["id"], website["user_id"])
+                domains += 1
+            typer.echo(f"{shard.name}: {users} tenants, {domains} custom domains")
+    asyncio.run(run())
+
+
+@cli.command()
+def move(user_id: str, shard: str):
+    """Move one tenant to SHARD."""
+    async def run():
+        mover = tenancy.TenantMover(_router(), log=typer.echo)
+        typer.echo(await mover.move(user_id, shard))
+    asyncio.run(run())
+
+
+@cli.command()
+def plan(apply: bool = typer.Option(False, help="Move the tenants instead of listing them"),
+         limit: int = typer.Option(100, help="At most this many moves")):
+    """Tenants not on the shard the hash ring assigns them (e.g. after adding a shard)."""
+    async def run():
+        router = _router()
+        placements = await router.directory.tenants.find(
+            {"state": tenancy.ACTIVE}, {"_id": 0, "user_id": 1, "shard": 1}
+        ).to_list(None)
+        moves = tenancy.plan_rebalance(router, placements)[:limit]
+        mover = tenancy.TenantMover(router, log=typer.echo)
+        for planned in moves:
+            typer.echo(f"{planned['user_id']}: {planned['from']} -> {planned['to']}")
+            if apply:
+                await mover.move(planned["user_id"], planned["to"])
+        typer.echo(f"{len(moves)} of {len(placements)} tenants {'moved' if apply else 'to move'}")
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    cli()
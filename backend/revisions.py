@@ -0,0 +1,206 @@
+"""Revision history for website content.
+
+Every update appends a revision to ``website_revisions``. Most revisions are
+deltas holding only the fields that the update set; every
+``REVISION_CHECKPOINT_INTERVAL``-th revision is a full checkpoint, so
+rebuilding any revision applies at most ``interval - 1`` deltas on top of a
+checkpoint. Embedded base64 images are stored once in ``revision_blobs``,
+keyed by their sha256, and revisions only hold the hash (and list every hash
+they use in ``blobs``, so a blob no revision lists any more can be deleted).
+Listing history projects out revision bodies entirely.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+REVISION_CHECKPOINT_INTERVAL = int(os.environ.get('REVISION_CHECKPOINT_INTERVAL', '10'))
+REVISION_LIST_LIMIT = 100
+# Concurrent writers race for revision numbers; each lost race retries with the next one
+REVISION_INSERT_ATTEMPTS = 5
+# A blob written this recently may belong to a revision that isn't inserted yet
+BLOB_GRACE_SECONDS = int(os.environ.get('REVISION_BLOB_GRACE_SECONDS', '3600'))
+
+CHECKPOINT = "checkpoint"
+DELTA = "delta"
+
+IMAGE_FIELDS = ("logo_base64", "hero_image_base64")
+PRODUCT_IMAGE_FIELD = "image_base64"
+BLOB_REF = "__blob__"
+
+REVISION_SUMMARY_PROJECTION = {
+    "_id": 0, "number": 1, "kind": 1, "changed_fields": 1, "created_at": 1, "restored_from": 1,
+}
+
+
+def _blob_ref(value: str, blobs: Dict[str, str]) -> dict:
+    digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+    blobs[digest] = value
+    return {BLOB_REF: digest}
+
+
+def _is_ref(value) -> bool:
+    return isinstance(value, dict) and BLOB_REF in value
+
+
+class WebsiteRevisions:
+    def __init__(self, db, fields: Iterable[str],
+                 checkpoint_interval: int = REVISION_CHECKPOINT_INTERVAL):
+        self.db = db
+        self.fields = tuple(fields)
+        self.checkpoint_interval = max(1, checkpoint_interval)
+
+    async def ensure_indexes(self):
+        await self.db.website_revisions.create_index(
+            [("website_id", ASCENDING), ("number", DESCENDING)], unique=True
+        )
+        await self.db.website_revisions.create_index(
+            [("website_id", ASCENDING), ("kind", ASCENDING), ("number", DESCENDING)]
+        )
+        await self.db.website_revisions.create_index("blobs")
+
+    def _extract_blobs(self, values: dict, blobs: Dict[str, str]) -> dict:
+        """Copy of ``values`` with embedded images replaced by blob references."""
+        out = dict(values)
+        for field in IMAGE_FIELDS:
+            if out.get(field):
+                out[field] = _blob_ref(out[field], blobs)
+        if out.get("products"):
+            out["products"] = [
+                {**product, PRODUCT_IMAGE_FIELD: _blob_ref(product[PRODUCT_IMAGE_FIELD], blobs)}
+                if product.get(PRODUCT_IMAGE_FIELD) else product
+                for product in out["products"]
+            ]
+        return out
+
+    async def _store_blobs(self, blobs: Dict[str, str]):
+        if not blobs:
+            return
+        now = datetime.utcnow()
+        await self.db.revision_blobs.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": digest},
+                    {"$setOnInsert": {"data": data, "size": len(data), "created_at": now}, "$set": {"used_at": now}},
+                    upsert=True,
+                )
+                for digest, data in blobs.items()
+            ],
+            ordered=False,
+        )
+
+    async def record(self, website: dict, changes: Optional[dict] = None,
+                     restored_from: Optional[int] = None) -> int:
+        """Append a revision for ``website`` (its state after the write).
+
+        ``changes`` are the fields the write set; None records a checkpoint.
+        """
+        website_id = website["id"]
+        number = await self._next_number(website_id)
+        content = {field: website.get(field) for field in self.fields}
+        if changes is not None:
+            changes = {field: value for field, value in changes.items() if field in self.fields}
+
+        blobs: Dict[str, str] = {}
+        revision = {
+            "website_id": website_id,
+            "user_id": website["user_id"],
+            "created_at": datetime.utcnow(),
+            "changed_fields": sorted(changes) if changes is not None else list(self.fields),
+            "restored_from": restored_from,
+        }
+        if changes is None or number % self.checkpoint_interval == 0:
+            revision.update(kind=CHECKPOINT, state=self._extract_blobs(content, blobs))
+        else:
+            revision.update(kind=DELTA, changes=self._extract_blobs(changes, blobs))
+
+        for attempt in range(REVISION_INSERT_ATTEMPTS):
+            await self._store_blobs(blobs)
+            try:
+                await self.db.website_revisions.insert_one({**revision, "blobs": sorted(blobs), "number": number})
+                return number
+            except DuplicateKeyError:
+                if attempt == REVISION_INSERT_ATTEMPTS - 1:
+                    raise
+            # A concurrent write took this number; a checkpoint is correct in any order
+            blobs = {}
+            revision.pop("changes", None)
+            revision.update(kind=CHECKPOINT, state=self._extract_blobs(content, blobs))
+            number = await self._next_number(website_id)
+
+    async def _next_number(self, website_id: str) -> int:
+        latest = await self.db.website_revisions.find_one(
+            {"website_id": website_id}, {"_id": 0, "number": 1}, sort=[("number", DESCENDING)]
+        )
+        return latest["number"] + 1 if latest else 0
+
+    async def list(self, website_id: str, limit: int = REVISION_LIST_LIMIT) -> List[dict]:
+        return await self.db.website_revisions.find(
+            {"website_id": website_id}, REVISION_SUMMARY_PROJECTION
+        ).sort("number", DESCENDING).to_list(limit)
+
+    async def delete(self, website_ids: List[str]) -> int:
+        """Drop the history of purged websites and the blobs only it used; returns blobs deleted."""
+        query = {"website_id": {"$in": website_ids}}
+        digests = await self.db.website_revisions.distinct("blobs", query)
+        await self.db.website_revisions.delete_many(query)
+        if not digests:
+            return 0
+        # Other websites' revisions may share an image (the same upload, a template default)
+        still_used = set(await self.db.website_revisions.distinct("blobs", {"blobs": {"$in": digests}}))
+        unused = [digest for digest in digests if digest not in still_used]
+        if not unused:
+            return 0
+        result = await self.db.revision_blobs.delete_many({
+            "_id": {"$in": unused},
+            "used_at": {"$lt": datetime.utcnow() - timedelta(seconds=BLOB_GRACE_SECONDS)},
+        })
+        return result.deleted_count
+
+    async def state_at(self, website_id: str, number: int) -> Optional[dict]:
+        """Website content as of revision ``number``, with images resolved."""
+        checkpoint = await self.db.website_revisions.find_one(
+            {"website_id": website_id, "kind": CHECKPOINT, "number": {"$lte": number}},
+            {"_id": 0, "number": 1, "state": 1},
+            sort=[("number", DESCENDING)],
+        )
+        if checkpoint is None:
+            return None
+        state = dict(checkpoint["state"])
+        last = checkpoint["number"]
+        async for delta in self.db.website_revisions.find(
+            {"website_id": website_id, "kind": DELTA, "number": {"$gt": checkpoint["number"], "$lte": number}},
+            {"_id": 0, "number": 1, "changes": 1},
+        ).sort("number", ASCENDING):
+            state.update(delta["changes"])
+            last = delta["number"]
+        if last != number:
+            return None
+        return await self._resolve_blobs(state)
+
+    async def _resolve_blobs(self, state: dict) -> dict:
+        refs = [state[field] for field in IMAGE_FIELDS if _is_ref(state.get(field))]
+        refs += [
+            product[PRODUCT_IMAGE_FIELD] for product in state.get("products") or []
+            if _is_ref(product.get(PRODUCT_IMAGE_FIELD))
+        ]
+        if not refs:
+            return state
+        digests = list({ref[BLOB_REF] for ref in refs})
+        blobs = {
+            doc["_id"]: doc["data"]
+            async for doc in self.db.revision_blobs.find({"_id": {"$in": digests}}, {"data": 1})
+        }
+        for field in IMAGE_FIELDS:
+            if _is_ref(state.get(field)):
+                state[field] = blobs.get(state[field][BLOB_REF])
+        if state.get("products"):
+            state["products"] = [
+                {**product, PRODUCT_IMAGE_FIELD: blobs.get(product[PRODUCT_IMAGE_FIELD][BLOB_REF])}
+                if _is_ref(product.get(PRODUCT_IMAGE_FIELD)) else product
+                for product in state["products"]
+            ]
+        return state
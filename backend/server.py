@@ -1,15 +1,17 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from typing import List, Optional, Dict, Any, Callable
 import uuid
 from datetime import datetime, timedelta
 import bcrypt
@@ -17,14 +19,55 @@ import jwt
 from slugify import slugify
 import json
 import base64
+import asyncio
+import functools
+import hashlib
+from site_css import SiteStylesheets, colors_query, extract_classes
+import tracing
+from cache import InProcessCache, create_cache
+import mongo_pool
+import media
+import storage
+import site_templates
+from domains import CustomDomainMiddleware, DomainMap, normalize_domain
+import jobs
+import site_export
+import catalog_import
+import preview
+import html_optimizer
+import site_warmup
+import ratelimit
+import tenancy
+import outbox
+import emails
+from admin_stats import AdminStats
+from archive import WebsiteArchiver
+from revisions import WebsiteRevisions
+from startup import WarmUp
+from change_streams import ALL_PAGES_TAG, CHANGE_STREAMS_ENABLED, ChangeStreamInvalidator, document_tag
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+pool_metrics = mongo_pool.PoolMetricsListener()
+mongo_client_options = mongo_pool.client_options(pool_metrics)
+client = AsyncIOMotorClient(mongo_url, **mongo_client_options)
+db = tracing.instrument_database(client[os.environ['DB_NAME']])
+# Public read-only routes can be pointed at secondaries (e.g. secondaryPreferred)
+public_db = tracing.instrument_database(client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=mongo_pool.read_preference(os.environ.get('MONGO_PUBLIC_READ_PREFERENCE')),
+))
+# Tenant data (users, websites, media, products) is routed to a shard by user_id;
+# the primary database holds the tenant directory, jobs and revision history
+tenants = tenancy.create_router(
+    db, public_db,
+    lambda url: AsyncIOMotorClient(url, **mongo_client_options),
+    instrument=tracing.instrument_database,
+    read_preference=mongo_pool.read_preference(os.environ.get('MONGO_PUBLIC_READ_PREFERENCE')),
+)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -39,6 +82,64 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Security
 security = HTTPBearer()
+# Accounts registered with these emails get the admin role
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+# Rendered page cache (in-process, or shared across workers with CACHE_BACKEND=redis)
+page_cache = create_cache()
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', '300'))
+# Public base URL of this API; exported and published pages, which aren't served
+# from it, link here (e.g. the contact form)
+API_URL = os.environ.get('API_URL', 'http://localhost:8001').rstrip('/')
+# Concurrent misses for the same page share one render, unless the page was
+# invalidated after that render started
+site_renders = site_warmup.SingleFlight(generation=lambda: page_cache.generation)
+
+# Media, exports and published pages (local disk or S3-compatible object storage)
+object_storage = storage.create_storage()
+STORAGE_PUBLISH_PAGES = os.environ.get('STORAGE_PUBLISH_PAGES', 'false').lower() in ('1', 'true', 'yes')
+if STORAGE_PUBLISH_PAGES and object_storage.urls_expire:
+    # Published pages are kept indefinitely; presigned media links in them would expire
+    raise RuntimeError("STORAGE_PUBLISH_PAGES requires S3_PUBLIC_URL so published pages link to media that doesn't expire")
+
+# Rendered sections and product cards, keyed by the inputs they depend on
+fragment_cache = InProcessCache(
+    int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', '20000')),
+    # Fragments can embed base64 images, so entry count alone doesn't bound memory
+    max_bytes=int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+)
+
+# Per-IP / per-token request budgets for login, previews and public pages
+rate_limiter = ratelimit.create_rate_limiter()
+
+# Custom domain -> website map, resolved without a database query
+domain_map = DomainMap([shard.db for shard in tenants.all()])
+
+# Background jobs (re-rendering, exports) run outside request handlers
+job_queue = jobs.JobQueue(db)
+
+# Public page views per page and day; ranks the pages pre-rendered at warm-up
+site_visits = site_warmup.VisitCounter(db)
+
+# Admin dashboard rollups, cached for ADMIN_STATS_TTL seconds
+admin_stats = AdminStats([shard.db for shard in tenants.all()], page_cache)
+
+# Soft-deleted websites move to websites_archive after a grace period (per shard);
+# purging one also drops its revision history, which lives on the primary database
+async def purge_website_revisions(website_ids: List[str]):
+    await website_revisions.delete(website_ids)
+
+website_archivers = {
+    shard.name: WebsiteArchiver(shard.db, on_purge=purge_website_revisions) for shard in tenants.all()
+}
+
+# Emails are written to the outbox of the shard whose change triggers them, in the
+# same transaction, and sent by a background dispatcher (SMTP_HOST; logged if unset)
+outboxes = {shard.name: outbox.Outbox(shard.db) for shard in tenants.all()}
+mail_dispatcher = outbox.OutboxDispatcher(outboxes, outbox.create_transport())
+
+# Per-palette stylesheets for generated sites
+site_stylesheets = SiteStylesheets()
 
 # Models
 class UserCreate(BaseModel):
@@ -56,11 +157,32 @@ class User(BaseModel):
     email: EmailStr
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
+    email_verified: bool = False
+    role: str = "user"
 
 class Token(BaseModel):
     access_token: str
     token_type: str
 
+class EmailTokenConfirm(BaseModel):
+    token: str
+
+class PasswordResetRequest(BaseModel):
+    email: EmailStr
+
+class PasswordResetConfirm(BaseModel):
+    token: str
+    password: str
+
+class Media(BaseModel):
+    id: str
+    user_id: str
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+
 class WebsiteCreate(BaseModel):
     business_name: str
     business_description: str
@@ -70,6 +192,8 @@ class WebsiteCreate(BaseModel):
     address: str
     logo_base64: Optional[str] = None
     hero_image_base64: Optional[str] = None
+    logo_media_id: Optional[str] = None
+    hero_image_media_id: Optional[str] = None
     products: List[Dict[str, Any]] = []
     colors: Dict[str, str] = {
         "primary": "#3B82F6",
@@ -89,25 +213,44 @@ class Website(BaseModel):
     address: str
     logo_base64: Optional[str] = None
     hero_image_base64: Optional[str] = None
+    logo_media_id: Optional[str] = None
+    hero_image_media_id: Optional[str] = None
     products: List[Dict[str, Any]] = []
     colors: Dict[str, str] = {}
     social_links: Dict[str, str] = {}
     slug: str
+    custom_domain: Optional[str] = None
     is_active: bool = True
+    deleted_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class WebsiteUpdate(BaseModel):
     business_name: Optional[str] = None
     business_description: Optional[str] = None
+    industry: Optional[str] = None
     contact_email: Optional[EmailStr] = None
     contact_phone: Optional[str] = None
     address: Optional[str] = None
     logo_base64: Optional[str] = None
     hero_image_base64: Optional[str] = None
+    logo_media_id: Optional[str] = None
+    hero_image_media_id: Optional[str] = None
     products: Optional[List[Dict[str, Any]]] = None
     colors: Optional[Dict[str, str]] = None
     social_links: Optional[Dict[str, str]] = None
+    custom_domain: Optional[str] = None
+
+class InquiryCreate(BaseModel):
+    # Both end up in the notification's Subject header, which can't contain line breaks
+    name: str = Field(min_length=1, max_length=200, pattern=r"^[^\r\n]*$")
+    email: EmailStr
+    subject: str = Field(default="", max_length=300, pattern=r"^[^\r\n]*$")
+    message: str = Field(min_length=1, max_length=5000)
+
+# Content fields tracked by revision history (everything a user can edit except the domain)
+REVISIONED_FIELDS = [field for field in WebsiteUpdate.model_fields if field != "custom_domain"]
+website_revisions = WebsiteRevisions(db, REVISIONED_FIELDS)
 
 # Utility functions
 def hash_password(password: str) -> str:
@@ -126,6 +269,25 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Emailed tokens carry "uid" and a purpose instead of "sub", so they can't be used
+# as access tokens and an access token can't confirm an email or reset a password
+def create_email_token(purpose: str, user_id: str, expires_delta: timedelta, **claims) -> str:
+    return create_access_token({"uid": user_id, "purpose": purpose, **claims}, expires_delta)
+
+def decode_email_token(token: str, purpose: str) -> dict:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        payload = {}
+    if payload.get("purpose") != purpose or not payload.get("uid"):
+        raise HTTPException(status_code=400, detail="Invalid or expired link")
+    return payload
+
+def password_fingerprint(hashed_password: str) -> str:
+    # Reset tokens embed this, so they stop working once the password changes
+    return hashlib.sha256(f"{SECRET_KEY}:{hashed_password}".encode('utf-8')).hexdigest()[:16]
+
+@tracing.traced("get_current_user")
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
@@ -136,14 +298,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-    except jwt.JWTError:
+    except jwt.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = await db.users.find_one({"id": user_id})
+    shard = await tenants.shard_for(user_id)
+    user = await shard.db.users.find_one({"id": user_id})
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -152,308 +315,143 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
     return User(**user)
 
-def generate_website_html(website: Website) -> str:
+async def user_from_token(token: str) -> Optional[dict]:
+    """Resolve a bearer token outside of HTTP requests (e.g. WebSockets)."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("sub") is None:
+        return None
+    shard = await tenants.shard_for(payload["sub"])
+    return await shard.db.users.find_one({"id": payload["sub"]}, {"_id": 0, "id": 1, "email": 1})
+
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin" and current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    # ADMIN_EMAILS grants the role at registration; only owning the address should
+    if not current_user.email_verified:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Verify your email address to use admin access")
+    return current_user
+
+# Mongo documents are written from Website.dict(), so projecting exactly the model's
+# fields lets read routes serialize them directly without a pydantic round trip.
+WEBSITE_PROJECTION = {"_id": 0, **{field: 1 for field in Website.model_fields}}
+
+def website_from_doc(doc: dict) -> Website:
+    with tracing.span("Website.validate"):
+        return Website(**doc)
+
+def storage_media_url(user_id: str, media_id: str) -> str:
+    return media.media_url(object_storage, user_id, media_id)
+
+@tracing.traced("generate_website_html")
+def generate_website_html(website: Website, media_url: Callable[[str, str], str] = storage_media_url) -> str:
     """Generate HTML for the website"""
-    template = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{website.business_name} - Professional eCommerce Store</title>
-        <script src="https://cdn.tailwindcss.com"></script>
-        <script>
-            tailwind.config = {{
-                theme: {{
-                    extend: {{
-                        colors: {{
-                            primary: '{website.colors.get("primary", "#3B82F6")}',
-                            secondary: '{website.colors.get("secondary", "#1E40AF")}',
-                            accent: '{website.colors.get("accent", "#F59E0B")}'
-                        }}
-                    }}
-                }}
-            }}
-        </script>
-        <style>
-            .hero-bg {{
-                background: linear-gradient(135deg, {website.colors.get("primary", "#3B82F6")} 0%, {website.colors.get("secondary", "#1E40AF")} 100%);
-            }}
-        </style>
-    </head>
-    <body class="bg-gray-50">
-        <!-- Navigation -->
-        <nav class="bg-white shadow-lg sticky top-0 z-50">
-            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
-                <div class="flex justify-between items-center h-16">
-                    <div class="flex items-center">
-                        {f'<img src="data:image/jpeg;base64,{website.logo_base64}" alt="Logo" class="h-10 w-10 rounded-lg mr-3">' if website.logo_base64 else ''}
-                        <span class="text-xl font-bold text-gray-900">{website.business_name}</span>
-                    </div>
-                    <div class="hidden md:flex space-x-8">
-                        <a href="#home" class="text-gray-700 hover:text-primary transition-colors">Home</a>
-                        <a href="#products" class="text-gray-700 hover:text-primary transition-colors">Products</a>
-                        <a href="#about" class="text-gray-700 hover:text-primary transition-colors">About</a>
-                        <a href="#contact" class="text-gray-700 hover:text-primary transition-colors">Contact</a>
-                    </div>
-                    <div class="flex items-center">
-                        <button class="bg-primary text-white px-4 py-2 rounded-lg hover:bg-secondary transition-colors">
-                            Cart (<span id="cart-count">0</span>)
-                        </button>
-                    </div>
-                </div>
-            </div>
-        </nav>
-
-        <!-- Hero Section -->
-        <section id="home" class="hero-bg text-white py-20">
-            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
-                <div class="grid grid-cols-1 lg:grid-cols-2 gap-12 items-center">
-                    <div>
-                        <h1 class="text-4xl md:text-6xl font-bold mb-6">
-                            Welcome to {website.business_name}
-                        </h1>
-                        <p class="text-xl mb-8 text-gray-100">
-                            {website.business_description}
-                        </p>
-                        <div class="flex flex-wrap gap-4">
-                            <button class="bg-accent text-white px-8 py-3 rounded-lg font-semibold hover:bg-yellow-600 transition-colors">
-                                Shop Now
-                            </button>
-                            <button class="border-2 border-white text-white px-8 py-3 rounded-lg font-semibold hover:bg-white hover:text-primary transition-colors">
-                                Learn More
-                            </button>
-                        </div>
-                    </div>
-                    <div class="flex justify-center">
-                        {f'<img src="data:image/jpeg;base64,{website.hero_image_base64}" alt="Hero" class="rounded-lg shadow-2xl max-w-full h-auto">' if website.hero_image_base64 else '<div class="bg-white bg-opacity-20 rounded-lg p-12 text-center"><h3 class="text-2xl font-bold mb-4">Your Hero Image Here</h3><p>Upload a stunning hero image to showcase your business</p></div>'}
-                    </div>
-                </div>
-            </div>
-        </section>
-
-        <!-- Products Section -->
-        <section id="products" class="py-20 bg-white">
-            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
-                <div class="text-center mb-12">
-                    <h2 class="text-3xl md:text-4xl font-bold text-gray-900 mb-4">Our Products</h2>
-                    <p class="text-gray-600 max-w-2xl mx-auto">Discover our amazing collection of premium products</p>
-                </div>
-                <div class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-8">
-                    {_generate_product_cards(website.products)}
-                </div>
-            </div>
-        </section>
-
-        <!-- About Section -->
-        <section id="about" class="py-20 bg-gray-50">
-            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
-                <div class="grid grid-cols-1 lg:grid-cols-2 gap-12 items-center">
-                    <div>
-                        <h2 class="text-3xl md:text-4xl font-bold text-gray-900 mb-6">About {website.business_name}</h2>
-                        <p class="text-gray-600 mb-6">{website.business_description}</p>
-                        <div class="grid grid-cols-1 md:grid-cols-2 gap-6">
-                            <div class="flex items-center">
-                                <div class="bg-primary text-white p-3 rounded-lg mr-4">
-                                    <svg class="w-6 h-6" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M5 13l4 4L19 7"></path>
-                                    </svg>
-                                </div>
-                                <div>
-                                    <h3 class="font-semibold text-gray-900">Quality Products</h3>
-                                    <p class="text-gray-600">Premium quality guaranteed</p>
-                                </div>
-                            </div>
-                            <div class="flex items-center">
-                                <div class="bg-primary text-white p-3 rounded-lg mr-4">
-                                    <svg class="w-6 h-6" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M12 8v4l3 3m6-3a9 9 0 11-18 0 9 9 0 0118 0z"></path>
-                                    </svg>
-                                </div>
-                                <div>
-                                    <h3 class="font-semibold text-gray-900">Fast Delivery</h3>
-                                    <p class="text-gray-600">Quick and reliable shipping</p>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                    <div class="bg-white p-8 rounded-lg shadow-lg">
-                        <h3 class="text-xl font-bold text-gray-900 mb-4">Get in Touch</h3>
-                        <div class="space-y-4">
-                            <div class="flex items-center">
-                                <svg class="w-5 h-5 text-primary mr-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M3 8l7.89 4.26a2 2 0 002.22 0L21 8M5 19h14a2 2 0 002-2V7a2 2 0 00-2-2H5a2 2 0 00-2 2v10a2 2 0 002 2z"></path>
-                                </svg>
-                                <span class="text-gray-600">{website.contact_email}</span>
-                            </div>
-                            <div class="flex items-center">
-                                <svg class="w-5 h-5 text-primary mr-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M3 5a2 2 0 012-2h3.28a1 1 0 01.948.684l1.498 4.493a1 1 0 01-.502 1.21l-2.257 1.13a11.042 11.042 0 005.516 5.516l1.13-2.257a1 1 0 011.21-.502l4.493 1.498a1 1 0 01.684.949V19a2 2 0 01-2 2h-1C9.716 21 3 14.284 3 6V5z"></path>
-                                </svg>
-                                <span class="text-gray-600">{website.contact_phone}</span>
-                            </div>
-                            <div class="flex items-center">
-                                <svg class="w-5 h-5 text-primary mr-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M17.657 16.657L13.414 20.9a1.998 1.998 0 01-2.827 0l-4.244-4.243a8 8 0 1111.314 0z"></path>
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 11a3 3 0 11-6 0 3 3 0 016 0z"></path>
-                                </svg>
-                                <span class="text-gray-600">{website.address}</span>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </section>
-
-        <!-- Contact Section -->
-        <section id="contact" class="py-20 bg-primary text-white">
-            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
-                <div class="text-center mb-12">
-                    <h2 class="text-3xl md:text-4xl font-bold mb-4">Contact Us</h2>
-                    <p class="text-gray-200">Ready to get started? Send us a message!</p>
-                </div>
-                <div class="max-w-2xl mx-auto">
-                    <form class="space-y-6" onsubmit="handleContactForm(event)">
-                        <div class="grid grid-cols-1 md:grid-cols-2 gap-6">
-                            <input type="text" placeholder="Your Name" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none">
-                            <input type="email" placeholder="Your Email" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none">
-                        </div>
-                        <input type="text" placeholder="Subject" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none">
-                        <textarea placeholder="Your Message" rows="5" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none resize-none"></textarea>
-                        <button type="submit" class="w-full bg-accent text-white py-3 rounded-lg font-semibold hover:bg-yellow-600 transition-colors">
-                            Send Message
-                        </button>
-                    </form>
-                </div>
-            </div>
-        </section>
-
-        <!-- Footer -->
-        <footer class="bg-gray-900 text-white py-12">
-            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
-                <div class="grid grid-cols-1 md:grid-cols-4 gap-8">
-                    <div>
-                        <h3 class="text-xl font-bold mb-4">{website.business_name}</h3>
-                        <p class="text-gray-400">{website.business_description[:100]}...</p>
-                    </div>
-                    <div>
-                        <h4 class="text-lg font-semibold mb-4">Quick Links</h4>
-                        <ul class="space-y-2 text-gray-400">
-                            <li><a href="#home" class="hover:text-white transition-colors">Home</a></li>
-                            <li><a href="#products" class="hover:text-white transition-colors">Products</a></li>
-                            <li><a href="#about" class="hover:text-white transition-colors">About</a></li>
-                            <li><a href="#contact" class="hover:text-white transition-colors">Contact</a></li>
-                        </ul>
-                    </div>
-                    <div>
-                        <h4 class="text-lg font-semibold mb-4">Contact Info</h4>
-                        <ul class="space-y-2 text-gray-400">
-                            <li>{website.contact_email}</li>
-                            <li>{website.contact_phone}</li>
-                            <li>{website.address}</li>
-                        </ul>
-                    </div>
-                    <div>
-                        <h4 class="text-lg font-semibold mb-4">Follow Us</h4>
-                        <div class="flex space-x-4">
-                            {_generate_social_links(website.social_links)}
-                        </div>
-                    </div>
-                </div>
-                <div class="border-t border-gray-800 mt-8 pt-8 text-center text-gray-400">
-                    <p>&copy; 2024 {website.business_name}. All rights reserved.</p>
-                </div>
-            </div>
-        </footer>
-
-        <script>
-            let cart = [];
-            let cartCount = 0;
-
-            function addToCart(productId, productName, productPrice) {{
-                cart.push({{
-                    id: productId,
-                    name: productName,
-                    price: productPrice
-                }});
-                cartCount++;
-                document.getElementById('cart-count').textContent = cartCount;
-                alert(`${{productName}} added to cart!`);
-            }}
-
-            function handleContactForm(event) {{
-                event.preventDefault();
-                alert('Thank you for your message! We will get back to you soon.');
-                event.target.reset();
-            }}
-
-            // Smooth scrolling for navigation links
-            document.querySelectorAll('a[href^="#"]').forEach(anchor => {{
-                anchor.addEventListener('click', function (e) {{
-                    e.preventDefault();
-                    document.querySelector(this.getAttribute('href')).scrollIntoView({{
-                        behavior: 'smooth'
-                    }});
-                }});
-            }});
-        </script>
-    </body>
-    </html>
-    """
-    return template
+    template = site_templates.registry.get(website.industry)
+    return template.render_page(_template_context(website, template, media_url), fragment_cache)
+
+def optimize_site_html(html_content: str) -> str:
+    """Minify and lazy-load a page that is about to be cached or exported."""
+    if not html_optimizer.SITE_HTML_OPTIMIZE:
+        return html_content
+    with tracing.span("optimize_html"):
+        return html_optimizer.optimize_html(html_content)
+
+def _template_context(website: Website, template: site_templates.SiteTemplate,
+                      media_url: Callable[[str, str], str], preview: bool = False) -> Dict[str, str]:
+    def image_src(media_id: Optional[str], image_base64: Optional[str]) -> Optional[str]:
+        return _image_src(media_url(website.user_id, media_id) if media_id else None, image_base64)
+    
+    logo_src = image_src(website.logo_media_id, website.logo_base64)
+    hero_src = image_src(website.hero_image_media_id, website.hero_image_base64)
+    return {
+        "business_name": website.business_name,
+        "business_description": website.business_description,
+        "footer_description": website.business_description[:100],
+        "contact_email": website.contact_email,
+        "contact_phone": website.contact_phone,
+        "address": website.address,
+        "inquiry_url": f"/api/websites/{website.id}/inquiries",
+        "stylesheet_href": _stylesheet_href(website.colors, preview),
+        "logo_img": template.render_fragment("logo_img", {"src": logo_src}) if logo_src else "",
+        "hero_media": (
+            template.render_fragment("hero_img", {"src": hero_src}) if hero_src
+            else template.render_fragment("hero_placeholder", {})
+        ),
+        "product_cards": _generate_product_cards(template, website.products, image_src),
+        "social_links": _generate_social_links(template, website.social_links),
+    }
+
+def _stylesheet_href(colors: Optional[Dict[str, str]], preview: bool) -> str:
+    # Unsaved preview palettes aren't written to disk; the URL carries the colors instead
+    if preview:
+        return f"/api/assets/site-css/{site_stylesheets.stylesheet_for(colors, persist=False)}.css{colors_query(colors)}"
+    return f"/api/assets/site-css/{site_stylesheets.stylesheet_for(colors)}.css"
 
-def _generate_product_cards(products):
+def _image_src(media_url: Optional[str], image_base64: Optional[str]) -> Optional[str]:
+    # Uploaded media is served by URL; inline base64 is kept for older sites
+    if media_url:
+        return media_url
+    if image_base64:
+        return f"data:image/jpeg;base64,{image_base64}"
+    return None
+
+def _generate_product_cards(template, products, image_src):
     if not products:
-        return """
-        <div class="col-span-full text-center py-12">
-            <h3 class="text-xl font-semibold text-gray-900 mb-4">No products yet</h3>
-            <p class="text-gray-600">Add products to showcase them here</p>
-        </div>
-        """
+        return template.render_fragment("products_empty", {})
     
-    cards = ""
+    cards = []
     for i, product in enumerate(products[:6]):  # Show max 6 products
-        image_src = f'data:image/jpeg;base64,{product.get("image_base64", "")}' if product.get("image_base64") else "https://via.placeholder.com/300x200?text=Product+Image"
-        cards += f"""
-        <div class="bg-white rounded-lg shadow-lg overflow-hidden hover:shadow-xl transition-shadow">
-            <img src="{image_src}" alt="{product.get('name', 'Product')}" class="w-full h-48 object-cover">
-            <div class="p-6">
-                <h3 class="text-xl font-bold text-gray-900 mb-2">{product.get('name', 'Product Name')}</h3>
-                <p class="text-gray-600 mb-4">{product.get('description', 'Product description')}</p>
-                <div class="flex items-center justify-between">
-                    <span class="text-2xl font-bold text-primary">${product.get('price', '0.00')}</span>
-                    <button onclick="addToCart('{i}', '{product.get('name', 'Product')}', '{product.get('price', '0.00')}')" 
-                            class="bg-primary text-white px-6 py-2 rounded-lg hover:bg-secondary transition-colors">
-                        Add to Cart
-                    </button>
-                </div>
-            </div>
-        </div>
-        """
-    return cards
-
-def _generate_social_links(social_links):
+        product_image = image_src(product.get("image_media_id"), product.get("image_base64")) or "https://via.placeholder.com/300x200?text=Product+Image"
+        cards.append(template.render_fragment("product_card", {
+            "index": i,
+            "image_src": product_image,
+            "name": product.get('name', 'Product'),
+            "title": product.get('name', 'Product Name'),
+            "description": product.get('description', 'Product description'),
+            "price": product.get('price', '0.00'),
+        }, fragment_cache))
+    return "".join(cards)
+
+def _generate_social_links(template, social_links):
     if not social_links:
         return ""
     
-    links = ""
-    for platform, url in social_links.items():
-        if url:
-            links += f"""
-            <a href="{url}" target="_blank" class="text-gray-400 hover:text-white transition-colors">
-                <span class="sr-only">{platform}</span>
-                <svg class="w-6 h-6" fill="currentColor" viewBox="0 0 24 24">
-                    <path d="M12 0C5.374 0 0 5.373 0 12s5.374 12 12 12 12-5.373 12-12S18.626 0 12 0zm5.568 8.16c-.172 1.684-.896 3.262-1.998 4.364-1.102 1.102-2.678 1.826-4.364 1.998-.546.055-1.104.055-1.65 0-1.686-.172-3.262-.896-4.364-1.998C4.09 11.422 3.366 9.846 3.194 8.16c-.055-.546-.055-1.104 0-1.65.172-1.686.896-3.262 1.998-4.364C6.294 1.044 7.87.32 9.556.148c.546-.055 1.104-.055 1.65 0 1.686.172 3.262.896 4.364 1.998 1.102 1.102 1.826 2.678 1.998 4.364.055.546.055 1.104 0 1.65z"/>
-                </svg>
-            </a>
-            """
-    return links
+    return "".join(
+        template.render_fragment("social_link", {"url": url, "platform": platform}, fragment_cache)
+        for platform, url in social_links.items() if url
+    )
+
+def _collect_site_classes():
+    # Render every template branch once so the stylesheet covers all classes in use
+    classes = set()
+    for template in site_templates.registry:
+        samples = [
+            Website(
+                user_id="sample", business_name="Sample", business_description="Sample",
+                industry=template.key, contact_email="sample@example.com", contact_phone="0",
+                address="Sample", slug="sample", logo_base64="x", hero_image_base64="x",
+                products=[{"name": "Sample", "image_base64": "x"}],
+                social_links={"sample": "https://example.com"},
+            ),
+            Website(
+                user_id="sample", business_name="Sample", business_description="Sample",
+                industry=template.key, contact_email="sample@example.com", contact_phone="0",
+                address="Sample", slug="sample",
+            ),
+        ]
+        for sample in samples:
+            classes |= extract_classes(generate_website_html(sample))
+    return classes
+
+site_stylesheets.set_class_loader(_collect_site_classes)
 
 # Authentication Routes
 @api_router.post("/auth/register", response_model=Token)
 async def register(user: UserCreate):
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user.email})
+    existing_user = await tenants.find_by_email(user.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -464,12 +462,28 @@ async def register(user: UserCreate):
     hashed_password = hash_password(user.password)
     user_data = User(
         name=user.name,
-        email=user.email
+        email=user.email,
+        role="admin" if user.email.lower() in ADMIN_EMAILS else "user"
     )
     user_dict = user_data.dict()
     user_dict["password"] = hashed_password
     
-    await db.users.insert_one(user_dict)
+    try:
+        shard = await tenants.register(user_data.id, user_data.email)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+    verify_token = create_email_token(
+        "verify_email", user_data.id, timedelta(hours=emails.EMAIL_VERIFICATION_HOURS), email=user_data.email
+    )
+    try:
+        await outboxes[shard.name].write(
+            [emails.verification(user_dict, verify_token)],
+            lambda session: shard.db.users.insert_one(user_dict, session=session),
+        )
+    except BaseException:
+        await tenants.unregister(user_data.id)
+        raise
+    mail_dispatcher.wake()
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -482,7 +496,11 @@ async def register(user: UserCreate):
 @api_router.post("/auth/login", response_model=Token)
 async def login(user: UserLogin):
     # Find user
-    db_user = await db.users.find_one({"email": user.email})
+    db_user = None
+    tenant = await tenants.find_by_email(user.email)
+    if tenant is not None:
+        user_id, shard = tenant
+        db_user = await shard.db.users.find_one({"id": user_id})
     if not db_user or not verify_password(user.password, db_user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -502,14 +520,134 @@ async def login(user: UserLogin):
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
+@api_router.post("/auth/verify-email")
+async def verify_email(body: EmailTokenConfirm):
+    payload = decode_email_token(body.token, "verify_email")
+    shard = await tenants.shard_for(payload["uid"], write=True)
+    # Only for the address the link was sent to, in case the email changed since
+    result = await shard.db.users.update_one(
+        {"id": payload["uid"], "email": payload.get("email")}, {"$set": {"email_verified": True}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=400, detail="Invalid or expired link")
+    return {"email_verified": True}
+
+@api_router.post("/auth/verify-email/resend", status_code=202)
+async def resend_verification_email(current_user: User = Depends(get_current_user)):
+    if current_user.email_verified:
+        return {"queued": False}
+    shard = await tenants.shard_for(current_user.id, write=True)
+    verify_token = create_email_token(
+        "verify_email", current_user.id, timedelta(hours=emails.EMAIL_VERIFICATION_HOURS), email=current_user.email
+    )
+    # False while an earlier verification email is still waiting to be sent
+    queued = await outboxes[shard.name].write([emails.verification(current_user.dict(), verify_token)])
+    mail_dispatcher.wake()
+    return {"queued": queued}
+
+@api_router.post("/auth/password-reset", status_code=202)
+async def request_password_reset(body: PasswordResetRequest):
+    # Same response whether or not the account exists, so emails can't be probed
+    tenant = await tenants.find_by_email(body.email)
+    if tenant is not None:
+        user_id, shard = tenant
+        db_user = await shard.db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "name": 1, "email": 1, "password": 1})
+        if db_user:
+            reset_token = create_email_token(
+                "password_reset", user_id, timedelta(minutes=emails.PASSWORD_RESET_MINUTES),
+                pwd=password_fingerprint(db_user["password"]),
+            )
+            await outboxes[shard.name].write([emails.password_reset(db_user, reset_token)])
+            mail_dispatcher.wake()
+    return {"detail": "If the account exists, a reset link is on its way"}
+
+@api_router.post("/auth/password-reset/confirm")
+async def confirm_password_reset(body: PasswordResetConfirm):
+    payload = decode_email_token(body.token, "password_reset")
+    shard = await tenants.shard_for(payload["uid"], write=True)
+    db_user = await shard.db.users.find_one({"id": payload["uid"]}, {"_id": 0, "id": 1, "name": 1, "email": 1, "password": 1})
+    if not db_user or password_fingerprint(db_user["password"]) != payload.get("pwd"):
+        raise HTTPException(status_code=400, detail="Invalid or expired link")
+    hashed_password = hash_password(body.password)
+    
+    async def change_password(session):
+        # Conditional on the old hash, so each link works once
+        result = await shard.db.users.update_one(
+            {"id": db_user["id"], "password": db_user["password"]},
+            {"$set": {"password": hashed_password}},
+            session=session,
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=400, detail="Invalid or expired link")
+    
+    await outboxes[shard.name].write([emails.password_changed(db_user)], change_password)
+    mail_dispatcher.wake()
+    return {"detail": "Password updated"}
+
+# Template Routes
+@api_router.get("/templates")
+async def list_templates():
+    return [
+        {"industry": template.key, "name": template.name, "version": template.cache_version}
+        for template in site_templates.registry
+    ]
+
+# Media Routes
+async def check_media_references(user_id: str, website_data: dict):
+    media_ids = {website_data.get("logo_media_id"), website_data.get("hero_image_media_id")}
+    media_ids.update(product.get("image_media_id") for product in website_data.get("products") or [])
+    media_ids.discard(None)
+    if not media_ids:
+        return
+    shard = await tenants.shard_for(user_id)
+    found = await shard.db.media.count_documents({"id": {"$in": list(media_ids)}, "user_id": user_id})
+    if found != len(media_ids):
+        raise HTTPException(status_code=400, detail="Unknown media reference")
+
+@api_router.post("/media", response_model=List[Media])
+async def upload_media(request: Request, current_user: User = Depends(get_current_user)):
+    shard = await tenants.shard_for(current_user.id, write=True)
+    media_docs = await media.receive_uploads(request, current_user.id, object_storage)
+    if not media_docs:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    await shard.db.media.insert_many(media_docs)
+    for media_doc in media_docs:
+        media_doc.pop("_id", None)
+    return ORJSONResponse(media_docs)
+
+@api_router.get("/media/{media_id}")
+async def get_media(media_id: str):
+    # Media URLs carry no user id; served with year-long cache headers, so rarely hit
+    media_doc = await tenants.find_one_any(
+        "media", {"id": media_id}, {"_id": 0, "user_id": 1, "content_type": 1}, public=True
+    )
+    if not media_doc:
+        raise HTTPException(status_code=404, detail="Media not found")
+    key = storage.media_key(media_doc["user_id"], media_id)
+    url = object_storage.url(key)
+    if url:
+        return RedirectResponse(url, status_code=302)
+    headers = {"Cache-Control": media.MEDIA_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    if media_doc["content_type"] not in media.ALLOWED_CONTENT_TYPES:
+        # Files stored before the type check (e.g. SVG) must not render on our origin
+        headers.update({"Content-Disposition": "attachment", "Content-Security-Policy": "sandbox"})
+    return FileResponse(
+        object_storage.local_path(key),
+        media_type=media_doc["content_type"],
+        headers=headers,
+    )
+
 # Website Routes
 @api_router.post("/websites", response_model=Website)
 async def create_website(website: WebsiteCreate, current_user: User = Depends(get_current_user)):
+    await check_media_references(current_user.id, website.dict())
+    
     # Generate slug
     slug = slugify(website.business_name)
     
     # Check if slug already exists for this user
-    existing_website = await db.websites.find_one({"user_id": current_user.id, "slug": slug})
+    shard = await tenants.shard_for(current_user.id, write=True)
+    existing_website = await shard.db.websites.find_one({"user_id": current_user.id, "slug": slug})
     if existing_website:
         slug = f"{slug}-{uuid.uuid4().hex[:8]}"
     
@@ -524,27 +662,45 @@ async def create_website(website: WebsiteCreate, current_user: User = Depends(ge
         address=website.address,
         logo_base64=website.logo_base64,
         hero_image_base64=website.hero_image_base64,
+        logo_media_id=website.logo_media_id,
+        hero_image_media_id=website.hero_image_media_id,
         products=website.products,
         colors=website.colors,
         social_links=website.social_links,
         slug=slug
     )
     
-    await db.websites.insert_one(website_data.dict())
+    website_doc = website_data.dict()
+    await shard.db.websites.insert_one(website_doc)
+    website_doc.pop("_id", None)
+    await website_revisions.record(website_doc)
     
-    return website_data
+    # Already validated above; skip response_model revalidation
+    return ORJSONResponse(website_doc)
 
 @api_router.get("/websites", response_model=List[Website])
 async def get_user_websites(current_user: User = Depends(get_current_user)):
-    websites = await db.websites.find({"user_id": current_user.id, "is_active": True}).to_list(100)
-    return [Website(**website) for website in websites]
+    shard = await tenants.shard_for(current_user.id)
+    websites = await shard.db.websites.find(
+        {"user_id": current_user.id, "is_active": True}, WEBSITE_PROJECTION
+    ).to_list(100)
+    return ORJSONResponse(websites)
+
+@api_router.get("/websites/deleted", response_model=List[Website])
+async def get_deleted_websites(current_user: User = Depends(get_current_user)):
+    shard = await tenants.shard_for(current_user.id)
+    websites = await website_archivers[shard.name].list_deleted(current_user.id, WEBSITE_PROJECTION)
+    return ORJSONResponse(websites)
 
 @api_router.get("/websites/{website_id}", response_model=Website)
 async def get_website(website_id: str, current_user: User = Depends(get_current_user)):
-    website = await db.websites.find_one({"id": website_id, "user_id": current_user.id})
+    shard = await tenants.shard_for(current_user.id)
+    website = await shard.db.websites.find_one(
+        {"id": website_id, "user_id": current_user.id}, WEBSITE_PROJECTION
+    )
     if not website:
         raise HTTPException(status_code=404, detail="Website not found")
-    return Website(**website)
+    return ORJSONResponse(website)
 
 @api_router.put("/websites/{website_id}", response_model=Website)
 async def update_website(
@@ -552,62 +708,560 @@ async def update_website(
     website_update: WebsiteUpdate, 
     current_user: User = Depends(get_current_user)
 ):
-    website = await db.websites.find_one({"id": website_id, "user_id": current_user.id})
-    if not website:
-        raise HTTPException(status_code=404, detail="Website not found")
-    
     # Update fields
     update_data = website_update.dict(exclude_unset=True)
+    await check_media_references(current_user.id, update_data)
+    if update_data.get("custom_domain"):
+        update_data["custom_domain"] = normalize_domain(update_data["custom_domain"])
+        if update_data["custom_domain"] is None:
+            raise HTTPException(status_code=400, detail="Invalid custom domain")
+    elif "custom_domain" in update_data:
+        update_data["custom_domain"] = None
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.websites.update_one(
-        {"id": website_id, "user_id": current_user.id},
-        {"$set": update_data}
-    )
+    shard = await tenants.shard_for(current_user.id, write=True)
+    try:
+        if update_data.get("custom_domain"):
+            await get_owned_website_id(website_id, current_user.id)
+            # Domains are unique across shards, so they're claimed in the tenant directory
+            await tenants.claim_domain(update_data["custom_domain"], website_id, current_user.id)
+        updated_website = await shard.db.websites.find_one_and_update(
+            {"id": website_id, "user_id": current_user.id},
+            {"$set": update_data},
+            projection=WEBSITE_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Custom domain is already in use")
+    if not updated_website:
+        raise HTTPException(status_code=404, detail="Website not found")
+    if "custom_domain" in update_data and not update_data["custom_domain"]:
+        await tenants.release_domain(website_id)
     
-    updated_website = await db.websites.find_one({"id": website_id, "user_id": current_user.id})
-    return Website(**updated_website)
+    await website_revisions.record(updated_website, update_data)
+    await page_cache.invalidate_tags([f"website:{website_id}"])
+    await job_queue.enqueue("regenerate_site", website_id=website_id, user_id=current_user.id,
+                            priority=jobs.PRIORITY_LOW)
+    if "custom_domain" in update_data:
+        domain_map.set(
+            update_data["custom_domain"], website_id, current_user.id, current_user.email, updated_website["slug"]
+        )
+    
+    return ORJSONResponse(updated_website)
 
 @api_router.delete("/websites/{website_id}")
 async def delete_website(website_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.websites.update_one(
+    shard = await tenants.shard_for(current_user.id, write=True)
+    result = await shard.db.websites.update_one(
         {"id": website_id, "user_id": current_user.id},
-        {"$set": {"is_active": False}}
+        {"$set": {"is_active": False, "deleted_at": datetime.utcnow(), "custom_domain": None}}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Website not found")
+    await page_cache.invalidate_tags([f"website:{website_id}"])
+    await tenants.release_domain(website_id)
+    domain_map.remove(website_id)
     return {"message": "Website deleted successfully"}
 
+# Revision History Routes
+async def get_owned_website_id(website_id: str, user_id: str) -> str:
+    shard = await tenants.shard_for(user_id)
+    website = await shard.db.websites.find_one({"id": website_id, "user_id": user_id}, {"_id": 1})
+    if not website:
+        raise HTTPException(status_code=404, detail="Website not found")
+    return website_id
+
+@api_router.get("/websites/{website_id}/revisions")
+async def list_website_revisions(website_id: str, current_user: User = Depends(get_current_user)):
+    await get_owned_website_id(website_id, current_user.id)
+    return ORJSONResponse(await website_revisions.list(website_id))
+
+@api_router.get("/websites/{website_id}/revisions/{number}")
+async def get_website_revision(website_id: str, number: int, current_user: User = Depends(get_current_user)):
+    await get_owned_website_id(website_id, current_user.id)
+    state = await website_revisions.state_at(website_id, number)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return ORJSONResponse({"number": number, "content": state})
+
+@api_router.post("/websites/{website_id}/revisions/{number}/restore", response_model=Website)
+async def restore_website_revision(website_id: str, number: int, current_user: User = Depends(get_current_user)):
+    await get_owned_website_id(website_id, current_user.id)
+    state = await website_revisions.state_at(website_id, number)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    shard = await tenants.shard_for(current_user.id, write=True)
+    updated_website = await shard.db.websites.find_one_and_update(
+        {"id": website_id, "user_id": current_user.id},
+        {"$set": {**state, "updated_at": datetime.utcnow()}},
+        projection=WEBSITE_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not updated_website:
+        raise HTTPException(status_code=404, detail="Website not found")
+    
+    await website_revisions.record(updated_website, state, restored_from=number)
+    await page_cache.invalidate_tags([f"website:{website_id}"])
+    await job_queue.enqueue("regenerate_site", website_id=website_id, user_id=current_user.id,
+                            priority=jobs.PRIORITY_LOW)
+    return ORJSONResponse(updated_website)
+
+async def slug_taken(user_id: str, slug: str) -> bool:
+    shard = await tenants.shard_for(user_id)
+    return await shard.db.websites.find_one({"user_id": user_id, "slug": slug}, {"_id": 1}) is not None
+
+@api_router.post("/websites/{website_id}/restore", response_model=Website)
+async def restore_website(website_id: str, current_user: User = Depends(get_current_user)):
+    shard = await tenants.shard_for(current_user.id, write=True)
+    website = await website_archivers[shard.name].restore(website_id, current_user.id, slug_taken)
+    if not website:
+        raise HTTPException(status_code=404, detail="Website not found")
+    await page_cache.invalidate_tags([f"website:{website_id}"])
+    return ORJSONResponse({field: website.get(field) for field in Website.model_fields})
+
 # Website Hosting Routes
 @api_router.get("/websites/{website_id}/preview", response_class=HTMLResponse)
 async def preview_website(website_id: str, current_user: User = Depends(get_current_user)):
-    website = await db.websites.find_one({"id": website_id, "user_id": current_user.id})
+    shard = await tenants.shard_for(current_user.id)
+    website = await shard.db.websites.find_one({"id": website_id, "user_id": current_user.id})
     if not website:
         raise HTTPException(status_code=404, detail="Website not found")
     
-    website_obj = Website(**website)
+    website_obj = website_from_doc(website)
     html_content = generate_website_html(website_obj)
     return HTMLResponse(content=html_content)
 
-@api_router.get("/sites/{username}/{slug}", response_class=HTMLResponse)
-async def serve_website(username: str, slug: str):
+def _preview_context(website: dict):
+    website_obj = website_from_doc(website)
+    template = site_templates.registry.get(website_obj.industry)
+    return template, _template_context(website_obj, template, storage_media_url, preview=True)
+
+# Fields a preview edit may change; the domain doesn't affect the rendered page
+PREVIEW_FIELDS = set(REVISIONED_FIELDS)
+
+@api_router.websocket("/websites/{website_id}/preview/live")
+async def live_preview(websocket: WebSocket, website_id: str, token: str = ""):
+    """Builder preview session: edits in, changed sections out (see preview.py)."""
+    user = await user_from_token(token)
+    website = None
+    if user is not None:
+        shard = await tenants.shard_for(user["id"])
+        website = await shard.db.websites.find_one({"id": website_id, "user_id": user["id"]}, WEBSITE_PROJECTION)
+    if not website:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    session = preview.PreviewSession(website, _preview_context, fragment_cache)
+    await websocket.send_json({"type": "page", "html": session.page()})
+    try:
+        while True:
+            message = await asyncio.wait_for(websocket.receive_json(), preview.PREVIEW_IDLE_SECONDS)
+            if not isinstance(message, dict):
+                raise ValueError("Expected a JSON object")
+            seq = message.get("seq")
+            if message.get("type") == "reload":
+                shard = await tenants.shard_for(user["id"])
+                website = await shard.db.websites.find_one({"id": website_id, "user_id": user["id"]}, WEBSITE_PROJECTION)
+                if not website:
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                    return
+                session.reset(website)
+                await websocket.send_json({"type": "page", "seq": seq, "html": session.page()})
+                continue
+            if message.get("type") != "update" or not isinstance(message.get("changes"), dict):
+                await websocket.send_json({"type": "error", "seq": seq, "detail": "Unknown message"})
+                continue
+            
+            try:
+                changes = WebsiteUpdate(**message["changes"]).dict(exclude_unset=True)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "seq": seq, "detail": e.errors(include_url=False, include_context=False)})
+                continue
+            try:
+                patches = session.apply({k: v for k, v in changes.items() if k in PREVIEW_FIELDS})
+            except ValidationError as e:
+                # E.g. a required field cleared mid-edit; the session keeps the last valid state
+                await websocket.send_json({"type": "error", "seq": seq, "detail": e.errors(include_url=False, include_context=False)})
+                continue
+            if patches is None:
+                await websocket.send_json({"type": "page", "seq": seq, "html": session.page()})
+            else:
+                await websocket.send_json({"type": "patch", "seq": seq, "patches": patches})
+    except WebSocketDisconnect:
+        pass
+    except asyncio.TimeoutError:
+        await websocket.close(code=status.WS_1000_NORMAL_CLOSURE)
+    except ValueError:
+        # Malformed JSON from the client
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+
+def page_cache_key(username: str, slug: str) -> str:
+    return f"page:{username}:{slug}"
+
+async def get_cached_site_page(username: str, slug: str) -> Optional[str]:
+    cached = await page_cache.get(page_cache_key(username, slug))
+    if cached is None:
+        return None
+    # Entries are prefixed with the template version they were rendered with
+    cache_version, _, html_content = cached.partition("\n")
+    if site_templates.registry.by_cache_version(cache_version) is None:
+        return None
+    return html_content
+
+async def render_site_page(user: dict, website: dict, generation: Optional[int] = None) -> str:
+    """Render a public site page and store it in the page cache.
+
+    ``generation`` is ``page_cache.generation`` from before ``website`` was
+    read; if anything was invalidated since, the page may predate that edit
+    and is returned without being cached.
+    """
+    website_obj = website_from_doc(website)
+    template = site_templates.registry.get(website_obj.industry)
+    html_content = optimize_site_html(generate_website_html(website_obj))
+    if generation is not None and page_cache.generation != generation:
+        return html_content
+    await page_cache.set(
+        page_cache_key(user["email"], website_obj.slug),
+        f"{template.cache_version}\n{html_content}",
+        ttl=PAGE_CACHE_TTL,
+        tags=[
+            ALL_PAGES_TAG,
+            f"website:{website_obj.id}",
+            f"user:{user['id']}",
+            document_tag("websites", website["_id"]),
+            document_tag("users", user["_id"]),
+        ],
+    )
+    return html_content
+
+async def rerender_changed_website(website: dict, generation: Optional[int] = None) -> Optional[str]:
+    shard = await tenants.shard_for(website["user_id"])
+    user = await shard.db.users.find_one({"id": website["user_id"]})
+    if user:
+        return await render_site_page(user, website, generation)
+    return None
+
+async def load_site_page(username: str, slug: str) -> str:
+    """Render a public page from Mongo; raises 404 if the user or site doesn't exist."""
+    generation = page_cache.generation
     # Find user by username (email for now)
-    user = await db.users.find_one({"email": username})
+    tenant = await tenants.find_by_email(username)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_id, shard = tenant
+    user = await shard.public_db.users.find_one({"id": user_id})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Find website by slug
-    website = await db.websites.find_one({"user_id": user["id"], "slug": slug, "is_active": True})
+    website = await shard.public_db.websites.find_one({"user_id": user["id"], "slug": slug, "is_active": True})
     if not website:
         raise HTTPException(status_code=404, detail="Website not found")
     
-    website_obj = Website(**website)
-    html_content = generate_website_html(website_obj)
+    return await render_site_page(user, website, generation)
+
+@api_router.get("/sites/{username}/{slug}", response_class=HTMLResponse)
+async def serve_website(username: str, slug: str):
+    html_content = await get_cached_site_page(username, slug)
+    if html_content is None:
+        html_content = await site_renders.do(
+            page_cache_key(username, slug), lambda: load_site_page(username, slug)
+        )
+    site_visits.hit(username, slug)
     return HTMLResponse(content=html_content)
 
+async def load_custom_domain_page(target) -> Optional[str]:
+    generation = page_cache.generation
+    shard = await tenants.shard_for(target.user_id)
+    website = await shard.public_db.websites.find_one({"id": target.website_id, "is_active": True})
+    if not website:
+        return None
+    user = await shard.public_db.users.find_one({"id": website["user_id"]})
+    if not user:
+        return None
+    return await render_site_page(user, website, generation)
+
+async def serve_custom_domain(target) -> Optional[str]:
+    html_content = await get_cached_site_page(target.username, target.slug)
+    if html_content is None:
+        html_content = await site_renders.do(
+            ("domain", target.website_id), lambda: load_custom_domain_page(target)
+        )
+    if html_content is not None:
+        site_visits.hit(target.username, target.slug)
+    return html_content
+
+async def popular_site_pages() -> List[tuple]:
+    """Most visited pages, then each shard's most recently updated ones."""
+    pages = await site_visits.top(site_warmup.SITE_PRERENDER_TOP_N)
+    for shard in tenants.all():
+        websites = await shard.public_db.websites.find(
+            {"is_active": True}, {"_id": 0, "user_id": 1, "slug": 1}
+        ).sort("updated_at", -1).limit(site_warmup.SITE_PRERENDER_RECENT).to_list(None)
+        owners = {
+            user["id"]: user["email"]
+            async for user in shard.public_db.users.find(
+                {"id": {"$in": list({website["user_id"] for website in websites})}}, {"_id": 0, "id": 1, "email": 1}
+            )
+        }
+        pages.extend(
+            (owners[website["user_id"]], website["slug"]) for website in websites if website["user_id"] in owners
+        )
+    return list(dict.fromkeys(pages))
+
+async def site_page_cached(username: str, slug: str) -> bool:
+    return await get_cached_site_page(username, slug) is not None
+
+async def prerender_site_page(username: str, slug: str):
+    # Through the single-flight, so requests arriving meanwhile wait for this render
+    await site_renders.do(page_cache_key(username, slug), lambda: load_site_page(username, slug))
+
+# Fills the page cache with popular pages after a deploy or restart
+site_warmer = site_warmup.SiteWarmer(popular_site_pages, site_page_cached, prerender_site_page)
+
+# Background Jobs
+async def regenerate_site_job(job: dict, ctx: jobs.JobContext):
+    generation = page_cache.generation
+    shard = await tenants.shard_for(job["user_id"])
+    website = await shard.db.websites.find_one({"id": job["website_id"], "is_active": True})
+    if not website:
+        return {"rendered": False}
+    html_content = await rerender_changed_website(website, generation)
+    if html_content is not None and STORAGE_PUBLISH_PAGES:
+        published = site_export.absolute_api_links(html_content, API_URL)
+        await object_storage.put_bytes(
+            storage.page_key(website["id"]), published.encode("utf-8"),
+            "text/html; charset=utf-8", cache_control=f"public, max-age={PAGE_CACHE_TTL}",
+        )
+    return {"rendered": html_content is not None}
+
+async def export_site_job(job: dict, ctx: jobs.JobContext):
+    shard = await tenants.shard_for(job["user_id"])
+    website = await shard.db.websites.find_one({"id": job["website_id"], "user_id": job["user_id"]})
+    if not website:
+        raise ValueError("Website not found")
+    website_obj = website_from_doc(website)
+    html_content = optimize_site_html(generate_website_html(website_obj, media_url=site_export.export_media_url))
+    css = site_stylesheets.get(site_stylesheets.stylesheet_for(website_obj.colors)) or ""
+    
+    media_ids = {website_obj.logo_media_id, website_obj.hero_image_media_id}
+    media_ids.update(product.get("image_media_id") for product in website_obj.products)
+    media_ids.discard(None)
+    media_files = {}
+    for media_id in media_ids:
+        data = await object_storage.get_bytes(storage.media_key(website_obj.user_id, media_id))
+        if data is not None:
+            media_files[media_id] = data
+    
+    key = storage.export_key(website_obj.id)
+    path = object_storage.staging_path(key)
+    await asyncio.to_thread(site_export.write_site_archive, path, html_content, css, media_files, API_URL)
+    size = path.stat().st_size
+    await object_storage.commit(key, path, "application/zip")
+    return {"key": key, "size": size}
+
+PRODUCT_SHOWCASE_LIMIT = 6
+
+async def import_products_job(job: dict, ctx: jobs.JobContext):
+    shard = await tenants.shard_for(job["user_id"], write=True)
+    result = await catalog_import.run_import(shard.db, object_storage, job, ctx)
+    if result["imported"] and job["payload"].get("showcase"):
+        # The generated page shows the first products of the catalog
+        products = await shard.db.products.find(
+            {"website_id": job["website_id"]}, {"_id": 0, "name": 1, "description": 1, "price": 1}
+        ).sort("position", 1).limit(PRODUCT_SHOWCASE_LIMIT).to_list(None)
+        updated_website = await shard.db.websites.find_one_and_update(
+            {"id": job["website_id"], "user_id": job["user_id"]},
+            {"$set": {"products": products, "updated_at": datetime.utcnow()}},
+            projection=WEBSITE_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated_website:
+            await website_revisions.record(updated_website, {"products": products})
+            await page_cache.invalidate_tags([f"website:{job['website_id']}"])
+    return result
+
+job_queue.register("regenerate_site", regenerate_site_job)
+job_queue.register("export_site", export_site_job)
+job_queue.register("import_products", import_products_job)
+
+# Product Catalog Routes
+PRODUCT_IMPORT_UPLOADS = media.UploadPolicy(
+    catalog_import.IMPORT_CONTENT_TYPES, catalog_import.MAX_IMPORT_FILE_BYTES, 1, storage.import_key
+)
+
+@api_router.post("/websites/{website_id}/products/import", status_code=202)
+async def import_products(
+    website_id: str,
+    request: Request,
+    mode: str = "merge",
+    showcase: bool = True,
+    current_user: User = Depends(get_current_user),
+):
+    if mode not in ("merge", "replace"):
+        raise HTTPException(status_code=400, detail="mode must be 'merge' or 'replace'")
+    await get_owned_website_id(website_id, current_user.id)
+    
+    uploads = await media.receive_uploads(request, current_user.id, object_storage, PRODUCT_IMPORT_UPLOADS)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    upload = uploads[0]
+    key = storage.import_key(current_user.id, upload["id"])
+    if catalog_import.file_format(upload["filename"]) is None:
+        await object_storage.delete(key)
+        raise HTTPException(status_code=400, detail="Upload a .csv or .xlsx file")
+    
+    job = await job_queue.enqueue(
+        "import_products", website_id=website_id, user_id=current_user.id,
+        payload={"key": key, "filename": upload["filename"], "mode": mode, "showcase": showcase},
+        priority=jobs.PRIORITY_HIGH, rerun=False,
+    )
+    if job["payload"].get("key") != key:
+        await object_storage.delete(key)
+        raise HTTPException(status_code=409, detail="An import is already in progress for this website")
+    return ORJSONResponse(job, status_code=202)
+
+@api_router.get("/websites/{website_id}/products")
+async def list_products(website_id: str, skip: int = 0, limit: int = 100,
+                        current_user: User = Depends(get_current_user)):
+    await get_owned_website_id(website_id, current_user.id)
+    shard = await tenants.shard_for(current_user.id)
+    products = await shard.db.products.find(
+        {"website_id": website_id}, catalog_import.PRODUCT_PROJECTION
+    ).sort("position", 1).skip(max(0, skip)).limit(max(1, min(limit, 1000))).to_list(None)
+    return ORJSONResponse(products)
+
+# Inquiry Routes
+@api_router.post("/websites/{website_id}/inquiries", status_code=202)
+async def create_inquiry(website_id: str, inquiry: InquiryCreate):
+    """Contact form submissions from a published site; the owner is notified by email.
+
+    Resubmitting a message whose notification is still pending (a double
+    submit) is accepted but stores nothing, with or without transactions.
+    """
+    # Posted from public pages that only know the website id, so look it up on every shard
+    website = await tenants.find_one_any(
+        "websites", {"id": website_id, "is_active": True},
+        {"_id": 0, "id": 1, "user_id": 1, "business_name": 1, "contact_email": 1}, public=True,
+    )
+    if not website:
+        raise HTTPException(status_code=404, detail="Website not found")
+    shard = await tenants.shard_for(website["user_id"], write=True)
+    inquiry_doc = {
+        "id": str(uuid.uuid4()),
+        "website_id": website_id,
+        "user_id": website["user_id"],
+        **inquiry.dict(),
+        "created_at": datetime.utcnow(),
+    }
+    written = await outboxes[shard.name].write(
+        [emails.inquiry_notification(website, inquiry_doc)],
+        lambda session: shard.db.inquiries.insert_one(inquiry_doc, session=session),
+    )
+    if written:
+        mail_dispatcher.wake()
+    else:
+        # A transaction rolled the duplicate back; without one it was stored, so drop it
+        await shard.db.inquiries.delete_one({"id": inquiry_doc["id"]})
+    return {"detail": "Message received"}
+
+@api_router.get("/websites/{website_id}/inquiries")
+async def list_inquiries(website_id: str, skip: int = 0, limit: int = 50,
+                         current_user: User = Depends(get_current_user)):
+    await get_owned_website_id(website_id, current_user.id)
+    shard = await tenants.shard_for(current_user.id)
+    inquiries = await shard.db.inquiries.find({"website_id": website_id}, {"_id": 0}) \
+        .sort("created_at", -1).skip(max(0, skip)).limit(max(1, min(limit, 200))).to_list(None)
+    return ORJSONResponse(inquiries)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await job_queue.get(job_id, user_id=current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return ORJSONResponse(job)
+
+@api_router.get("/websites/{website_id}/jobs")
+async def list_website_jobs(website_id: str, current_user: User = Depends(get_current_user)):
+    await get_owned_website_id(website_id, current_user.id)
+    return ORJSONResponse(await job_queue.list_for_website(website_id))
+
+@api_router.post("/websites/{website_id}/export", status_code=202)
+async def export_website(website_id: str, current_user: User = Depends(get_current_user)):
+    await get_owned_website_id(website_id, current_user.id)
+    job = await job_queue.enqueue("export_site", website_id=website_id, user_id=current_user.id)
+    return ORJSONResponse(job, status_code=202)
+
+@api_router.get("/websites/{website_id}/export")
+async def download_website_export(website_id: str, current_user: User = Depends(get_current_user)):
+    shard = await tenants.shard_for(current_user.id)
+    website = await shard.db.websites.find_one({"id": website_id, "user_id": current_user.id}, {"_id": 0, "slug": 1})
+    exported = await db.jobs.find_one(
+        {"website_id": website_id, "type": "export_site", "status": jobs.SUCCEEDED}, {"_id": 1}
+    )
+    if not website or not exported:
+        raise HTTPException(status_code=404, detail="Export not found")
+    
+    key = storage.export_key(website_id)
+    filename = f"{website['slug']}.zip"
+    url = object_storage.url(key, filename=filename)
+    if url:
+        return RedirectResponse(url, status_code=302)
+    return FileResponse(object_storage.local_path(key), media_type="application/zip", filename=filename)
+
+# Admin Routes
+@api_router.get("/admin/stats")
+async def get_admin_stats(admin: User = Depends(get_current_admin)):
+    return Response(await admin_stats.overview(), media_type="application/json")
+
+@api_router.get("/admin/stats/storage")
+async def get_admin_storage_stats(skip: int = 0, limit: int = 50, admin: User = Depends(get_current_admin)):
+    limit = max(1, min(limit, 500))
+    return Response(await admin_stats.storage(max(0, skip), limit), media_type="application/json")
+
+@api_router.get("/admin/storage/compaction")
+async def get_compaction_report(admin: User = Depends(get_current_admin)):
+    return ORJSONResponse({
+        name: await archiver.compaction_report() for name, archiver in website_archivers.items()
+    })
+
+# Generated site assets
+@api_router.get("/assets/site-css/{palette_hash}.css")
+async def serve_site_css(palette_hash: str, colors: Optional[str] = None):
+    css = site_stylesheets.get(palette_hash, colors)
+    if css is None:
+        raise HTTPException(status_code=404, detail="Stylesheet not found")
+    return Response(
+        content=css,
+        media_type="text/css",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+# Operational metrics
+@api_router.get("/metrics/mongo-pool")
+async def mongo_pool_metrics(admin: User = Depends(get_current_admin)):
+    return pool_metrics.snapshot(mongo_client_options.get("maxPoolSize", 100))
+
+@app.exception_handler(tenancy.TenantMovingError)
+async def tenant_moving_handler(request: Request, exc: tenancy.TenantMovingError):
+    return ORJSONResponse(
+        {"detail": "Your account is being migrated; try again shortly"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(CustomDomainMiddleware, domain_map=domain_map, serve=serve_custom_domain)
+
+app.add_middleware(tracing.TracingMiddleware)
+
+# Inside CORS so browsers can read 429 responses and their Retry-After
+app.add_middleware(ratelimit.RateLimitMiddleware, limiter=rate_limiter)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -623,6 +1277,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Keeps cached pages in sync with writes made outside the API (needs a replica set)
+change_stream_invalidators = []
+for shard in tenants.all():
+    invalidator = ChangeStreamInvalidator(shard.db, page_cache, rerender=rerender_changed_website)
+    invalidator.add_listener(functools.partial(domain_map.apply_change, db=shard.db))
+    change_stream_invalidators.append(invalidator)
+
+# Start-up work that needs Mongo/Redis or warms render caches runs after the
+# first health check, so workers accept connections as soon as imports finish
+warm_up = WarmUp()
+
+@warm_up.step("mongo")
+async def warm_mongo_pool():
+    await client.admin.command("ping")
+
+@warm_up.step("page_cache")
+async def start_page_cache():
+    await page_cache.start()
+    if CHANGE_STREAMS_ENABLED:
+        for invalidator in change_stream_invalidators:
+            invalidator.start()
+
+@warm_up.step("indexes")
+async def ensure_indexes():
+    await tenants.ensure_indexes()
+    await admin_stats.ensure_indexes()
+    await website_revisions.ensure_indexes()
+    await job_queue.ensure_indexes()
+    await site_visits.ensure_indexes()
+    for shard in tenants.all():
+        await website_archivers[shard.name].ensure_indexes()
+        await catalog_import.ensure_indexes(shard.db)
+        await outboxes[shard.name].ensure_indexes()
+        await shard.db.inquiries.create_index([("website_id", 1), ("created_at", -1)])
+        await shard.db.websites.create_index([("is_active", 1), ("updated_at", -1)])
+    await domain_map.ensure_index()
+
+@warm_up.step("domain_map")
+async def load_domain_map():
+    await domain_map.load()
+    domain_map.start_refresh()
+
+@warm_up.step("background_workers")
+def start_background_workers():
+    job_queue.start()
+    mail_dispatcher.start()
+    for archiver in website_archivers.values():
+        archiver.start()
+
+@warm_up.step("site_templates")
+def warm_site_templates():
+    site_templates.registry.compile_all()
+    site_stylesheets.load_classes()
+
+@warm_up.step("site_pages")
+def start_site_warmer():
+    # Runs in the background; health reports ready without waiting for it
+    site_visits.start()
+    site_warmer.start()
+
+@app.get("/api/health")
+async def health():
+    warm_up.trigger()
+    return warm_up.status()
+
+@app.on_event("startup")
+async def schedule_warm_up():
+    warm_up.schedule_fallback()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await warm_up.cancel()
+    if warm_up.started:
+        if CHANGE_STREAMS_ENABLED:
+            for invalidator in change_stream_invalidators:
+                await invalidator.stop()
+        await job_queue.stop()
+        await mail_dispatcher.stop()
+        await site_warmer.stop()
+        await site_visits.stop()
+    await domain_map.stop_refresh()
+    for archiver in website_archivers.values():
+        await archiver.stop()
+    await page_cache.close()
+    await rate_limiter.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,333 @@
+"""Static, purged CSS for generated websites.
+
+Generated pages used to load the Tailwind CDN script and compile their styles
+in every visitor's browser. Instead, the backend builds one minified stylesheet
+per color scheme containing only the utility classes the page template uses.
+Stylesheets are content-addressed by a hash of the palette, so every site with
+the same colors shares the same file. Only saved websites' stylesheets are
+written to disk; those for unsaved live-preview palettes live in a bounded
+in-memory cache and are rebuilt from the colors in their URL on a miss.
+"""
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from cache import InProcessCache
+
+DEFAULT_COLORS = {
+    "primary": "#3B82F6",
+    "secondary": "#1E40AF",
+    "accent": "#F59E0B",
+}
+
+CSS_OUTPUT_DIR = Path(os.environ.get(
+    'SITE_CSS_DIR', Path(__file__).parent / 'generated' / 'site-css'
+))
+
+SITE_CSS_CACHE_ENTRIES = int(os.environ.get('SITE_CSS_CACHE_ENTRIES', '256'))
+
+_HEX_COLOR = re.compile(r'^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})$')
+_CLASS_ATTR = re.compile(r'class="([^"]*)"')
+
+_BREAKPOINTS = [("sm", "640px"), ("md", "768px"), ("lg", "1024px")]
+_PSEUDO_VARIANTS = {"hover": ":hover", "focus": ":focus"}
+
+_GRAYS = {
+    "50": "249 250 251",
+    "100": "243 244 246",
+    "200": "229 231 235",
+    "400": "156 163 175",
+    "600": "75 85 99",
+    "700": "55 65 81",
+    "800": "31 41 55",
+    "900": "17 24 39",
+}
+
+_SPACING = {
+    "0": "0px", "2": "0.5rem", "3": "0.75rem", "4": "1rem", "5": "1.25rem",
+    "6": "1.5rem", "8": "2rem", "10": "2.5rem", "12": "3rem", "16": "4rem",
+    "20": "5rem", "48": "12rem",
+}
+
+_FONT_SIZES = {
+    "lg": ("1.125rem", "1.75rem"),
+    "xl": ("1.25rem", "1.75rem"),
+    "2xl": ("1.5rem", "2rem"),
+    "3xl": ("1.875rem", "2.25rem"),
+    "4xl": ("2.25rem", "2.5rem"),
+    "6xl": ("3.75rem", "1"),
+}
+
+_SHADOWS = {
+    "shadow-lg": "0 10px 15px -3px rgb(0 0 0/.1),0 4px 6px -4px rgb(0 0 0/.1)",
+    "shadow-xl": "0 20px 25px -5px rgb(0 0 0/.1),0 8px 10px -6px rgb(0 0 0/.1)",
+    "shadow-2xl": "0 25px 50px -12px rgb(0 0 0/.25)",
+}
+
+_PREFLIGHT = (
+    "*,:after,:before{box-sizing:border-box;border:0 solid #e5e7eb}"
+    "html{line-height:1.5;-webkit-text-size-adjust:100%;font-family:ui-sans-serif,system-ui,"
+    "-apple-system,Segoe UI,Roboto,Helvetica Neue,Arial,sans-serif}"
+    "body{margin:0;line-height:inherit}"
+    "h1,h2,h3,h4,p,ul{margin:0}"
+    "h1,h2,h3,h4{font-size:inherit;font-weight:inherit}"
+    "ul{list-style:none;padding:0}"
+    "a{color:inherit;text-decoration:inherit}"
+    "button,input,textarea{font-family:inherit;font-size:100%;line-height:inherit;"
+    "color:inherit;margin:0;padding:0}"
+    "button{background-color:transparent;background-image:none;cursor:pointer}"
+    "textarea{resize:vertical}"
+    "img,svg{display:block;vertical-align:middle}"
+    "img{max-width:100%;height:auto}"
+    "[hidden]{display:none}"
+)
+
+
+def normalize_colors(colors: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """Return the three theme colors, falling back to defaults for missing or unsafe values."""
+    colors = colors or {}
+    normalized = {}
+    for name, default in DEFAULT_COLORS.items():
+        value = (colors.get(name) or "").strip()
+        normalized[name] = value.upper() if _HEX_COLOR.match(value) else default
+    return normalized
+
+
+def colors_query(colors: Optional[Dict[str, str]]) -> str:
+    """Query string carrying a palette, so any worker can rebuild an unsaved stylesheet."""
+    return "?colors=" + ",".join(value.lstrip('#') for value in normalize_colors(colors).values())
+
+
+def parse_colors_query(value: str) -> Dict[str, str]:
+    return dict(zip(DEFAULT_COLORS, (f"#{part}" for part in value.split(",")[:len(DEFAULT_COLORS)])))
+
+
+def palette_hash(colors: Optional[Dict[str, str]], classes: Iterable[str] = ()) -> str:
+    # The class set is part of the key so a template change never reuses a stale file
+    payload = json.dumps([normalize_colors(colors), sorted(set(classes))], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def extract_classes(html: str) -> Set[str]:
+    classes = set()
+    for value in _CLASS_ATTR.findall(html):
+        classes.update(value.split())
+    return classes
+
+
+def _hex_to_rgb(value: str) -> str:
+    value = value.lstrip('#')
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    return " ".join(str(int(value[i:i + 2], 16)) for i in (0, 2, 4))
+
+
+def _utility(name: str, colors: Dict[str, str]):
+    """Return (selector_suffix, declarations) for a bare utility, or None if unsupported."""
+    theme = {key: _hex_to_rgb(value) for key, value in colors.items()}
+
+    static = {
+        "flex": "display:flex",
+        "grid": "display:grid",
+        "hidden": "display:none",
+        "flex-wrap": "flex-wrap:wrap",
+        "items-center": "align-items:center",
+        "justify-between": "justify-content:space-between",
+        "justify-center": "justify-content:center",
+        "col-span-full": "grid-column:1/-1",
+        "sticky": "position:sticky",
+        "top-0": "top:0px",
+        "z-50": "z-index:50",
+        "mx-auto": "margin-left:auto;margin-right:auto",
+        "max-w-2xl": "max-width:42rem",
+        "max-w-7xl": "max-width:80rem",
+        "max-w-full": "max-width:100%",
+        "w-full": "width:100%",
+        "h-auto": "height:auto",
+        "object-cover": "object-fit:cover",
+        "overflow-hidden": "overflow:hidden",
+        "rounded-lg": "border-radius:0.5rem",
+        "border-2": "border-width:2px",
+        "border-t": "border-top-width:1px",
+        "text-center": "text-align:center",
+        "font-bold": "font-weight:700",
+        "font-semibold": "font-weight:600",
+        "resize-none": "resize:none",
+        "outline-none": "outline:2px solid transparent;outline-offset:2px",
+        "sr-only": "position:absolute;width:1px;height:1px;padding:0;margin:-1px;"
+                   "overflow:hidden;clip:rect(0,0,0,0);white-space:nowrap;border-width:0",
+        "transition-colors": "transition-property:color,background-color,border-color,"
+                             "fill,stroke;transition-timing-function:cubic-bezier(.4,0,.2,1);"
+                             "transition-duration:150ms",
+        "transition-shadow": "transition-property:box-shadow;"
+                             "transition-timing-function:cubic-bezier(.4,0,.2,1);"
+                             "transition-duration:150ms",
+        "bg-opacity-20": "--tw-bg-opacity:0.2",
+        "ring-2": "box-shadow:0 0 0 2px var(--tw-ring-color,rgb(59 130 246/.5))",
+        "hero-bg": f"background:linear-gradient(135deg,{colors['primary']} 0%,"
+                   f"{colors['secondary']} 100%)",
+    }
+    if name in static:
+        return "", static[name]
+    if name in _SHADOWS:
+        return "", f"box-shadow:{_SHADOWS[name]}"
+
+    match = re.match(r'^grid-cols-(\d+)$', name)
+    if match:
+        return "", f"grid-template-columns:repeat({match.group(1)},minmax(0,1fr))"
+
+    match = re.match(r'^gap-(\w+)$', name)
+    if match and match.group(1) in _SPACING:
+        return "", f"gap:{_SPACING[match.group(1)]}"
+
+    match = re.match(r'^space-([xy])-(\w+)$', name)
+    if match and match.group(2) in _SPACING:
+        side = "left" if match.group(1) == "x" else "top"
+        return ">:not([hidden])~:not([hidden])", f"margin-{side}:{_SPACING[match.group(2)]}"
+
+    match = re.match(r'^(p|px|py|pt|m|mx|my|mb|mt|mr|w|h)-(\w+)$', name)
+    if match and match.group(2) in _SPACING:
+        prop, value = match.group(1), _SPACING[match.group(2)]
+        properties = {
+            "p": ["padding"], "px": ["padding-left", "padding-right"],
+            "py": ["padding-top", "padding-bottom"], "pt": ["padding-top"],
+            "m": ["margin"], "mx": ["margin-left", "margin-right"],
+            "my": ["margin-top", "margin-bottom"], "mb": ["margin-bottom"],
+            "mt": ["margin-top"], "mr": ["margin-right"],
+            "w": ["width"], "h": ["height"],
+        }[prop]
+        return "", ";".join(f"{p}:{value}" for p in properties)
+
+    match = re.match(r'^text-(\w+)$', name)
+    if match and match.group(1) in _FONT_SIZES:
+        size, line_height = _FONT_SIZES[match.group(1)]
+        return "", f"font-size:{size};line-height:{line_height}"
+
+    match = re.match(r'^(bg|text|border)-(white|primary|secondary|accent|gray-\d+|yellow-600)$', name)
+    if match:
+        kind, color = match.groups()
+        if color == "white":
+            rgb = "255 255 255"
+        elif color == "yellow-600":
+            rgb = "202 138 4"
+        elif color.startswith("gray-"):
+            rgb = _GRAYS.get(color[5:])
+            if rgb is None:
+                return None
+        else:
+            rgb = theme[color]
+        if kind == "bg":
+            return "", f"--tw-bg-opacity:1;background-color:rgb({rgb}/var(--tw-bg-opacity))"
+        if kind == "text":
+            return "", f"color:rgb({rgb})"
+        return "", f"border-color:rgb({rgb})"
+
+    match = re.match(r'^ring-(primary|secondary|accent)$', name)
+    if match:
+        return "", f"--tw-ring-color:{colors[match.group(1)]}"
+
+    return None
+
+
+def _escape(name: str) -> str:
+    return re.sub(r'([:/.])', r'\\\1', name)
+
+
+def build_css(colors: Optional[Dict[str, str]], classes: Iterable[str]) -> str:
+    """Build a minified stylesheet containing only the given classes."""
+    colors = normalize_colors(colors)
+    base, pseudo = [], []
+    responsive = {prefix: [] for prefix, _ in _BREAKPOINTS}
+
+    # Opacity modifiers must come after the color utilities they modify.
+    for name in sorted(set(classes), key=lambda n: ("opacity" in n, n)):
+        variant, _, utility = name.rpartition(":")
+        rule = _utility(utility, colors)
+        if rule is None:
+            continue
+        suffix, declarations = rule
+        if not variant:
+            base.append(f".{_escape(name)}{suffix}{{{declarations}}}")
+        elif variant in _PSEUDO_VARIANTS:
+            pseudo.append(f".{_escape(name)}{_PSEUDO_VARIANTS[variant]}{suffix}{{{declarations}}}")
+        elif variant in responsive:
+            responsive[variant].append(f".{_escape(name)}{suffix}{{{declarations}}}")
+
+    css = [_PREFLIGHT] + base + pseudo
+    for prefix, width in _BREAKPOINTS:
+        if responsive[prefix]:
+            css.append(f"@media (min-width:{width}){{{''.join(responsive[prefix])}}}")
+    return "".join(css)
+
+
+class SiteStylesheets:
+    """Builds, caches and persists one stylesheet per palette."""
+
+    def __init__(self, output_dir: Path = CSS_OUTPUT_DIR, max_entries: int = SITE_CSS_CACHE_ENTRIES):
+        self.output_dir = Path(output_dir)
+        self.max_entries = max_entries
+        self._classes: Optional[Set[str]] = None
+        self._class_loader: Optional[Callable[[], Iterable[str]]] = None
+        self._cache = InProcessCache(max_entries)
+
+    def set_classes(self, classes: Iterable[str]):
+        self._class_loader = None
+        self._classes = set(classes)
+        self._cache = InProcessCache(self.max_entries)
+
+    def set_class_loader(self, loader: Callable[[], Iterable[str]]):
+        """Collect the class set on first use instead of at import time."""
+        self._class_loader = loader
+
+    def load_classes(self):
+        loader, self._class_loader = self._class_loader, None
+        if loader is not None:
+            self.set_classes(loader())
+
+    def stylesheet_for(self, colors: Optional[Dict[str, str]], persist: bool = True) -> str:
+        """Return the palette hash, building the stylesheet on first use.
+
+        With ``persist`` (saved websites) it is also written to disk; previews
+        only keep it in the bounded memory cache.
+        """
+        if self._class_loader is not None:
+            self.load_classes()
+        key = palette_hash(colors, self._classes or ())
+        if self._classes is None:
+            return key
+        css = self._cache.get_local(key)
+        if css is None:
+            css = build_css(colors, self._classes)
+            self._cache.set_local(key, css)
+        if persist:
+            # Also when first built for a preview and now used by a saved website
+            self._write(key, css)
+        return key
+
+    def get(self, key: str, colors: Optional[str] = None) -> Optional[str]:
+        """Stylesheet by hash; ``colors`` (a ``colors_query`` value) rebuilds a preview one."""
+        css = self._cache.get_local(key)
+        if css is not None:
+            return css
+        if not re.fullmatch(r'[0-9a-f]{16}', key):
+            return None
+        path = self.output_dir / f"{key}.css"
+        if path.exists():
+            css = path.read_text(encoding='utf-8')
+            self._cache.set_local(key, css)
+            return css
+        if colors and self.stylesheet_for(parse_colors_query(colors), persist=False) == key:
+            return self._cache.get_local(key)
+        return None
+
+    def _write(self, key: str, css: str):
+        path = self.output_dir / f"{key}.css"
+        if path.exists():
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(css, encoding='utf-8')
+        os.replace(tmp_path, path)
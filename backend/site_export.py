@@ -0,0 +1,29 @@
+"""ZIP packages of generated websites for download."""
+import re
+import zipfile
+from pathlib import Path
+from typing import Dict
+
+_STYLESHEET_URL = re.compile(r'/api/assets/site-css/[0-9a-f]+\.css')
+# Root-relative links to our API (the contact form, stylesheet, media served by the API)
+_API_LINK = re.compile(r'(\s(?:action|href|src)=")(/api/)')
+
+
+def export_media_url(user_id: str, media_id: str) -> str:
+    """Media URL used when rendering a site for export; relative to index.html."""
+    return f"media/{media_id}"
+
+
+def absolute_api_links(html: str, api_url: str) -> str:
+    """Point root-relative API links at ``api_url``, for pages served from elsewhere."""
+    return _API_LINK.sub(lambda m: f"{m.group(1)}{api_url}{m.group(2)}", html)
+
+
+def write_site_archive(path: Path, html: str, css: str, media_files: Dict[str, bytes], api_url: str):
+    """Write index.html, its stylesheet and referenced media into a ZIP at ``path``; blocking."""
+    html = absolute_api_links(_STYLESHEET_URL.sub("assets/site.css", html), api_url)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("index.html", html)
+        archive.writestr("assets/site.css", css)
+        for media_id, data in media_files.items():
+            archive.writestr(f"media/{media_id}", data)
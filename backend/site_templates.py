@@ -0,0 +1,582 @@
+"""Industry template registry for generated websites.
+
+Each industry template is a set of HTML sections built from shared partials
+plus its own copy. A template is compiled once, on first use, into plain
+``str.format_map`` strings: partials are inlined, the template's copy is baked
+in, and only per-site values remain as slots. Rendering a page is then one
+``format_map`` call per section with no parsing.
+
+Sections and fragments can be rendered through a fragment cache: each one is
+keyed by the template's cache version plus a hash of exactly the slots it
+uses, so a change to one field re-renders only the sections that read it, and
+a change to one product re-renders only that product's card.
+
+Source syntax:
+    {{ name }}        per-site value supplied at render time
+    {{ copy.key }}    template copy, substituted at compile time
+    {{> partial }}    shared (or template-overridden) partial, inlined at compile time
+"""
+import hashlib
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# Bump when a shared partial changes; every template's cache version includes it
+SHARED_VERSION = "2"
+
+DEFAULT_INDUSTRY = "ecommerce"
+
+# Page sections, in document order
+SECTIONS = ["head", "nav", "hero", "products", "about", "contact", "footer", "scripts"]
+
+_TOKEN = re.compile(r"\{\{\s*(>\s*)?([\w.]+)\s*\}\}")
+_FIELD = re.compile(r"(?<!\{)\{(\w+)\}(?!\})")
+
+_CHECK_ICON = (
+    '<svg class="w-6 h-6" fill="none" stroke="currentColor" viewBox="0 0 24 24">\n'
+    '                                        <path stroke-linecap="round" stroke-linejoin="round" '
+    'stroke-width="2" d="M5 13l4 4L19 7"></path>\n'
+    '                                    </svg>'
+)
+_CLOCK_ICON = (
+    '<svg class="w-6 h-6" fill="none" stroke="currentColor" viewBox="0 0 24 24">\n'
+    '                                        <path stroke-linecap="round" stroke-linejoin="round" '
+    'stroke-width="2" d="M12 8v4l3 3m6-3a9 9 0 11-18 0 9 9 0 0118 0z"></path>\n'
+    '                                    </svg>'
+)
+
+PARTIALS: Dict[str, str] = {
+    "head": """
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>{{ business_name }} - {{ copy.title_suffix }}</title>
+        <link rel="stylesheet" href="{{ stylesheet_href }}">
+    </head>
+    <body class="bg-gray-50">""",
+
+    "nav": """
+        <!-- Navigation -->
+        <nav class="bg-white shadow-lg sticky top-0 z-50">
+            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
+                <div class="flex justify-between items-center h-16">
+                    <div class="flex items-center">
+                        {{ logo_img }}
+                        <span class="text-xl font-bold text-gray-900">{{ business_name }}</span>
+                    </div>
+                    <div class="hidden md:flex space-x-8">
+                        <a href="#home" class="text-gray-700 hover:text-primary transition-colors">Home</a>
+                        <a href="#products" class="text-gray-700 hover:text-primary transition-colors">{{ copy.products_nav }}</a>
+                        <a href="#about" class="text-gray-700 hover:text-primary transition-colors">About</a>
+                        <a href="#contact" class="text-gray-700 hover:text-primary transition-colors">Contact</a>
+                    </div>
+                    <div class="flex items-center">
+                        <button class="bg-primary text-white px-4 py-2 rounded-lg hover:bg-secondary transition-colors">
+                            {{ copy.cart_label }} (<span id="cart-count">0</span>)
+                        </button>
+                    </div>
+                </div>
+            </div>
+        </nav>
+""",
+
+    "logo_img": '<img src="{{ src }}" alt="Logo" class="h-10 w-10 rounded-lg mr-3">',
+
+    "hero": """
+        <!-- Hero Section -->
+        <section id="home" class="hero-bg text-white py-20">
+            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
+                <div class="grid grid-cols-1 lg:grid-cols-2 gap-12 items-center">
+                    <div>
+                        <h1 class="text-4xl md:text-6xl font-bold mb-6">
+                            {{ copy.hero_greeting }} {{ business_name }}
+                        </h1>
+                        <p class="text-xl mb-8 text-gray-100">
+                            {{ business_description }}
+                        </p>
+                        <div class="flex flex-wrap gap-4">
+                            <button class="bg-accent text-white px-8 py-3 rounded-lg font-semibold hover:bg-yellow-600 transition-colors">
+                                {{ copy.hero_primary_cta }}
+                            </button>
+                            <button class="border-2 border-white text-white px-8 py-3 rounded-lg font-semibold hover:bg-white hover:text-primary transition-colors">
+                                {{ copy.hero_secondary_cta }}
+                            </button>
+                        </div>
+                    </div>
+                    <div class="flex justify-center">
+                        {{ hero_media }}
+                    </div>
+                </div>
+            </div>
+        </section>
+""",
+
+    "hero_img": '<img src="{{ src }}" alt="Hero" class="rounded-lg shadow-2xl max-w-full h-auto">',
+
+    "hero_placeholder": (
+        '<div class="bg-white bg-opacity-20 rounded-lg p-12 text-center">'
+        '<h3 class="text-2xl font-bold mb-4">Your Hero Image Here</h3>'
+        '<p>Upload a stunning hero image to showcase your business</p></div>'
+    ),
+
+    "products": """
+        <!-- Products Section -->
+        <section id="products" class="py-20 bg-white">
+            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
+                <div class="text-center mb-12">
+                    <h2 class="text-3xl md:text-4xl font-bold text-gray-900 mb-4">{{ copy.products_heading }}</h2>
+                    <p class="text-gray-600 max-w-2xl mx-auto">{{ copy.products_subheading }}</p>
+                </div>
+                <div class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-8">
+                    {{ product_cards }}
+                </div>
+            </div>
+        </section>
+""",
+
+    "product_card": """
+        <div class="bg-white rounded-lg shadow-lg overflow-hidden hover:shadow-xl transition-shadow">
+            <img src="{{ image_src }}" alt="{{ name }}" class="w-full h-48 object-cover">
+            <div class="p-6">
+                <h3 class="text-xl font-bold text-gray-900 mb-2">{{ title }}</h3>
+                <p class="text-gray-600 mb-4">{{ description }}</p>
+                <div class="flex items-center justify-between">
+                    <span class="text-2xl font-bold text-primary">${{ price }}</span>
+                    <button onclick="addToCart('{{ index }}', '{{ name }}', '{{ price }}')"
+                            class="bg-primary text-white px-6 py-2 rounded-lg hover:bg-secondary transition-colors">
+                        {{ copy.card_button }}
+                    </button>
+                </div>
+            </div>
+        </div>
+        """,
+
+    "products_empty": """
+        <div class="col-span-full text-center py-12">
+            <h3 class="text-xl font-semibold text-gray-900 mb-4">{{ copy.empty_products_heading }}</h3>
+            <p class="text-gray-600">{{ copy.empty_products_text }}</p>
+        </div>
+        """,
+
+    "about": """
+        <!-- About Section -->
+        <section id="about" class="py-20 bg-gray-50">
+            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
+                <div class="grid grid-cols-1 lg:grid-cols-2 gap-12 items-center">
+                    <div>
+                        <h2 class="text-3xl md:text-4xl font-bold text-gray-900 mb-6">About {{ business_name }}</h2>
+                        <p class="text-gray-600 mb-6">{{ business_description }}</p>
+                        <div class="grid grid-cols-1 md:grid-cols-2 gap-6">
+                            <div class="flex items-center">
+                                <div class="bg-primary text-white p-3 rounded-lg mr-4">
+                                    """ + _CHECK_ICON + """
+                                </div>
+                                <div>
+                                    <h3 class="font-semibold text-gray-900">{{ copy.feature_1_title }}</h3>
+                                    <p class="text-gray-600">{{ copy.feature_1_text }}</p>
+                                </div>
+                            </div>
+                            <div class="flex items-center">
+                                <div class="bg-primary text-white p-3 rounded-lg mr-4">
+                                    """ + _CLOCK_ICON + """
+                                </div>
+                                <div>
+                                    <h3 class="font-semibold text-gray-900">{{ copy.feature_2_title }}</h3>
+                                    <p class="text-gray-600">{{ copy.feature_2_text }}</p>
+                                </div>
+                            </div>
+                        </div>
+                    </div>
+                    <div class="bg-white p-8 rounded-lg shadow-lg">
+                        <h3 class="text-xl font-bold text-gray-900 mb-4">Get in Touch</h3>
+                        <div class="space-y-4">
+                            <div class="flex items-center">
+                                <svg class="w-5 h-5 text-primary mr-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M3 8l7.89 4.26a2 2 0 002.22 0L21 8M5 19h14a2 2 0 002-2V7a2 2 0 00-2-2H5a2 2 0 00-2 2v10a2 2 0 002 2z"></path>
+                                </svg>
+                                <span class="text-gray-600">{{ contact_email }}</span>
+                            </div>
+                            <div class="flex items-center">
+                                <svg class="w-5 h-5 text-primary mr-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M3 5a2 2 0 012-2h3.28a1 1 0 01.948.684l1.498 4.493a1 1 0 01-.502 1.21l-2.257 1.13a11.042 11.042 0 005.516 5.516l1.13-2.257a1 1 0 011.21-.502l4.493 1.498a1 1 0 01.684.949V19a2 2 0 01-2 2h-1C9.716 21 3 14.284 3 6V5z"></path>
+                                </svg>
+                                <span class="text-gray-600">{{ contact_phone }}</span>
+                            </div>
+                            <div class="flex items-center">
+                                <svg class="w-5 h-5 text-primary mr-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M17.657 16.657L13.414 20.9a1.998 1.998 0 01-2.827 0l-4.244-4.243a8 8 0 1111.314 0z"></path>
+                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 11a3 3 0 11-6 0 3 3 0 016 0z"></path>
+                                </svg>
+                                <span class="text-gray-600">{{ address }}</span>
+                            </div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </section>
+""",
+
+    "contact": """
+        <!-- Contact Section -->
+        <section id="contact" class="py-20 bg-primary text-white">
+            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
+                <div class="text-center mb-12">
+                    <h2 class="text-3xl md:text-4xl font-bold mb-4">{{ copy.contact_heading }}</h2>
+                    <p class="text-gray-200">{{ copy.contact_subheading }}</p>
+                </div>
+                <div class="max-w-2xl mx-auto">
+                    <form class="space-y-6" action="{{ inquiry_url }}" data-sent="{{ copy.contact_sent }}" data-failed="{{ copy.contact_failed }}" onsubmit="handleContactForm(event)">
+                        <div class="grid grid-cols-1 md:grid-cols-2 gap-6">
+                            <input type="text" name="name" placeholder="Your Name" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none">
+                            <input type="email" name="email" placeholder="Your Email" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none">
+                        </div>
+                        <input type="text" name="subject" placeholder="Subject" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none">
+                        <textarea name="message" placeholder="Your Message" rows="5" required class="w-full px-4 py-3 rounded-lg text-gray-900 focus:ring-2 focus:ring-accent focus:outline-none resize-none"></textarea>
+                        <button type="submit" class="w-full bg-accent text-white py-3 rounded-lg font-semibold hover:bg-yellow-600 transition-colors">
+                            Send Message
+                        </button>
+                    </form>
+                </div>
+            </div>
+        </section>
+""",
+
+    "footer": """
+        <!-- Footer -->
+        <footer class="bg-gray-900 text-white py-12">
+            <div class="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
+                <div class="grid grid-cols-1 md:grid-cols-4 gap-8">
+                    <div>
+                        <h3 class="text-xl font-bold mb-4">{{ business_name }}</h3>
+                        <p class="text-gray-400">{{ footer_description }}...</p>
+                    </div>
+                    <div>
+                        <h4 class="text-lg font-semibold mb-4">Quick Links</h4>
+                        <ul class="space-y-2 text-gray-400">
+                            <li><a href="#home" class="hover:text-white transition-colors">Home</a></li>
+                            <li><a href="#products" class="hover:text-white transition-colors">{{ copy.products_nav }}</a></li>
+                            <li><a href="#about" class="hover:text-white transition-colors">About</a></li>
+                            <li><a href="#contact" class="hover:text-white transition-colors">Contact</a></li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 class="text-lg font-semibold mb-4">Contact Info</h4>
+                        <ul class="space-y-2 text-gray-400">
+                            <li>{{ contact_email }}</li>
+                            <li>{{ contact_phone }}</li>
+                            <li>{{ address }}</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 class="text-lg font-semibold mb-4">Follow Us</h4>
+                        <div class="flex space-x-4">
+                            {{ social_links }}
+                        </div>
+                    </div>
+                </div>
+                <div class="border-t border-gray-800 mt-8 pt-8 text-center text-gray-400">
+                    <p>&copy; 2024 {{ business_name }}. All rights reserved.</p>
+                </div>
+            </div>
+        </footer>
+""",
+
+    "social_link": """
+            <a href="{{ url }}" target="_blank" class="text-gray-400 hover:text-white transition-colors">
+                <span class="sr-only">{{ platform }}</span>
+                <svg class="w-6 h-6" fill="currentColor" viewBox="0 0 24 24">
+                    <path d="M12 0C5.374 0 0 5.373 0 12s5.374 12 12 12 12-5.373 12-12S18.626 0 12 0zm5.568 8.16c-.172 1.684-.896 3.262-1.998 4.364-1.102 1.102-2.678 1.826-4.364 1.998-.546.055-1.104.055-1.65 0-1.686-.172-3.262-.896-4.364-1.998C4.09 11.422 3.366 9.846 3.194 8.16c-.055-.546-.055-1.104 0-1.65.172-1.686.896-3.262 1.998-4.364C6.294 1.044 7.87.32 9.556.148c.546-.055 1.104-.055 1.65 0 1.686.172 3.262.896 4.364 1.998 1.102 1.102 1.826 2.678 1.998 4.364.055.546.055 1.104 0 1.65z"/>
+                </svg>
+            </a>
+            """,
+
+    "scripts": """
+        <script>
+            let cart = [];
+            let cartCount = 0;
+
+            function addToCart(productId, productName, productPrice) {
+                cart.push({
+                    id: productId,
+                    name: productName,
+                    price: productPrice
+                });
+                cartCount++;
+                document.getElementById('cart-count').textContent = cartCount;
+                alert(`${productName} {{ copy.added_message }}`);
+            }
+
+            function handleContactForm(event) {
+                event.preventDefault();
+                const form = event.target;
+                fetch(form.action, {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify(Object.fromEntries(new FormData(form)))
+                }).then(response => {
+                    if (!response.ok) throw new Error(response.status);
+                    alert(form.dataset.sent);
+                    form.reset();
+                }).catch(() => alert(form.dataset.failed));
+            }
+
+            // Smooth scrolling for navigation links
+            document.querySelectorAll('a[href^="#"]').forEach(anchor => {
+                anchor.addEventListener('click', function (e) {
+                    e.preventDefault();
+                    document.querySelector(this.getAttribute('href')).scrollIntoView({
+                        behavior: 'smooth'
+                    });
+                });
+            });
+        </script>
+    </body>
+    </html>
+    """,
+}
+
+# Fragments rendered on their own (per product, per link, ...) rather than as page sections
+FRAGMENTS = ["logo_img", "hero_img", "hero_placeholder", "product_card", "products_empty", "social_link"]
+
+BASE_COPY = {
+    "title_suffix": "Professional eCommerce Store",
+    "hero_greeting": "Welcome to",
+    "hero_primary_cta": "Shop Now",
+    "hero_secondary_cta": "Learn More",
+    "products_nav": "Products",
+    "products_heading": "Our Products",
+    "products_subheading": "Discover our amazing collection of premium products",
+    "empty_products_heading": "No products yet",
+    "empty_products_text": "Add products to showcase them here",
+    "cart_label": "Cart",
+    "card_button": "Add to Cart",
+    "added_message": "added to cart!",
+    "feature_1_title": "Quality Products",
+    "feature_1_text": "Premium quality guaranteed",
+    "feature_2_title": "Fast Delivery",
+    "feature_2_text": "Quick and reliable shipping",
+    "contact_heading": "Contact Us",
+    "contact_subheading": "Ready to get started? Send us a message!",
+    "contact_sent": "Thank you for your message! We will get back to you soon.",
+    "contact_failed": "Sorry, your message could not be sent. Please email us instead.",
+}
+
+
+class CompiledTemplate:
+    """A section compiled to a format string with only per-site slots left."""
+
+    __slots__ = ("format_string", "slots", "_format_map")
+
+    def __init__(self, format_string: str):
+        self.format_string = format_string
+        self.slots = frozenset(_FIELD.findall(format_string))
+        self._format_map = format_string.format_map
+
+    def render(self, context: Dict[str, str]) -> str:
+        return self._format_map(context)
+
+    def inputs_hash(self, context: Dict[str, str]) -> str:
+        """Hash of the context values this section reads; other keys don't affect it."""
+        digest = hashlib.blake2b(digest_size=16)
+        for slot in sorted(self.slots):
+            digest.update(str(context[slot]).encode("utf-8", "surrogatepass"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+
+def _escape_braces(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def compile_source(source: str, partials: Dict[str, str], copy: Dict[str, str], depth: int = 0) -> str:
+    """Inline partials and copy, returning a str.format string."""
+    if depth > 10:
+        raise ValueError("Template partials nested too deeply")
+    out: List[str] = []
+    position = 0
+    for match in _TOKEN.finditer(source):
+        out.append(_escape_braces(source[position:match.start()]))
+        is_partial, name = match.group(1), match.group(2)
+        if is_partial:
+            out.append(compile_source(partials[name], partials, copy, depth + 1))
+        elif name.startswith("copy."):
+            out.append(_escape_braces(copy[name[5:]]))
+        else:
+            out.append("{" + name + "}")
+        position = match.end()
+    out.append(_escape_braces(source[position:]))
+    return "".join(out)
+
+
+class SiteTemplate:
+    def __init__(self, key: str, name: str, version: str, copy: Optional[Dict[str, str]] = None,
+                 partials: Optional[Dict[str, str]] = None, aliases: Iterable[str] = ()):
+        self.key = key
+        self.name = name
+        self.version = version
+        self.copy = {**BASE_COPY, **(copy or {})}
+        self.partials = {**PARTIALS, **(partials or {})}
+        self.aliases = tuple(aliases)
+        self._sections: Optional[Dict[str, CompiledTemplate]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_version(self) -> str:
+        """Identifies the markup this template produces; part of every render cache key."""
+        return f"{self.key}@{SHARED_VERSION}.{self.version}"
+
+    @property
+    def sections(self) -> Dict[str, CompiledTemplate]:
+        if self._sections is None:
+            with self._lock:
+                if self._sections is None:
+                    self._sections = {
+                        name: CompiledTemplate(compile_source(self.partials[name], self.partials, self.copy))
+                        for name in SECTIONS + FRAGMENTS
+                    }
+        return self._sections
+
+    def render_fragment(self, name: str, context: Dict[str, str], cache=None) -> str:
+        """Render a section or fragment, reusing ``cache`` (get_local/set_local) when given."""
+        section = self.sections[name]
+        if cache is None:
+            return section.render(context)
+        key = f"fragment:{self.cache_version}:{name}:{section.inputs_hash(context)}"
+        html = cache.get_local(key)
+        if html is None:
+            html = section.render(context)
+            cache.set_local(key, html)
+        return html
+
+    def render_page(self, context: Dict[str, str], cache=None) -> str:
+        return "".join([self.render_fragment(name, context, cache) for name in SECTIONS])
+
+
+class TemplateRegistry:
+    def __init__(self):
+        self._templates: Dict[str, SiteTemplate] = {}
+        self._lookup: Dict[str, SiteTemplate] = {}
+
+    def register(self, template: SiteTemplate):
+        self._templates[template.key] = template
+        for key in (template.key, template.name, *template.aliases):
+            self._lookup[self._normalize(key)] = template
+
+    def get(self, industry: Optional[str]) -> SiteTemplate:
+        return self._lookup.get(self._normalize(industry or ""), self._templates[DEFAULT_INDUSTRY])
+
+    def by_cache_version(self, cache_version: str) -> Optional[SiteTemplate]:
+        template = self._templates.get(cache_version.split("@", 1)[0])
+        if template is not None and template.cache_version == cache_version:
+            return template
+        return None
+
+    def compile_all(self):
+        for template in self._templates.values():
+            template.sections
+
+    def __iter__(self):
+        return iter(self._templates.values())
+
+    @staticmethod
+    def _normalize(industry: str) -> str:
+        return re.sub(r"[^a-z0-9]+", "", industry.lower())
+
+
+registry = TemplateRegistry()
+
+registry.register(SiteTemplate(
+    "ecommerce", "eCommerce", "1", aliases=["e-commerce", "online store", "retail"],
+))
+registry.register(SiteTemplate(
+    "it", "IT Services", "1", aliases=["technology", "tech", "software"],
+    copy={
+        "title_suffix": "IT Services & Solutions",
+        "hero_primary_cta": "Get a Quote",
+        "hero_secondary_cta": "Our Services",
+        "products_nav": "Services",
+        "products_heading": "Our Services",
+        "products_subheading": "Technology solutions tailored to your business",
+        "empty_products_heading": "No services yet",
+        "empty_products_text": "Add services to showcase them here",
+        "cart_label": "Quote",
+        "card_button": "Request Quote",
+        "added_message": "added to your quote request!",
+        "feature_1_title": "Certified Experts",
+        "feature_1_text": "Experienced, certified engineers",
+        "feature_2_title": "24/7 Support",
+        "feature_2_text": "Round-the-clock monitoring and help",
+    },
+))
+registry.register(SiteTemplate(
+    "manufacturing", "Manufacturing", "1", aliases=["industrial"],
+    copy={
+        "title_suffix": "Manufacturing & Industrial Solutions",
+        "hero_primary_cta": "Request a Quote",
+        "hero_secondary_cta": "Our Capabilities",
+        "products_heading": "Our Product Lines",
+        "products_subheading": "Engineered for reliability and built to specification",
+        "cart_label": "Quote",
+        "card_button": "Request Quote",
+        "added_message": "added to your quote request!",
+        "feature_1_title": "Certified Quality",
+        "feature_1_text": "Rigorous quality control on every batch",
+        "feature_2_title": "On-Time Production",
+        "feature_2_text": "Reliable lead times and delivery",
+    },
+))
+registry.register(SiteTemplate(
+    "fashion", "Fashion", "1", aliases=["apparel", "clothing", "boutique"],
+    copy={
+        "title_suffix": "Fashion & Style Boutique",
+        "hero_primary_cta": "Shop the Collection",
+        "hero_secondary_cta": "New Arrivals",
+        "products_heading": "Our Collection",
+        "products_subheading": "The latest trends, curated for you",
+        "feature_1_title": "Latest Trends",
+        "feature_1_text": "Fresh styles every season",
+        "feature_2_title": "Easy Returns",
+        "feature_2_text": "Hassle-free exchanges and returns",
+    },
+))
+registry.register(SiteTemplate(
+    "food", "Food & Beverage", "1", aliases=["food and beverage", "restaurant", "cafe", "bakery"],
+    copy={
+        "title_suffix": "Food & Beverage",
+        "hero_primary_cta": "Order Now",
+        "hero_secondary_cta": "View Menu",
+        "products_nav": "Menu",
+        "products_heading": "Our Menu",
+        "products_subheading": "Freshly prepared favourites",
+        "empty_products_heading": "No menu items yet",
+        "empty_products_text": "Add dishes and drinks to showcase them here",
+        "cart_label": "Order",
+        "card_button": "Add to Order",
+        "added_message": "added to your order!",
+        "feature_1_title": "Fresh Ingredients",
+        "feature_1_text": "Sourced daily from local suppliers",
+        "feature_2_title": "Fast Delivery",
+        "feature_2_text": "Hot and fresh to your door",
+    },
+))
+registry.register(SiteTemplate(
+    "services", "General Services", "1", aliases=["service", "consulting", "professional services"],
+    copy={
+        "title_suffix": "Professional Services",
+        "hero_primary_cta": "Book a Consultation",
+        "products_nav": "Services",
+        "products_heading": "Our Services",
+        "products_subheading": "Professional services you can rely on",
+        "empty_products_heading": "No services yet",
+        "empty_products_text": "Add services to showcase them here",
+        "cart_label": "Bookings",
+        "card_button": "Book Now",
+        "added_message": "added to your booking request!",
+        "feature_1_title": "Trusted Professionals",
+        "feature_1_text": "Vetted, experienced team",
+        "feature_2_title": "Flexible Scheduling",
+        "feature_2_text": "Appointments that fit your day",
+    },
+))
@@ -0,0 +1,193 @@
+"""Keeping public site pages warm across deploys and restarts.
+
+A fresh worker starts with an empty page cache, so the first wave of traffic
+would all render at once. Three pieces prevent that:
+
+- ``SingleFlight`` coalesces concurrent cache misses for the same page into
+  one render; the other requests await its result. Its keys carry the page
+  cache's generation, so a render that started before an edit is never
+  joined after the edit invalidated the page.
+- ``VisitCounter`` counts public page views in memory and flushes them to
+  ``site_visits`` (one document per page and day, expired by a TTL index) in a
+  single bulk write every SITE_VISIT_FLUSH_SECONDS.
+- ``SiteWarmer`` pre-renders the most visited and most recently updated pages
+  during warm-up, a few at a time, skipping pages another worker has already
+  put in a shared cache.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+SITE_PRERENDER_TOP_N = int(os.environ.get('SITE_PRERENDER_TOP_N', '200'))
+SITE_PRERENDER_RECENT = int(os.environ.get('SITE_PRERENDER_RECENT', '50'))
+SITE_PRERENDER_CONCURRENCY = int(os.environ.get('SITE_PRERENDER_CONCURRENCY', '4'))
+SITE_VISIT_WINDOW_DAYS = int(os.environ.get('SITE_VISIT_WINDOW_DAYS', '7'))
+SITE_VISIT_FLUSH_SECONDS = float(os.environ.get('SITE_VISIT_FLUSH_SECONDS', '30'))
+
+# (username, slug): what a public page URL identifies
+Page = Tuple[str, str]
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers share its result.
+
+    With ``generation``, a caller only joins a call started under the same
+    generation; once it changes the next caller starts a fresh call.
+    """
+
+    def __init__(self, generation: Optional[Callable[[], Any]] = None):
+        self.generation = generation
+        self._calls: Dict[Any, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key, func: Callable[[], Awaitable]):
+        if self.generation is not None:
+            key = (self.generation(), key)
+        call = self._calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+            # Shielded: one caller disconnecting must not cancel the others' render
+            return await asyncio.shield(call)
+        call = asyncio.ensure_future(func())
+        self._calls[key] = call
+        call.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(call)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class VisitCounter:
+    def __init__(self, db, flush_interval: float = SITE_VISIT_FLUSH_SECONDS,
+                 window_days: int = SITE_VISIT_WINDOW_DAYS):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.window_days = window_days
+        self._counts: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def hit(self, username: str, slug: str):
+        self._counts[(username, slug)] += 1
+
+    async def ensure_indexes(self):
+        await self.db.site_visits.create_index("day", expireAfterSeconds=(self.window_days + 1) * 86400)
+
+    async def flush(self) -> int:
+        """Write the counts gathered since the last flush; returns the number of pages."""
+        counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+        day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            await self.db.site_visits.bulk_write([
+                UpdateOne(
+                    {"_id": f"{day:%Y%m%d}:{username}:{slug}"},
+                    {"$inc": {"visits": visits}, "$setOnInsert": {"username": username, "slug": slug, "day": day}},
+                    upsert=True,
+                )
+                for (username, slug), visits in counts.items()
+            ], ordered=False)
+        except Exception:
+            # Keep them for the next flush rather than losing them
+            self._counts.update(counts)
+            raise
+        return len(counts)
+
+    async def top(self, limit: int) -> List[Page]:
+        since = datetime.utcnow() - timedelta(days=self.window_days)
+        rows = await self.db.site_visits.aggregate([
+            {"$match": {"day": {"$gte": since}}},
+            {"$group": {"_id": {"username": "$username", "slug": "$slug"}, "visits": {"$sum": "$visits"}}},
+            {"$sort": {"visits": -1}},
+            {"$limit": limit},
+        ]).to_list(None)
+        return [(row["_id"]["username"], row["_id"]["slug"]) for row in rows]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to flush site visits")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush site visits")
+
+
+class SiteWarmer:
+    """Pre-renders popular pages in the background with bounded concurrency."""
+
+    def __init__(self, candidates: Callable[[], Awaitable[List[Page]]],
+                 is_cached: Callable[[str, str], Awaitable[bool]],
+                 render: Callable[[str, str], Awaitable[Any]],
+                 concurrency: int = SITE_PRERENDER_CONCURRENCY):
+        self.candidates = candidates
+        self.is_cached = is_cached
+        self.render = render
+        self.concurrency = max(1, concurrency)
+        self.stats: Dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        pages = await self.candidates()
+        stats = {"pages": len(pages), "rendered": 0, "cached": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(username: str, slug: str):
+            async with semaphore:
+                try:
+                    if await self.is_cached(username, slug):
+                        stats["cached"] += 1
+                        return
+                    await self.render(username, slug)
+                    stats["rendered"] += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.warning("Pre-rendering %s/%s failed", username, slug, exc_info=True)
+                    stats["failed"] += 1
+                # Rendering is CPU work on the event loop; let requests through in between
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(warm(username, slug) for username, slug in pages))
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        self.stats = stats
+        logger.info("Pre-rendered %(rendered)d of %(pages)d popular pages (%(cached)d already cached, "
+                    "%(failed)d failed) in %(seconds).2fs", stats)
+        return stats
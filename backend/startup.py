@@ -0,0 +1,86 @@
+"""Deferred start-up work for the API process.
+
+Importing ``server`` only builds the app; anything that talks to Mongo or
+Redis, starts background loops or pre-computes render caches is registered
+as a warm-up step instead. The steps run in a background task triggered by
+the first health check (or ``WARMUP_FALLBACK_SECONDS`` after start-up when
+nothing probes the process), so a new worker accepts connections as soon as
+its imports finish.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WARMUP_FALLBACK_SECONDS = float(os.environ.get('WARMUP_FALLBACK_SECONDS', '5'))
+
+
+class WarmUp:
+    def __init__(self):
+        self.steps: List[Tuple[str, Callable]] = []
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.done = False
+        self._task: Optional[asyncio.Task] = None
+        self._fallback: Optional[asyncio.Task] = None
+
+    def step(self, name: str):
+        """Decorator registering a sync or async warm-up step; steps run in order."""
+        def register(func):
+            self.steps.append((name, func))
+            return func
+        return register
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    def trigger(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def schedule_fallback(self, delay: float = WARMUP_FALLBACK_SECONDS):
+        async def fallback():
+            await asyncio.sleep(delay)
+            self.trigger()
+        self._fallback = asyncio.create_task(fallback())
+
+    async def wait(self):
+        self.trigger()
+        await asyncio.shield(self._task)
+
+    async def cancel(self):
+        for task in (self._fallback, self._task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def _run(self):
+        for name, func in self.steps:
+            start = time.perf_counter()
+            try:
+                result = func()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                # A failed step shouldn't keep the rest of the process cold
+                logger.exception("Warm-up step %s failed", name)
+                self.errors[name] = f"{type(e).__name__}: {e}"
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        self.done = True
+        logger.info("Warm-up finished in %.1f ms", sum(self.timings.values()))
+
+    def status(self) -> dict:
+        return {
+            "started": self.started,
+            "done": self.done,
+            "timings_ms": self.timings,
+            "errors": self.errors,
+        }
@@ -0,0 +1,251 @@
+"""Object storage for media uploads, site exports and published pages.
+
+``LocalStorage`` keeps objects under ``STORAGE_ROOT`` and lets the API serve
+them. ``S3Storage`` works with AWS S3 or any S3-compatible service (MinIO,
+moto in tests): one boto3 client with a connection pool is shared by every
+request, large files go up as multipart uploads, and the renderer emits
+public or presigned URLs so object bytes are fetched straight from the store
+and never pass through the API workers on the read path.
+"""
+import abc
+import asyncio
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+STORAGE_ROOT = Path(os.environ.get('STORAGE_ROOT', Path(__file__).parent / 'generated'))
+
+S3_BUCKET = os.environ.get('S3_BUCKET', 'webcraft')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+# Objects are public behind this base URL (CDN or public bucket); otherwise URLs are presigned
+S3_PUBLIC_URL = (os.environ.get('S3_PUBLIC_URL') or '').rstrip('/') or None
+S3_PRESIGN_EXPIRES = int(os.environ.get('S3_PRESIGN_EXPIRES', '86400'))
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '32'))
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNK_SIZE = int(os.environ.get('S3_MULTIPART_CHUNK_SIZE', str(8 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', '4'))
+
+
+def media_key(user_id: str, media_id: str) -> str:
+    return f"media/{user_id}/{media_id}"
+
+
+def export_key(website_id: str) -> str:
+    return f"exports/{website_id}.zip"
+
+
+def page_key(website_id: str) -> str:
+    return f"pages/{website_id}/index.html"
+
+
+def import_key(user_id: str, upload_id: str) -> str:
+    return f"imports/{user_id}/{upload_id}"
+
+
+class StorageBackend(abc.ABC):
+    # Whether url() returns links that stop working (presigned), unfit for stored pages
+    urls_expire = False
+
+    @abc.abstractmethod
+    def staging_path(self, key: str) -> Path:
+        """Local file to write an object to before ``commit``."""
+
+    @abc.abstractmethod
+    async def commit(self, key: str, path: Path, content_type: str,
+                     cache_control: Optional[str] = None):
+        """Store the file written at ``staging_path(key)`` as ``key``."""
+
+    @abc.abstractmethod
+    async def put_bytes(self, key: str, data: bytes, content_type: str,
+                        cache_control: Optional[str] = None):
+        ...
+
+    @abc.abstractmethod
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    async def fetch_to_file(self, key: str) -> Path:
+        """Local file holding ``key``'s contents, for readers that need a real file.
+
+        Callers pass the path to ``release_file`` once they are done with it.
+        """
+
+    async def release_file(self, key: str, path: Path):
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    def url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        """Direct URL for ``key``, or None when the API has to serve it."""
+        return None
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path = STORAGE_ROOT):
+        self.root = Path(root)
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def staging_path(self, key: str) -> Path:
+        # Next to the target, so commit is an atomic rename
+        path = self.local_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+
+    async def commit(self, key: str, path: Path, content_type: str,
+                     cache_control: Optional[str] = None):
+        os.replace(path, self.local_path(key))
+
+    async def put_bytes(self, key: str, data: bytes, content_type: str,
+                        cache_control: Optional[str] = None):
+        await asyncio.to_thread(self._write, self.local_path(key), data)
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self.local_path(key)
+        try:
+            return await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            return None
+
+    async def fetch_to_file(self, key: str) -> Path:
+        path = self.local_path(key)
+        if not path.exists():
+            raise FileNotFoundError(key)
+        return path
+
+    async def delete(self, key: str):
+        self.local_path(key).unlink(missing_ok=True)
+
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 region: Optional[str] = S3_REGION, public_url: Optional[str] = S3_PUBLIC_URL,
+                 staging_root: Path = STORAGE_ROOT / 'staging'):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.public_url = public_url
+        self.staging_root = Path(staging_root)
+        self._presigned: Dict[Tuple[str, Optional[str]], Tuple[str, float]] = {}
+        # boto3 clients are thread-safe; one client (and its connection pool) serves every request
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                signature_version="s3v4",
+                retries={"max_attempts": 5, "mode": "adaptive"},
+                s3={"addressing_style": "path" if endpoint_url else "auto"},
+            ),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+            max_concurrency=S3_MAX_CONCURRENCY,
+        )
+
+    @property
+    def urls_expire(self) -> bool:
+        return self.public_url is None
+
+    def staging_path(self, key: str) -> Path:
+        self.staging_root.mkdir(parents=True, exist_ok=True)
+        return self.staging_root / f"{uuid.uuid4().hex}-{Path(key).name}"
+
+    @staticmethod
+    def _extra_args(content_type: str, cache_control: Optional[str]) -> dict:
+        extra = {"ContentType": content_type}
+        if cache_control:
+            extra["CacheControl"] = cache_control
+        return extra
+
+    async def commit(self, key: str, path: Path, content_type: str,
+                     cache_control: Optional[str] = None):
+        try:
+            # upload_file switches to a multipart upload above the threshold
+            await asyncio.to_thread(
+                self.client.upload_file, str(path), self.bucket, key,
+                ExtraArgs=self._extra_args(content_type, cache_control),
+                Config=self.transfer_config,
+            )
+        finally:
+            Path(path).unlink(missing_ok=True)
+
+    async def put_bytes(self, key: str, data: bytes, content_type: str,
+                        cache_control: Optional[str] = None):
+        await asyncio.to_thread(
+            self.client.put_object, Bucket=self.bucket, Key=key, Body=data,
+            **self._extra_args(content_type, cache_control),
+        )
+
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        def read():
+            try:
+                return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+            except self.client.exceptions.NoSuchKey:
+                return None
+        return await asyncio.to_thread(read)
+
+    async def fetch_to_file(self, key: str) -> Path:
+        path = self.staging_path(key)
+        try:
+            await asyncio.to_thread(
+                self.client.download_file, self.bucket, key, str(path), Config=self.transfer_config
+            )
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return path
+
+    async def release_file(self, key: str, path: Path):
+        Path(path).unlink(missing_ok=True)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    def url(self, key: str, filename: Optional[str] = None) -> str:
+        if self.public_url and filename is None:
+            return f"{self.public_url}/{key}"
+        # Reuse a URL for half its lifetime so rendered markup (and its caches) stays stable
+        now = time.monotonic()
+        cached = self._presigned.get((key, filename))
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename is not None:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        # Presigning is a local signature computation, not a request
+        url = self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=S3_PRESIGN_EXPIRES)
+        if len(self._presigned) >= 10000:
+            self._presigned.clear()
+        self._presigned[(key, filename)] = (url, now + S3_PRESIGN_EXPIRES / 2)
+        return url
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    if backend == "s3":
+        return S3Storage()
+    if backend != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return LocalStorage()
@@ -0,0 +1,335 @@
+"""Tenant placement across MongoDB shards.
+
+A tenant is a user plus everything they own (websites, media, products,
+inquiries and archived sites). All of it lives in one shard database, so
+every per-tenant query and ``$lookup`` stays on a single shard. The primary
+database (DB_NAME) is always the shard named "primary"; more are added with
+TENANT_SHARDS ("name=mongodb://host/db,..."). Without them there is one shard
+and nothing moves.
+
+New tenants are placed by consistent hashing of their user_id, so adding a
+shard only remaps ~1/N of future placements. Every placement is recorded in
+the ``tenants`` directory in the primary database together with the email
+(login and ``/sites/{email}/...`` resolve a tenant there), and the directory
+always wins over the ring. That is what lets ``TenantMover`` relocate a tenant
+online: it flips the directory entry. Tenants created before the directory
+existed have no entry and resolve to the primary shard.
+
+Custom domains must be unique across shards, which a per-shard unique index
+can't guarantee, so they are claimed in ``tenant_domains`` in the directory.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from cache import InProcessCache
+from jobs import RUNNING
+
+logger = logging.getLogger(__name__)
+
+TENANT_SHARDS = os.environ.get('TENANT_SHARDS', '')
+TENANT_RING_VNODES = int(os.environ.get('TENANT_RING_VNODES', '64'))
+# How long a worker may act on a cached placement; moves wait this long between steps
+TENANT_CACHE_TTL = int(os.environ.get('TENANT_CACHE_TTL', '10'))
+TENANT_CACHE_MAX_ENTRIES = int(os.environ.get('TENANT_CACHE_MAX_ENTRIES', '100000'))
+TENANT_MOVE_BATCH_SIZE = int(os.environ.get('TENANT_MOVE_BATCH_SIZE', '1000'))
+
+PRIMARY_SHARD = "primary"
+ACTIVE = "active"
+MOVING = "moving"
+
+# Collections holding tenant data, and the field naming the owning user
+TENANT_COLLECTIONS = {
+    "users": "id",
+    "websites": "user_id",
+    "websites_archive": "user_id",
+    "media": "user_id",
+    "products": "user_id",
+    "inquiries": "user_id",
+}
+
+
+class Shard(NamedTuple):
+    name: str
+    db: Any
+    public_db: Any
+
+
+class TenantMovingError(Exception):
+    """The tenant is being moved to another shard; writes resume shortly."""
+
+    def __init__(self, user_id: str, retry_after: int = TENANT_CACHE_TTL):
+        super().__init__(f"Tenant {user_id} is being moved")
+        self.retry_after = retry_after
+
+
+def parse_shards(spec: str) -> Dict[str, str]:
+    """Parse TENANT_SHARDS into {name: mongodb url}."""
+    shards = {}
+    for entry in spec.split(","):
+        name, _, url = entry.strip().partition("=")
+        if not name:
+            continue
+        if not url or name == PRIMARY_SHARD:
+            raise ValueError(f"Invalid TENANT_SHARDS entry: {entry!r}")
+        shards[name] = url
+    return shards
+
+
+class HashRing:
+    """Consistent hashing of keys onto shard names with virtual nodes."""
+
+    def __init__(self, nodes, vnodes: int = TENANT_RING_VNODES):
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class TenantRouter:
+    """Resolves the shard holding a tenant's data; the repository entry point."""
+
+    def __init__(self, directory, shards: Dict[str, Shard], cache_ttl: int = TENANT_CACHE_TTL):
+        self.directory = directory
+        self.shards = shards
+        self.ring = HashRing(shards)
+        self.cache_ttl = cache_ttl
+        self._cache = InProcessCache(TENANT_CACHE_MAX_ENTRIES)
+
+    def all(self) -> List[Shard]:
+        return list(self.shards.values())
+
+    async def ensure_indexes(self):
+        await self.directory.tenants.create_index("user_id", unique=True)
+        await self.directory.tenants.create_index(
+            "email", unique=True, partialFilterExpression={"email": {"$type": "string"}}
+        )
+        await self.directory.tenants.create_index("shard")
+        await self.directory.tenant_domains.create_index("website_id")
+        for shard in self.all():
+            await shard.db.users.create_index("id", unique=True)
+            await shard.db.users.create_index("email")
+
+    async def placement(self, user_id: str) -> tuple:
+        """(shard name, state) for a tenant, cached for ``cache_ttl`` seconds."""
+        cached = self._cache.get_local(f"placement:{user_id}")
+        if cached is not None:
+            shard, _, state = cached.partition("|")
+            return shard, state
+        entry = await self.directory.tenants.find_one(
+            {"user_id": user_id}, {"_id": 0, "shard": 1, "state": 1}
+        )
+        shard, state = (entry["shard"], entry.get("state", ACTIVE)) if entry else (PRIMARY_SHARD, ACTIVE)
+        self._cache.set_local(f"placement:{user_id}", f"{shard}|{state}", ttl=self.cache_ttl)
+        return shard, state
+
+    async def shard_for(self, user_id: str, write: bool = False) -> Shard:
+        """The shard holding ``user_id``'s data; ``write=True`` refuses tenants being moved."""
+        name, state = await self.placement(user_id)
+        if write and state == MOVING:
+            raise TenantMovingError(user_id)
+        return self.shards[name]
+
+    async def register(self, user_id: str, email: str) -> Shard:
+        """Place a new tenant; raises DuplicateKeyError if the email is taken."""
+        name = self.ring.node_for(user_id)
+        await self.directory.tenants.insert_one({
+            "user_id": user_id,
+            "email": email,
+            "shard": name,
+            "state": ACTIVE,
+            "created_at": datetime.utcnow(),
+        })
+        return self.shards[name]
+
+    async def unregister(self, user_id: str):
+        await self.directory.tenants.delete_one({"user_id": user_id})
+        self._cache.invalidate_tags_local([f"user:{user_id}"])
+
+    async def find_by_email(self, email: str) -> Optional[tuple]:
+        """(user_id, shard) for an account email, or None."""
+        cached = self._cache.get_local(f"email:{email}")
+        if cached is None:
+            entry = await self.directory.tenants.find_one({"email": email}, {"_id": 0, "user_id": 1})
+            if entry is None:
+                entry = await self._backfill_email(email)
+                if entry is None:
+                    return None
+            cached = entry["user_id"]
+            # Emails never move between accounts, only the placement can change
+            self._cache.set_local(f"email:{email}", cached, tags=[f"user:{cached}"])
+        return cached, await self.shard_for(cached)
+
+    async def _backfill_email(self, email: str) -> Optional[dict]:
+        # Accounts created before the directory live on the primary shard
+        user = await self.shards[PRIMARY_SHARD].db.users.find_one({"email": email}, {"_id": 0, "id": 1})
+        if user is None:
+            return None
+        await self.backfill_user(user["id"], email, PRIMARY_SHARD)
+        return {"user_id": user["id"]}
+
+    async def backfill_user(self, user_id: str, email: str, shard: str = PRIMARY_SHARD):
+        try:
+            await self.directory.tenants.update_one(
+                {"user_id": user_id},
+                {"$setOnInsert": {"email": email, "shard": shard, "state": ACTIVE, "created_at": datetime.utcnow()}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Two lookups of a legacy account raced to upsert its entry; the other one won
+            pass
+
+    async def claim_domain(self, domain: str, website_id: str, user_id: str):
+        """Reserve ``domain`` for a website; raises DuplicateKeyError if another site holds it."""
+        await self.directory.tenant_domains.update_one(
+            {"_id": domain, "website_id": website_id},
+            {"$set": {"user_id": user_id, "claimed_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        await self.directory.tenant_domains.delete_many({"website_id": website_id, "_id": {"$ne": domain}})
+
+    async def release_domain(self, website_id: str):
+        await self.directory.tenant_domains.delete_many({"website_id": website_id})
+
+    async def find_one_any(self, collection: str, query: dict, projection: Optional[dict] = None,
+                           public: bool = False) -> Optional[dict]:
+        """Look a document up on every shard; only for lookups that carry no user_id."""
+        shards = self.all()
+        results = await asyncio.gather(*(
+            (shard.public_db if public else shard.db)[collection].find_one(query, projection)
+            for shard in shards
+        ))
+        return next((doc for doc in results if doc is not None), None)
+
+
+class TenantMover:
+    """Moves one tenant between shards while it stays readable.
+
+    1. Copy the tenant's documents to the target shard while it stays writable.
+    2. Mark it ``moving`` in the directory, wait for every worker's cached
+       placement to expire, and for its running jobs to finish. From here on
+       writes get a 503 with Retry-After; reads still go to the source.
+    3. Copy again, which picks up writes made during the first copy, and drop
+       target documents deleted at the source meanwhile.
+    4. Point the directory at the target and mark the tenant active.
+    5. Wait for cached placements again, then delete the source copy.
+    """
+
+    def __init__(self, router: TenantRouter, settle_seconds: Optional[float] = None,
+                 log: Callable[[str], None] = logger.info):
+        self.router = router
+        self.settle_seconds = router.cache_ttl + 1 if settle_seconds is None else settle_seconds
+        self.log = log
+
+    async def move(self, user_id: str, target: str) -> dict:
+        router = self.router
+        if target not in router.shards:
+            raise ValueError(f"Unknown shard: {target}")
+        entry = await router.directory.tenants.find_one({"user_id": user_id})
+        if entry is None:
+            user = await router.shards[PRIMARY_SHARD].db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
+            if user is None:
+                raise ValueError(f"Unknown tenant: {user_id}")
+            await router.backfill_user(user_id, user["email"])
+            entry = await router.directory.tenants.find_one({"user_id": user_id})
+        if entry.get("state", ACTIVE) != ACTIVE:
+            raise ValueError(f"Tenant {user_id} is already being moved")
+        source = router.shards[entry["shard"]]
+        destination = router.shards[target]
+        if source.name == target:
+            return {"user_id": user_id, "moved": False, "shard": target}
+
+        self.log(f"copying {user_id} from {source.name} to {target}")
+        await self._copy(source, destination, user_id)
+
+        locked = await router.directory.tenants.update_one(
+            {"user_id": user_id, "shard": source.name, "state": ACTIVE},
+            {"$set": {"state": MOVING, "moving_to": target, "updated_at": datetime.utcnow()}},
+        )
+        if not locked.modified_count:
+            raise RuntimeError(f"Tenant {user_id} changed while copying; try again")
+        try:
+            self.log("writes paused; waiting for workers and running jobs")
+            await asyncio.sleep(self.settle_seconds)
+            await self._wait_for_jobs(user_id)
+            counts = await self._copy(source, destination, user_id, sync_deletes=True)
+            await router.directory.tenants.update_one(
+                {"user_id": user_id},
+                {"$set": {"shard": target, "state": ACTIVE, "moving_to": None, "updated_at": datetime.utcnow()}},
+            )
+        except BaseException:
+            await router.directory.tenants.update_one(
+                {"user_id": user_id},
+                {"$set": {"state": ACTIVE, "moving_to": None, "updated_at": datetime.utcnow()}},
+            )
+            raise
+
+        self.log(f"{user_id} now served from {target}; removing the copy on {source.name}")
+        await asyncio.sleep(self.settle_seconds)
+        for collection, field in TENANT_COLLECTIONS.items():
+            await source.db[collection].delete_many({field: user_id})
+        return {"user_id": user_id, "moved": True, "from": source.name, "shard": target, "documents": counts}
+
+    async def _wait_for_jobs(self, user_id: str):
+        # A job that started before the lock may still write to the source shard
+        while await self.router.directory.jobs.count_documents({"user_id": user_id, "status": RUNNING}):
+            await asyncio.sleep(1)
+
+    async def _copy(self, source: Shard, destination: Shard, user_id: str, sync_deletes: bool = False) -> dict:
+        counts = {}
+        for collection, field in TENANT_COLLECTIONS.items():
+            seen = []
+            batch = []
+            async for doc in source.db[collection].find({field: user_id}):
+                seen.append(doc["_id"])
+                batch.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+                if len(batch) >= TENANT_MOVE_BATCH_SIZE:
+                    await destination.db[collection].bulk_write(batch, ordered=False)
+                    batch = []
+            if batch:
+                await destination.db[collection].bulk_write(batch, ordered=False)
+            if sync_deletes:
+                await destination.db[collection].delete_many({field: user_id, "_id": {"$nin": seen}})
+            counts[collection] = len(seen)
+        return counts
+
+
+def plan_rebalance(router: TenantRouter, placements: List[dict]) -> List[dict]:
+    """Tenants whose recorded shard differs from the ring's choice, e.g. after adding a shard."""
+    moves = []
+    for entry in placements:
+        target = router.ring.node_for(entry["user_id"])
+        if entry["shard"] != target:
+            moves.append({"user_id": entry["user_id"], "from": entry["shard"], "to": target})
+    return moves
+
+
+def create_router(directory, directory_public, client_factory, instrument=lambda db: db,
+                  read_preference=None, spec: str = TENANT_SHARDS) -> TenantRouter:
+    """Build the router from TENANT_SHARDS; ``client_factory(url)`` returns a Motor client."""
+    shards = {PRIMARY_SHARD: Shard(PRIMARY_SHARD, directory, directory_public)}
+    for name, url in parse_shards(spec).items():
+        shard_client = client_factory(url)
+        database = shard_client.get_default_database(os.environ.get('DB_NAME'))
+        shards[name] = Shard(
+            name,
+            instrument(database),
+            instrument(shard_client.get_database(database.name, read_preference=read_preference)),
+        )
+    return TenantRouter(directory, shards)
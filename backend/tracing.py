@@ -0,0 +1,365 @@
+"""Opt-in request tracing with OpenTelemetry-compatible spans.
+
+Tracing is disabled unless TRACING_ENABLED is set. Sampling is decided once
+per request (honouring an incoming W3C ``traceparent`` header), so unsampled
+requests only pay for a context-variable lookup per instrumented call.
+Finished spans are batched on a background thread and written as OTLP/JSON,
+either as lines in TRACE_EXPORT_PATH or POSTed to TRACE_COLLECTOR_URL.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
+TRACE_EXPORT_PATH = os.environ.get('TRACE_EXPORT_PATH', 'traces.jsonl')
+TRACE_COLLECTOR_URL = os.environ.get('TRACE_COLLECTOR_URL')
+SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'webcraft-backend')
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    'current_span', default=None
+)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        tracer.export(self)
+        return False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _attribute_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, enabled: bool = TRACING_ENABLED, sample_rate: float = TRACE_SAMPLE_RATE,
+                 export_path: Optional[str] = TRACE_EXPORT_PATH,
+                 collector_url: Optional[str] = TRACE_COLLECTOR_URL,
+                 batch_size: int = 512, flush_interval: float = 1.0):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.export_path = export_path
+        self.collector_url = collector_url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """Start a root span for a request, or return a no-op span if it isn't sampled."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        trace_id, parent_id, sampled = None, None, None
+        if traceparent:
+            parts = traceparent.split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                try:
+                    sampled = bool(int(parts[3], 16) & 1)
+                    trace_id, parent_id = parts[1], parts[2]
+                except ValueError:
+                    pass
+        if sampled is None:
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return _NOOP_SPAN
+        return Span(name, trace_id or "%032x" % random.getrandbits(128), parent_id, attributes)
+
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            return _NOOP_SPAN
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+
+    def export(self, span: Span):
+        self._ensure_worker()
+        self._queue.put(span)
+
+    def shutdown(self):
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+            self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                span = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                span = False
+            if span is None:
+                self._flush(batch)
+                return
+            if span:
+                batch.append(span)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch: List[Span]):
+        if not batch:
+            return
+        payload = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "webcraft.tracing"},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        })
+        try:
+            if self.collector_url:
+                request = urllib.request.Request(
+                    self.collector_url.rstrip("/") + "/v1/traces",
+                    data=payload.encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+            elif self.export_path:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(payload + "\n")
+        except Exception:
+            logger.exception("Failed to export %d spans", len(batch))
+
+
+tracer = Tracer()
+atexit.register(tracer.shutdown)
+
+
+def span(name: str, **attributes):
+    return tracer.span(name, **attributes)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator wrapping a sync or async function in a child span."""
+    def decorator(func):
+        if not tracer.enabled:
+            return func
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a sampled root span per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope.get("headers", ()):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+            await send(message)
+
+        with root:
+            await self.app(scope, receive, send_wrapper)
+
+
+# Motor instrumentation
+
+_COLLECTION_COROUTINES = {
+    "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "count_documents",
+    "estimated_document_count", "find_one_and_update", "find_one_and_delete",
+    "find_one_and_replace", "bulk_write", "create_index", "create_indexes",
+    "distinct", "drop",
+}
+
+
+class TracedCursor:
+    def __init__(self, cursor, collection: str, operation: str):
+        self._cursor = cursor
+        self._collection = collection
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name in ("sort", "skip", "limit", "batch_size", "max_time_ms"):
+            @functools.wraps(attr)
+            def chain(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chain
+        return attr
+
+    async def to_list(self, length):
+        with tracer.span(f"mongo.{self._operation}", **{
+            "db.system": "mongodb", "db.mongodb.collection": self._collection,
+            "db.operation": self._operation,
+        }):
+            return await self._cursor.to_list(length)
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class TracedCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in _COLLECTION_COROUTINES:
+            return self._wrap_coroutine(name, attr)
+        if name in ("find", "aggregate"):
+            @functools.wraps(attr)
+            def cursor(*args, **kwargs):
+                return TracedCursor(attr(*args, **kwargs), self._collection.name, name)
+            return cursor
+        if name == "with_options":
+            @functools.wraps(attr)
+            def with_options(*args, **kwargs):
+                return TracedCollection(attr(*args, **kwargs))
+            return with_options
+        return attr
+
+    def _wrap_coroutine(self, operation, method):
+        collection_name = self._collection.name
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(f"mongo.{operation}", **{
+                "db.system": "mongodb", "db.mongodb.collection": collection_name,
+                "db.operation": operation,
+            }):
+                return await method(*args, **kwargs)
+        return wrapper
+
+
+class TracedDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if not name.startswith("_") and hasattr(attr, "find_one"):
+            return TracedCollection(attr)
+        return attr
+
+    def __getitem__(self, name):
+        return TracedCollection(self._database[name])
+
+
+def instrument_database(database):
+    """Wrap a Motor database so every collection call records a span when tracing is on."""
+    if not tracer.enabled:
+        return database
+    return TracedDatabase(database)
@@ -0,0 +1,39 @@
+"""Shared test setup.
+
+The backend is not a package: its modules import each other by top-level
+name, so ``backend/`` goes on ``sys.path`` for every test. Tests that need
+MongoDB get an in-memory Motor mock, and are skipped where mongomock-motor
+isn't installed.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# Everything importing server.py pulls in
+SERVER_DEPENDENCIES = ("fastapi", "motor", "dotenv", "bcrypt", "jwt", "slugify", "email_validator", "orjson", "multipart")
+
+
+@pytest.fixture
+def mongo_client():
+    """A fresh in-memory Motor client; each test starts with empty databases."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()
+
+
+@pytest.fixture
+def mongo(mongo_client):
+    return mongo_client["test"]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """The app module, importable without a running MongoDB (Motor connects lazily)."""
+    for module in SERVER_DEPENDENCIES:
+        pytest.importorskip(module)
+    monkeypatch.setenv("MONGO_URL", "mongodb://localhost:27017")
+    monkeypatch.setenv("DB_NAME", "test_webcraft")
+    import server
+    return server
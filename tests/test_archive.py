@@ -0,0 +1,131 @@
+"""Archival and purging of soft-deleted websites against an in-memory Motor mock."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+import archive  # noqa: E402
+
+
+def website(website_id: str, deleted_days_ago=None, **fields) -> dict:
+    doc = {"id": website_id, "user_id": "user-1", "slug": website_id, "is_active": deleted_days_ago is None}
+    if deleted_days_ago is not None:
+        doc["deleted_at"] = datetime.utcnow() - timedelta(days=deleted_days_ago)
+    return {**doc, **fields}
+
+
+async def ids(collection) -> list:
+    return sorted(await collection.distinct("id"))
+
+
+def test_sites_deleted_past_the_grace_period_are_archived(mongo):
+    archiver = archive.WebsiteArchiver(mongo)
+
+    async def run():
+        await archiver.ensure_indexes()
+        await mongo.websites.insert_many([
+            website("live"),
+            website("recent", deleted_days_ago=1),
+            website("old", deleted_days_ago=archive.ARCHIVE_GRACE_DAYS + 1),
+            # Deleted before deleted_at was recorded
+            website("legacy", is_active=False),
+        ])
+        moved = await archiver.archive_expired()
+        legacy = await mongo.websites.find_one({"id": "legacy"})
+        return moved, await ids(mongo.websites), await archiver.archive.find_one({"id": "old"}), legacy
+
+    moved, hot, archived, legacy = asyncio.run(run())
+    assert moved == 1
+    assert hot == ["legacy", "live", "recent"]
+    assert archived["purge_at"] - archived["archived_at"] == timedelta(days=archive.ARCHIVE_RETENTION_DAYS)
+    # Its grace period starts now rather than it being archived straight away
+    assert datetime.utcnow() - legacy["deleted_at"] < timedelta(minutes=1)
+
+
+def test_site_restored_during_the_sweep_stays_and_loses_its_archive_copy(mongo):
+    class RestoringArchive:
+        """Lets the owner restore the site right after it was copied to the archive."""
+
+        def __init__(self, collection):
+            self.collection = collection
+
+        def __getattr__(self, name):
+            return getattr(self.collection, name)
+
+        async def bulk_write(self, requests, ordered=True):
+            result = await self.collection.bulk_write(requests, ordered=ordered)
+            await mongo.websites.update_one({"id": "old"}, {"$set": {"is_active": True, "deleted_at": None}})
+            return result
+
+    class Archiver(archive.WebsiteArchiver):
+        @property
+        def archive(self):
+            return RestoringArchive(self.db[archive.ARCHIVE_COLLECTION])
+
+    archiver = Archiver(mongo)
+
+    async def run():
+        await mongo.websites.insert_one(website("old", deleted_days_ago=archive.ARCHIVE_GRACE_DAYS + 1))
+        moved = await archiver.archive_expired()
+        return moved, await mongo.websites.find_one({"id": "old"}), await ids(mongo[archive.ARCHIVE_COLLECTION])
+
+    moved, restored, archived = asyncio.run(run())
+    assert moved == 0
+    assert restored["is_active"] is True
+    assert archived == []
+
+
+def test_purge_deletes_expired_sites_with_their_data(mongo):
+    purged_ids = []
+
+    async def on_purge(website_ids):
+        purged_ids.extend(website_ids)
+
+    archiver = archive.WebsiteArchiver(mongo, on_purge=on_purge)
+    now = datetime.utcnow()
+
+    async def run():
+        await archiver.archive.insert_many([
+            website("expired", 100, archived_at=now, purge_at=now - timedelta(days=1)),
+            website("kept", 10, archived_at=now, purge_at=now + timedelta(days=80)),
+        ])
+        for collection in archive.PURGED_WITH_WEBSITE:
+            await mongo[collection].insert_many([
+                {"id": f"{collection}-1", "website_id": "expired"},
+                {"id": f"{collection}-2", "website_id": "kept"},
+            ])
+        purged = await archiver.purge_expired()
+        remaining = {collection: await mongo[collection].distinct("website_id")
+                     for collection in archive.PURGED_WITH_WEBSITE}
+        return purged, await ids(archiver.archive), remaining
+
+    purged, archived, remaining = asyncio.run(run())
+    assert purged == 1
+    assert purged_ids == ["expired"]
+    assert archived == ["kept"]
+    assert remaining == {collection: ["kept"] for collection in archive.PURGED_WITH_WEBSITE}
+
+
+def test_restoring_an_archived_site_renames_a_taken_slug(mongo):
+    archiver = archive.WebsiteArchiver(mongo)
+    website_id = "0123456789abcdef"
+
+    async def slug_taken(user_id, slug):
+        return await mongo.websites.count_documents({"user_id": user_id, "slug": slug, "is_active": True}) > 0
+
+    async def run():
+        now = datetime.utcnow()
+        await archiver.archive.insert_one(
+            website(website_id, 30, slug="shop", archived_at=now, purge_at=now + timedelta(days=60))
+        )
+        await mongo.websites.insert_one(website("newer", slug="shop"))
+        restored = await archiver.restore(website_id, "user-1", slug_taken)
+        return restored, await mongo.websites.find_one({"id": website_id}), await ids(archiver.archive)
+
+    restored, stored, archived = asyncio.run(run())
+    assert restored["slug"] == stored["slug"] == "shop-01234567"
+    assert (stored["is_active"], stored["deleted_at"]) == (True, None)
+    assert "purge_at" not in stored
+    assert archived == []
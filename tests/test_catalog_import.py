@@ -0,0 +1,130 @@
+"""Catalog import parsing and validation for CSV and XLSX files.
+
+Runs the same rows through both readers and checks that blank or missing
+cells count as empty (never as the string "nan"), that formatted prices are
+parsed, and that bad rows are reported with their spreadsheet row numbers.
+An import requested while another runs for the same site is refused rather
+than queued as a rerun of the running one.
+"""
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+openpyxl = pytest.importorskip("openpyxl")
+
+import catalog_import  # noqa: E402
+
+HEADER = ["Title", "Price", "SKU", "Qty"]
+ROWS = [
+    ["Widget", "1,299.00", "w1", "3"],
+    ["Gadget", "$5", "g1", ""],
+    ["", "9.99", "x1", ""],
+    ["Thing", "12"],
+    ["Euro", "€ 1.299,50", "e1", "2"],
+    ["Bad price", "call us", "b1", "1"],
+    ["Negative", "-5", "n1", "1"],
+    ["Widget again", "4", "w1", "1"],
+    ["No price", "", "p1", "1"],
+]
+
+
+def write_csv(path: Path):
+    lines = [",".join(HEADER)] + [",".join(f'"{cell}"' for cell in row) for row in ROWS]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def write_xlsx(path: Path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for row in ROWS:
+        # Empty cells are really empty in a spreadsheet, and numbers are numbers
+        sheet.append([None if cell == "" else float(cell) if cell.replace(".", "").isdigit() else cell
+                      for cell in row])
+    workbook.save(path)
+
+
+def import_file(path: Path, fmt: str):
+    records, errors, seen = [], [], set()
+    first_row = 2
+    for frame in catalog_import.iter_chunks(path, fmt, chunk_rows=4):
+        chunk_records, chunk_errors = catalog_import.validate_chunk(frame, first_row, seen)
+        records += chunk_records
+        errors += chunk_errors
+        first_row += len(frame)
+    return records, errors
+
+
+@pytest.mark.parametrize("fmt,write", [("csv", write_csv), ("xlsx", write_xlsx)])
+def test_import_parses_prices_and_blank_cells(tmp_path, fmt, write):
+    path = tmp_path / f"catalog.{fmt}"
+    write(path)
+
+    records, errors = import_file(path, fmt)
+
+    assert [(r["sku"], r["name"], r["price"], r["stock"]) for r in records] == [
+        ("w1", "Widget", "1299.00", 3),
+        ("g1", "Gadget", "5.00", None),
+        ("thing", "Thing", "12.00", None),
+        ("e1", "Euro", "1299.50", 2),
+    ]
+    assert all("nan" not in str(value).lower() for record in records for value in record.values())
+    assert [(e["row"], e["column"]) for e in errors] == [
+        (4, "name"), (7, "price"), (8, "price"), (9, "sku"), (10, "price"),
+    ]
+
+
+@pytest.mark.parametrize("raw,expected", [
+    ("1,299.00", 1299.0), ("$5", 5.0), ("1.299,50", 1299.5), ("5,50", 5.5),
+    ("1,299", 1299.0), ("EUR 12", 12.0), ("9.99", 9.99),
+])
+def test_parse_prices(raw, expected):
+    assert catalog_import.parse_prices(pd.Series([raw])).tolist() == [expected]
+
+
+@pytest.mark.parametrize("raw", ["", "call us", "1.2.3"])
+def test_unparseable_prices_are_nan(raw):
+    assert catalog_import.parse_prices(pd.Series([raw])).isna().all()
+
+
+def test_missing_required_column(tmp_path):
+    path = tmp_path / "catalog.csv"
+    path.write_text("name,sku\nWidget,w1\n", encoding="utf-8")
+    with pytest.raises(catalog_import.ImportFileError, match="price"):
+        import_file(path, "csv")
+
+
+def test_import_requested_while_one_runs_is_refused_not_rerun(tmp_path, mongo):
+    import jobs
+    import storage
+
+    store = storage.LocalStorage(tmp_path / "storage")
+    queue = jobs.JobQueue(mongo)
+    queue.register("import_products", lambda job, ctx: catalog_import.run_import(mongo, store, job, ctx))
+    first_key, second_key = storage.import_key("user-1", "first"), storage.import_key("user-1", "second")
+
+    async def request_import(key):
+        # What the upload handler does: queue the import unless one is already active
+        await store.put_bytes(key, b"name,price,sku\nWidget,5,w1\n", "text/csv")
+        job = await queue.enqueue("import_products", "site-1", "user-1",
+                                  {"key": key, "filename": "catalog.csv"}, rerun=False)
+        if job["payload"]["key"] != key:
+            await store.delete(key)
+        return job
+
+    async def run():
+        await queue.ensure_indexes()
+        first = await request_import(first_key)
+        running = await queue._claim()
+        second = await request_import(second_key)
+        await queue._execute(running)
+        return first, second, await mongo.jobs.find({}, {"_id": 0}).to_list(None)
+
+    first, second, stored = asyncio.run(run())
+    assert second["id"] == first["id"]
+    # One job ran, once, and nothing was left to rerun it against a deleted file
+    assert [(job["status"], job["attempts"]) for job in stored] == [(jobs.SUCCEEDED, 1)]
+    assert stored[0]["result"]["imported"] == 1
+    assert not store.local_path(first_key).exists() and not store.local_path(second_key).exists()
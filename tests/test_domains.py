@@ -0,0 +1,165 @@
+"""Custom domain routing.
+
+The domain map is loaded from two in-memory shards and kept current by writes
+and change-stream events; the middleware is driven as a bare ASGI app, so a
+request either gets the mapped site's page or falls through to the API app.
+"""
+import asyncio
+
+import pytest
+
+from domains import CustomDomainMiddleware, DomainMap, DomainTarget, normalize_domain
+
+TARGET = DomainTarget("site-1", "user-1", "owner@example.com", "shop")
+
+
+@pytest.mark.parametrize("domain,expected", [
+    ("Shop.Example.com", "shop.example.com"),
+    (" shop.example.com. ", "shop.example.com"),
+    ("shop.example.com:8443", "shop.example.com"),
+    ("localhost", None),
+    ("-shop.example.com", None),
+    ("shop_1.example.com", None),
+    ("[::1]:8000", None),
+    ("", None),
+])
+def test_normalize_domain(domain, expected):
+    assert normalize_domain(domain) == expected
+
+
+def test_map_is_loaded_from_every_shard(mongo_client):
+    shards = [mongo_client["primary"], mongo_client["other"]]
+    domain_map = DomainMap(shards)
+
+    async def run():
+        for index, db in enumerate(shards):
+            user_id = f"user-{index}"
+            await db.users.insert_one({"id": user_id, "email": f"{user_id}@example.com"})
+            await db.websites.insert_many([
+                {"id": f"site-{index}", "user_id": user_id, "slug": "shop", "is_active": True,
+                 "custom_domain": f"shop{index}.example.com"},
+                {"id": f"deleted-{index}", "user_id": user_id, "slug": "old", "is_active": False,
+                 "custom_domain": f"old{index}.example.com"},
+                {"id": f"plain-{index}", "user_id": user_id, "slug": "blog", "is_active": True},
+            ])
+        # A site whose owner is gone isn't served
+        await shards[0].websites.insert_one(
+            {"id": "orphan", "user_id": "gone", "slug": "x", "is_active": True, "custom_domain": "orphan.example.com"}
+        )
+        await domain_map.load()
+
+    asyncio.run(run())
+    assert domain_map.resolve("shop0.example.com") == DomainTarget("site-0", "user-0", "user-0@example.com", "shop")
+    assert domain_map.resolve("shop1.example.com:443") == DomainTarget("site-1", "user-1", "user-1@example.com", "shop")
+    assert domain_map.resolve("old0.example.com") is None
+    assert domain_map.resolve("orphan.example.com") is None
+
+
+def test_changing_a_sites_domain_releases_the_old_one():
+    domain_map = DomainMap([])
+    domain_map.set("shop.example.com", *TARGET)
+    domain_map.set("bakery.example.com", *TARGET)
+    assert domain_map.resolve("shop.example.com") is None
+    assert domain_map.resolve("bakery.example.com") == TARGET
+
+    domain_map.set(None, *TARGET)
+    assert domain_map.resolve("bakery.example.com") is None
+
+
+def test_change_events_from_other_workers_update_the_map(mongo):
+    domain_map = DomainMap([mongo])
+    website = {"id": "site-1", "user_id": "user-1", "slug": "shop", "custom_domain": "shop.example.com"}
+
+    async def run():
+        await mongo.users.insert_one({"id": "user-1", "email": "owner@example.com"})
+        await domain_map.apply_change({"ns": {"coll": "websites"}, "fullDocument": {**website, "is_active": True}})
+        added = domain_map.resolve("shop.example.com")
+        await domain_map.apply_change({"ns": {"coll": "users"}, "fullDocument": {"id": "site-1"}})
+        kept = domain_map.resolve("shop.example.com")
+        await domain_map.apply_change({"ns": {"coll": "websites"}, "fullDocument": {**website, "is_active": False}})
+        return added, kept, domain_map.resolve("shop.example.com")
+
+    added, kept, removed = asyncio.run(run())
+    assert added == kept == TARGET
+    assert removed is None
+
+
+def test_domain_claimed_on_one_shard_is_refused_for_another_site(mongo_client):
+    import tenancy
+    from pymongo.errors import DuplicateKeyError
+
+    directory = mongo_client["primary"]
+    shard = tenancy.Shard(tenancy.PRIMARY_SHARD, directory, directory)
+    router = tenancy.TenantRouter(directory, {tenancy.PRIMARY_SHARD: shard})
+
+    async def run():
+        await router.ensure_indexes()
+        await router.claim_domain("shop.example.com", "site-1", "user-1")
+        # Claiming it again for the same site is a no-op
+        await router.claim_domain("shop.example.com", "site-1", "user-1")
+        with pytest.raises(DuplicateKeyError):
+            await router.claim_domain("shop.example.com", "site-2", "user-2")
+        await router.claim_domain("bakery.example.com", "site-1", "user-1")
+        claimed = await directory.tenant_domains.distinct("_id")
+        await router.release_domain("site-1")
+        await router.claim_domain("shop.example.com", "site-2", "user-2")
+        return claimed, await directory.tenant_domains.find_one({"_id": "shop.example.com"})
+
+    claimed, reclaimed = asyncio.run(run())
+    assert claimed == ["bakery.example.com"]
+    assert reclaimed["website_id"] == "site-2"
+
+
+def route(domain_map: DomainMap, path: str, host: bytes, page="<p>Shop</p>"):
+    """Send one request through the middleware; returns (served target, response, fell through)."""
+    served, sent, fell_through = [], [], []
+
+    async def app(scope, receive, send):
+        fell_through.append(scope["path"])
+
+    async def serve(target):
+        served.append(target)
+        return page
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    middleware = CustomDomainMiddleware(app, domain_map, serve)
+    scope = {"type": "http", "path": path, "headers": [(b"host", host), (b"accept", b"text/html")]}
+    asyncio.run(middleware(scope, receive, send))
+    return served, sent, bool(fell_through)
+
+
+@pytest.fixture
+def domain_map():
+    domain_map = DomainMap([])
+    domain_map.set("shop.example.com", *TARGET)
+    return domain_map
+
+
+def test_mapped_host_is_served_the_site(domain_map):
+    served, sent, fell_through = route(domain_map, "/", b"Shop.Example.com:443")
+    assert served == [TARGET]
+    assert not fell_through
+    start, body = sent
+    assert start["status"] == 200
+    assert dict(start["headers"])[b"content-length"] == str(len(body["body"])).encode()
+    assert body["body"] == b"<p>Shop</p>"
+
+
+@pytest.mark.parametrize("path,host", [
+    ("/api/websites", b"shop.example.com"),
+    ("/", b"app.example.com"),
+])
+def test_api_paths_and_unmapped_hosts_go_to_the_app(domain_map, path, host):
+    served, sent, fell_through = route(domain_map, path, host)
+    assert (served, sent, fell_through) == ([], [], True)
+
+
+def test_mapped_site_that_is_gone_goes_to_the_app(domain_map):
+    served, sent, fell_through = route(domain_map, "/", b"shop.example.com", page=None)
+    assert served == [TARGET]
+    assert (sent, fell_through) == ([], True)
@@ -0,0 +1,86 @@
+"""Post-render optimization of generated pages.
+
+Checks that minifying never changes what renders: whitespace only goes where
+browsers ignore it, dropped comments leave the text around them intact, and
+verbatim content (inline scripts, ``<pre>``) comes out byte for byte.
+"""
+import pytest
+
+from html_optimizer import optimize_html
+
+
+@pytest.mark.parametrize("html,expected", [
+    ("<p>Call <!-- x --> us</p>", "<p>Call us</p>"),
+    ("<p>Call<!-- x --> us</p>", "<p>Call us</p>"),
+    ("<p>Call <!-- x -->us</p>", "<p>Call us</p>"),
+    ("<p>Call<!-- x -->us</p>", "<p>Callus</p>"),
+    ("<p>Call <!-- a --> <!-- b --> us</p>", "<p>Call us</p>"),
+    ("<div>\n  <!-- hero -->\n  <p>Hi</p>\n</div>", "<div><p>Hi</p></div>"),
+    ("<p>Last <!-- x --></p>", "<p>Last</p>"),
+])
+def test_dropped_comments_keep_the_text_around_them(html, expected):
+    assert optimize_html(html) == expected
+
+
+def test_conditional_comments_are_kept():
+    html = "<head><!--[if IE]><p>Old</p><![endif]--></head>"
+    assert optimize_html(html) == html
+
+
+def test_whitespace_is_only_removed_next_to_block_tags():
+    html = "<div>\n  <p>A  <strong>bold</strong>\n  <a href='#'>link</a> </p>\n</div>"
+    assert optimize_html(html) == "<div><p>A <strong>bold</strong> <a href='#'>link</a></p></div>"
+
+
+def test_inline_script_bodies_are_verbatim():
+    body = "\n  const note = `line one\n  // still part of the string\n  line three`;\n  const re = /a\\/\\/b/;\n"
+    html = f"<body><script>{body}</script><p>Text</p></body>"
+    assert optimize_html(html) == f"<body><p>Text</p><script>{body}</script></body>"
+
+
+def test_pre_is_verbatim():
+    html = "<div><pre>  a\n    b  </pre></div>"
+    assert optimize_html(html) == html
+
+
+def test_external_scripts_are_deferred():
+    out = optimize_html('<head><script src="/app.js"></script><script src="/m.js" type="module"></script></head>')
+    assert out == '<head><script src="/app.js" defer></script><script src="/m.js" type="module"></script></head>'
+
+
+def test_images_below_the_fold_are_lazy_and_sized():
+    html = ('<section><img src="hero.jpg" class="w-full h-64"></section>'
+            '<section><img src="card.jpg" class="w-12 h-12"><img src="set.jpg" width="10" loading="eager"></section>')
+    out = optimize_html(html)
+    assert '<img src="hero.jpg" class="w-full h-64" width="384" height="256">' in out
+    assert '<img src="card.jpg" class="w-12 h-12" loading="lazy" decoding="async" width="48" height="48">' in out
+    assert '<img src="set.jpg" width="10" loading="eager" decoding="async">' in out
+
+
+def test_repeated_svgs_become_a_sprite():
+    icon = '<svg viewBox="0 0 24 24"><path d="M1 1L2 2"/></svg>'
+    out = optimize_html(f"<body><p>{icon}</p><p>{icon}</p><p><svg><circle r='1'/></svg></p></body>")
+    assert out.count('<symbol id="icon-0" viewBox="0 0 24 24"><path d="M1 1L2 2"/></symbol>') == 1
+    assert out.count('<svg viewBox="0 0 24 24"><use href="#icon-0"/></svg>') == 2
+    assert "<circle r='1'/>" in out
+
+
+def test_quoted_attributes_may_contain_angle_brackets():
+    card = ('<img src="a.jpg" alt="Cats > Dogs" class="w-full h-48 object-cover">'
+            '<button onclick="addToCart(\'1\', \'Cats > Dogs\', \'5\')" class="btn" >Add</button>')
+    out = optimize_html(f"<body><section><p>Hero</p></section><div>{card}</div></body>")
+    assert out == (
+        '<body><section><p>Hero</p></section><div>'
+        '<img src="a.jpg" alt="Cats > Dogs" class="w-full h-48 object-cover" loading="lazy" decoding="async"'
+        ' width="384" height="192">'
+        '<button onclick="addToCart(\'1\', \'Cats > Dogs\', \'5\')" class="btn">Add</button></div></body>'
+    )
+
+
+def test_script_and_style_open_tags_may_contain_angle_brackets():
+    html = ('<head><style media="(width > 600px)">p { color: red; }</style></head>'
+            '<body><script data-note="a > b">run()</script></body>')
+    assert optimize_html(html) == (
+        '<head><style media="(width > 600px)">p { color: red; }</style></head>'
+        '<body><script data-note="a > b">run()</script></body>'
+    )
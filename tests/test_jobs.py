@@ -0,0 +1,177 @@
+"""JobQueue leases, retries and deduplication against an in-memory Motor mock.
+
+Workers are driven by hand (``_claim``/``_execute``/``requeue_expired``) rather
+than started, so each step of a job's life can be checked in between.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+import jobs  # noqa: E402
+
+
+async def expire_lease(queue: jobs.JobQueue, job_id: str):
+    await queue.db.jobs.update_one({"id": job_id}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+
+
+def test_expired_lease_is_requeued_until_attempts_run_out(mongo):
+    queue = jobs.JobQueue(mongo)
+
+    async def run():
+        await queue.ensure_indexes()
+        job = await queue.enqueue("render", "site-1", max_attempts=2)
+        states = []
+        for _ in range(2):
+            claimed = await queue._claim()
+            # The worker died mid-job: nothing finishes it, its lease runs out
+            await expire_lease(queue, claimed["id"])
+            requeued = await queue.requeue_expired()
+            stored = await mongo.jobs.find_one({"id": job["id"]})
+            states.append((requeued, stored["status"], stored["attempts"], stored["active"]))
+        return states, await queue._claim(), await queue.enqueue("render", "site-1")
+
+    states, claimed, fresh = asyncio.run(run())
+    assert states == [(1, jobs.QUEUED, 1, True), (0, jobs.FAILED, 2, False)]
+    assert claimed is None
+    # The failed job no longer holds the dedup key
+    assert fresh["status"] == jobs.QUEUED
+
+
+async def make_due(queue: jobs.JobQueue, job_id: str):
+    await queue.db.jobs.update_one({"id": job_id}, {"$set": {"run_at": datetime.utcnow()}})
+
+
+def test_failed_job_is_retried_with_backoff_then_failed(mongo):
+    queue = jobs.JobQueue(mongo)
+    calls = []
+
+    async def handler(job, ctx):
+        calls.append(job["attempts"])
+        raise RuntimeError("template error")
+
+    queue.register("render", handler)
+
+    async def run():
+        await queue.ensure_indexes()
+        job = await queue.enqueue("render", "site-1", max_attempts=2)
+        await queue._execute(await queue._claim())
+        retrying = await mongo.jobs.find_one({"id": job["id"]})
+        # Backing off: not claimable until run_at passes
+        early = await queue._claim()
+        await make_due(queue, job["id"])
+        await queue._execute(await queue._claim())
+        return retrying, early, await mongo.jobs.find_one({"id": job["id"]})
+
+    retrying, early, failed = asyncio.run(run())
+    assert (retrying["status"], retrying["active"], retrying["locked_by"]) == (jobs.QUEUED, True, None)
+    assert retrying["run_at"] > datetime.utcnow() + timedelta(seconds=jobs.JOB_BACKOFF_BASE * 0.7)
+    assert early is None
+    assert calls == [1, 2]
+    assert (failed["status"], failed["active"], failed["error"]) == (jobs.FAILED, False, "RuntimeError: template error")
+
+
+def test_permanent_error_is_not_retried(mongo):
+    queue = jobs.JobQueue(mongo)
+
+    async def handler(job, ctx):
+        raise jobs.PermanentJobError("site was deleted")
+
+    queue.register("render", handler)
+
+    async def run():
+        job = await queue.enqueue("render", "site-1")
+        await queue._execute(await queue._claim())
+        return await mongo.jobs.find_one({"id": job["id"]})
+
+    stored = asyncio.run(run())
+    assert (stored["status"], stored["attempts"], stored["active"]) == (jobs.FAILED, 1, False)
+
+
+def test_successful_job_stores_its_result_and_frees_the_dedup_key(mongo):
+    queue = jobs.JobQueue(mongo)
+
+    async def handler(job, ctx):
+        await ctx.progress(1, 1)
+        return {"rendered": True}
+
+    queue.register("render", handler)
+
+    async def run():
+        await queue.ensure_indexes()
+        job = await queue.enqueue("render", "site-1")
+        await queue._execute(await queue._claim())
+        return job, await queue.get(job["id"]), await queue.enqueue("render", "site-1")
+
+    job, done, fresh = asyncio.run(run())
+    assert (done["status"], done["result"], done["progress"]["done"]) == (jobs.SUCCEEDED, {"rendered": True}, 1)
+    assert fresh["id"] != job["id"]
+
+
+def test_duplicate_enqueue_returns_the_queued_job_and_keeps_the_higher_priority(mongo):
+    queue = jobs.JobQueue(mongo)
+
+    async def run():
+        await queue.ensure_indexes()
+        first = await queue.enqueue("render", "site-1")
+        low = await queue.enqueue("render", "site-1", priority=jobs.PRIORITY_LOW)
+        high = await queue.enqueue("render", "site-1", priority=jobs.PRIORITY_HIGH)
+        other = await queue.enqueue("export", "site-1")
+        return first, low, high, other, await mongo.jobs.count_documents({})
+
+    first, low, high, other, documents = asyncio.run(run())
+    assert low["id"] == high["id"] == first["id"]
+    assert (low["priority"], high["priority"]) == (jobs.PRIORITY_NORMAL, jobs.PRIORITY_HIGH)
+    assert other["id"] != first["id"]
+    assert documents == 2
+
+
+def test_enqueue_while_running_runs_the_job_again(mongo):
+    queue = jobs.JobQueue(mongo)
+    payloads = []
+
+    async def handler(job, ctx):
+        payloads.append(job["payload"])
+        if len(payloads) == 1:
+            # The site changes while the first run is rendering it
+            await queue.enqueue("render", "site-1", payload={"ignored": True})
+
+    queue.register("render", handler)
+
+    async def run():
+        await queue.ensure_indexes()
+        job = await queue.enqueue("render", "site-1", payload={"page": 1})
+        await queue._execute(await queue._claim())
+        rerun = await queue._claim()
+        await queue._execute(rerun)
+        return job, rerun, await queue._claim()
+
+    job, rerun, leftover = asyncio.run(run())
+    assert rerun["id"] != job["id"]
+    assert payloads == [{"page": 1}, {"page": 1}]
+    assert leftover is None
+
+
+def test_worker_that_lost_its_lease_cannot_finish_the_job(mongo):
+    stale, current = jobs.JobQueue(mongo), jobs.JobQueue(mongo)
+
+    async def handler(job, ctx):
+        return "done"
+
+    stale.register("render", handler)
+
+    async def run():
+        job = await stale.enqueue("render", "site-1")
+        claimed = await stale._claim()
+        await expire_lease(stale, job["id"])
+        await current.requeue_expired()
+        reclaimed = await current._claim()
+        # The first worker wakes up and completes its copy
+        await stale._execute(claimed)
+        return reclaimed, await mongo.jobs.find_one({"id": job["id"]})
+
+    reclaimed, stored = asyncio.run(run())
+    assert reclaimed["attempts"] == 2
+    assert (stored["status"], stored["locked_by"], stored["result"]) == (jobs.RUNNING, current.worker_id, None)
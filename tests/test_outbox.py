@@ -0,0 +1,162 @@
+"""SMTPTransport against a local aiosmtpd server, and the outbox's writes and leases.
+
+Checks that a batch goes out over the pooled connections without reconnecting,
+that a dropped connection is re-established, how SMTP replies are classified
+for the outbox's retry logic, that writes fall back to plain inserts only on a
+server without transactions, and that an expired lease on the last attempt
+fails the message instead of requeueing it.
+"""
+import asyncio
+import socket
+from datetime import datetime
+
+import pytest
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+import outbox  # noqa: E402
+
+PORT = 8026
+
+
+class Recorder:
+    def __init__(self):
+        self.received = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce@"):
+            return "550 No such user"
+        if address.startswith("later@"):
+            return "451 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append(envelope)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_server():
+    recorder = Recorder()
+    controller = controller_module.Controller(recorder, hostname="127.0.0.1", port=PORT)
+    controller.start()
+    yield recorder
+    controller.stop()
+
+
+def make_doc(to: str, subject: str = "Hello") -> dict:
+    return {"id": f"id-{to}", "to": to, "subject": subject, "text": "Body", "created_at": datetime.utcnow()}
+
+
+def test_batch_reuses_pooled_connections(smtp_server):
+    transport = outbox.SMTPTransport("127.0.0.1", PORT, security="none", connections=2)
+    emails = [outbox.build_email(make_doc(f"user{i}@example.com")) for i in range(10)]
+
+    async def run():
+        first = await transport.send_many(emails)
+        second = await transport.send_many(emails[:4])
+        await transport.close()
+        return first + second
+
+    assert asyncio.run(run()) == [None] * 14
+    assert len(smtp_server.received) == 14
+    assert transport.connects == 2
+
+
+def test_stale_connection_is_replaced(smtp_server):
+    transport = outbox.SMTPTransport("127.0.0.1", PORT, security="none", connections=1)
+    email = outbox.build_email(make_doc("user@example.com"))
+
+    async def run():
+        await transport.send_many([email])
+        # Simulate the server dropping the idle connection
+        smtp, last_used = transport._idle.get_nowait()
+        smtp.sock.shutdown(socket.SHUT_RDWR)
+        transport._idle.put((smtp, last_used))
+        result = await transport.send_many([email])
+        await transport.close()
+        return result
+
+    assert asyncio.run(run()) == [None]
+    assert len(smtp_server.received) == 2
+    assert transport.connects == 2
+
+
+def test_rejections_are_classified(smtp_server):
+    transport = outbox.SMTPTransport("127.0.0.1", PORT, security="none", connections=1)
+    docs = [make_doc("bounce@example.com"), make_doc("later@example.com"), make_doc("ok@example.com")]
+
+    async def run():
+        result = await transport.send_many([outbox.build_email(doc) for doc in docs])
+        await transport.close()
+        return result
+
+    bounced, deferred, delivered = asyncio.run(run())
+    assert outbox.is_permanent(bounced)
+    assert deferred is not None and not outbox.is_permanent(deferred)
+    assert delivered is None
+    # One connection carried all three, including after the rejections
+    assert transport.connects == 1
+
+
+def test_message_id_is_stable_across_retries():
+    doc = make_doc("user@example.com")
+    assert outbox.build_email(doc)["Message-ID"] == outbox.build_email(doc)["Message-ID"]
+
+
+
+def test_expired_leases_are_requeued_until_attempts_run_out(mongo):
+    # mongomock has no sessions, like a standalone server
+    box = outbox.Outbox(mongo, transactions=False)
+
+    def leased(to: str, attempts: int, lease_until: datetime) -> dict:
+        doc = outbox.message("test", to, "Hello", "Body")
+        doc.update(status=outbox.SENDING, attempts=attempts, max_attempts=3, lease_until=lease_until)
+        return doc
+
+    expired, held = datetime(2000, 1, 1), datetime(2999, 1, 1)
+
+    async def run():
+        await box.write([
+            leased("retry@example.com", 1, expired),
+            leased("last@example.com", 3, expired),
+            leased("held@example.com", 3, held),
+        ])
+        requeued = await box.requeue_expired()
+        return requeued, {doc["to"]: doc["status"] for doc in await box.db.outbox.find().to_list(None)}
+
+    requeued, statuses = asyncio.run(run())
+    assert requeued == 1
+    assert statuses == {
+        "retry@example.com": outbox.PENDING,
+        "last@example.com": outbox.FAILED,
+        "held@example.com": outbox.SENDING,
+    }
+
+
+def test_standalone_server_falls_back_to_plain_writes(mongo):
+    from pymongo.errors import OperationFailure
+
+    class StandaloneOutbox(outbox.Outbox):
+        async def _write_in_transaction(self, messages, change):
+            raise OperationFailure("Transaction numbers are only allowed on a replica set member or mongos", 20)
+
+    box = StandaloneOutbox(mongo)
+
+    async def run():
+        written = await box.write([outbox.message("test", "user@example.com", "Hello", "Body")])
+        return written, box.transactions, await mongo.outbox.count_documents({})
+
+    assert asyncio.run(run()) == (True, False, 1)
+
+
+def test_other_transaction_errors_are_raised(mongo):
+    from pymongo.errors import OperationFailure
+
+    class FailingOutbox(outbox.Outbox):
+        async def _write_in_transaction(self, messages, change):
+            raise OperationFailure("not primary", 10107)
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(FailingOutbox(mongo).write([outbox.message("test", "user@example.com", "Hello", "Body")]))
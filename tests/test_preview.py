@@ -0,0 +1,76 @@
+"""The builder's live preview WebSocket.
+
+Runs the endpoint through Starlette's test client against an in-memory shard:
+an edit comes back as section patches, an edit that leaves the website
+invalid gets an error frame without ending the session, and only a frame
+that isn't JSON closes it.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+WEBSITE = {
+    "id": "site-1", "user_id": "user-1", "business_name": "Shop", "business_description": "Fresh bread",
+    "industry": "restaurant", "contact_email": "owner@example.com", "contact_phone": "555-0100",
+    "address": "1 Main St", "slug": "shop", "products": [], "colors": {}, "social_links": {},
+}
+
+
+@pytest.fixture
+def preview_socket(monkeypatch, mongo, server):
+    import tenancy
+    from fastapi.testclient import TestClient
+
+    shard = tenancy.Shard(tenancy.PRIMARY_SHARD, mongo, mongo)
+
+    async def user_from_token(token):
+        return {"id": "user-1"} if token == "valid" else None
+
+    async def shard_for(user_id, write=False):
+        return shard
+
+    monkeypatch.setattr(server, "user_from_token", user_from_token)
+    monkeypatch.setattr(server.tenants, "shard_for", shard_for)
+    asyncio.run(mongo.websites.insert_one(dict(WEBSITE)))
+    # No context manager: the app's start-up hooks (Mongo, workers) stay off
+    client = TestClient(server.app)
+    return lambda: client.websocket_connect("/api/websites/site-1/preview/live?token=valid")
+
+
+def test_edit_returns_patches_for_changed_sections(preview_socket):
+    with preview_socket() as ws:
+        page = ws.receive_json()
+        ws.send_json({"type": "update", "seq": 1, "changes": {"business_name": "Bakery"}})
+        reply = ws.receive_json()
+
+    assert page["type"] == "page" and "Shop" in page["html"]
+    assert (reply["type"], reply["seq"]) == ("patch", 1)
+    assert reply["patches"] and all("Shop" not in patch["html"] for patch in reply["patches"])
+    assert any("Bakery" in patch["html"] for patch in reply["patches"])
+
+
+def test_invalid_edit_is_rejected_and_the_session_continues(preview_socket):
+    with preview_socket() as ws:
+        ws.receive_json()
+        ws.send_json({"type": "update", "seq": 1, "changes": {"business_name": None}})
+        rejected = ws.receive_json()
+        ws.send_json({"type": "update", "seq": 2, "changes": {"business_name": "Bakery"}})
+        accepted = ws.receive_json()
+
+    assert (rejected["type"], rejected["seq"]) == ("error", 1)
+    assert rejected["detail"][0]["loc"] == ["business_name"]
+    assert (accepted["type"], accepted["seq"]) == ("patch", 2)
+
+
+def test_malformed_frame_closes_the_session(preview_socket):
+    from starlette.websockets import WebSocketDisconnect
+
+    with preview_socket() as ws:
+        ws.receive_json()
+        ws.send_text("{not json")
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+
+    assert closed.value.code == 1003
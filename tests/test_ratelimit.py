@@ -0,0 +1,201 @@
+"""Rate limiter maths, rule matching and request keys.
+
+The token bucket runs on a fake clock; the sliding window runs against a
+minimal in-memory stand-in for the Redis pipeline it uses.
+"""
+import asyncio
+
+import pytest
+
+import ratelimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePipeline:
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def incr(self, key):
+        self.ops.append(("incr", key))
+
+    def expire(self, key, seconds):
+        self.ops.append(("expire", key))
+
+    def get(self, key):
+        self.ops.append(("get", key))
+
+    async def execute(self):
+        results = []
+        for op, key in self.ops:
+            if op == "incr":
+                self.store[key] = self.store.get(key, 0) + 1
+                results.append(self.store[key])
+            elif op == "expire":
+                results.append(True)
+            else:
+                results.append(self.store.get(key))
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self.store)
+
+
+def test_token_bucket_allows_a_burst_then_reports_retry_after():
+    clock = FakeClock()
+    limiter = ratelimit.InMemoryRateLimiter(clock=clock)
+    results = [limiter.hit_local("k", 5, 60) for _ in range(6)]
+    assert results[:5] == [0.0] * 5
+    # One token refills every 12 s
+    assert results[5] == pytest.approx(12.0)
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    limiter = ratelimit.InMemoryRateLimiter(clock=clock)
+    for _ in range(5):
+        limiter.hit_local("k", 5, 60)
+    clock.now += 6
+    assert limiter.hit_local("k", 5, 60) == pytest.approx(6.0)
+    clock.now += 6
+    assert limiter.hit_local("k", 5, 60) == 0.0
+    # Refill is capped at the limit, however long the key was idle
+    clock.now += 3600
+    assert [limiter.hit_local("k", 5, 60) for _ in range(6)][-2:] == [0.0, pytest.approx(12.0)]
+
+
+def test_buckets_are_per_key_and_swept_when_full():
+    clock = FakeClock()
+    limiter = ratelimit.InMemoryRateLimiter(sweep_interval=30, clock=clock)
+    limiter.hit_local("a", 1, 60)
+    assert limiter.hit_local("a", 1, 60) > 0
+    assert limiter.hit_local("b", 1, 60) == 0.0
+    clock.now += 61
+    limiter.sweep()
+    assert len(limiter) == 0
+
+
+def test_sliding_window_weights_the_previous_window(monkeypatch):
+    limiter = ratelimit.RedisRateLimiter(client=FakeRedis())
+    now = [6000.0]  # the start of a 60 s window
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+
+    async def hits(count):
+        return [await limiter.hit("k", 10, 60) for _ in range(count)]
+
+    assert asyncio.run(hits(10)) == [0.0] * 10
+    # Over the limit in the current window: wait for the window to end
+    assert asyncio.run(hits(1)) == [pytest.approx(60.0)]
+
+    # Halfway into the next window the previous one (11 hits) still counts for half
+    now[0] += 90
+    results = asyncio.run(hits(5))
+    assert results[:4] == [0.0] * 4
+    # 11 * w + 5 fits once w <= 5/11, i.e. 60 * 6/11 s into the window
+    assert results[4] == pytest.approx(60 * 6 / 11 - 30)
+
+
+def test_rules_match_in_order_by_path_and_method():
+    middleware = ratelimit.RateLimitMiddleware(None, ratelimit.InMemoryRateLimiter())
+    assert middleware.match("/api/auth/login", "POST").name == "login"
+    assert middleware.match("/api/auth/login", "GET") is None
+    assert middleware.match("/api/websites/abc/preview", "GET").name == "preview"
+    assert middleware.match("/api/websites/abc/preview/live", "GET").name == "preview"
+    assert middleware.match("/api/websites/abc/inquiries", "POST").name == "inquiry"
+    assert middleware.match("/api/sites/user/shop", "GET").name == "sites"
+    assert middleware.match("/", "GET").name == "sites"
+    assert middleware.match("/api/websites", "GET") is None
+
+
+def test_tenant_key_uses_the_token_signature():
+    token = b"header.payload.signature-part"
+    by_header = ratelimit._tenant_key({"client": ("10.0.0.1", 1)}, {b"authorization": b"Bearer " + token})
+    by_query = ratelimit._tenant_key({"client": ("10.0.0.2", 1), "query_string": b"a=1&token=" + token}, {})
+    assert by_header == by_query == "t:signature-part"
+    # Without a token the client IP is the key
+    assert ratelimit._tenant_key({"client": ("10.0.0.3", 1)}, {}) == "10.0.0.3"
+
+
+def test_middleware_rejects_with_retry_after():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+
+    limiter = ratelimit.InMemoryRateLimiter()
+    rules = [ratelimit.RateLimitRule("login", ratelimit.re.compile(r"^/login$"), None, 1, 30.0)]
+    middleware = ratelimit.RateLimitMiddleware(app, limiter, rules)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        scope = {"type": "http", "path": "/login", "method": "POST", "headers": [], "client": ("10.0.0.1", 1)}
+        await middleware(scope, None, send)
+        await middleware(scope, None, send)
+
+    asyncio.run(run())
+    assert calls == ["/login"]
+    assert sent[0]["status"] == 429
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"30"
+
+
+def test_forwarded_clients_get_their_own_buckets_only_behind_trusted_proxies():
+    proxies = ratelimit.parse_networks("10.0.0.0/8, 127.0.0.1")
+
+    def key(peer, forwarded=None):
+        headers = {b"x-forwarded-for": forwarded} if forwarded else {}
+        return ratelimit._client_key({"client": (peer, 1)}, headers, proxies)
+
+    assert key("10.0.0.5", b"203.0.113.7") == "203.0.113.7"
+    assert key("10.0.0.5", b"198.51.100.2") == "198.51.100.2"
+    # A client-supplied entry comes first; the proxy chain's appended address counts
+    assert key("10.0.0.5", b"1.2.3.4, 203.0.113.7, 10.1.1.1") == "203.0.113.7"
+    # Only a trusted peer's header is believed
+    assert key("203.0.113.9", b"1.2.3.4") == "203.0.113.9"
+    assert key("10.0.0.5") == "10.0.0.5"
+    assert ratelimit._client_key({"client": ("10.0.0.5", 1)}, {b"x-forwarded-for": b"1.2.3.4"}) == "10.0.0.5"
+
+
+def test_middleware_limits_forwarded_clients_separately():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    rules = [ratelimit.RateLimitRule("sites", ratelimit.re.compile(r"^/"), None, 1, 60.0)]
+    middleware = ratelimit.RateLimitMiddleware(app, ratelimit.InMemoryRateLimiter(), rules, "10.0.0.0/8")
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    async def request(client_ip):
+        scope = {"type": "http", "path": "/", "method": "GET", "client": ("10.0.0.5", 1),
+                 "headers": [(b"x-forwarded-for", client_ip)]}
+        await middleware(scope, None, send)
+
+    async def run():
+        for client_ip in (b"203.0.113.1", b"203.0.113.2", b"203.0.113.1"):
+            await request(client_ip)
+
+    asyncio.run(run())
+    assert statuses == [200, 200, 429]
@@ -0,0 +1,155 @@
+"""WebsiteRevisions round trips against an in-memory Motor mock.
+
+Records a history longer than one checkpoint interval and checks that every
+revision rebuilds to the state the website had after that write, including
+revisions whose images are stored as blob references. Also covers writers
+racing for revision numbers, and deleting a purged site's history together
+with the blobs no other site uses.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+import revisions  # noqa: E402
+
+FIELDS = ["business_name", "colors", "logo_base64", "hero_image_base64", "products"]
+INTERVAL = 4
+
+
+def make_store(db):
+    return revisions.WebsiteRevisions(db, FIELDS, INTERVAL)
+
+
+async def record_history(store, edits):
+    """Apply ``edits`` in order, recording each; returns the expected state per revision."""
+    website = {"id": "site-1", "user_id": "user-1", "business_name": "Shop", "colors": {"primary": "#000000"},
+               "logo_base64": None, "hero_image_base64": None, "products": []}
+    await store.ensure_indexes()
+    states = [None] * (len(edits) + 1)
+    number = await store.record(website)
+    states[number] = {field: website[field] for field in FIELDS}
+    for changes in edits:
+        website = {**website, **changes}
+        number = await store.record(website, changes)
+        states[number] = {field: website[field] for field in FIELDS}
+    return states
+
+
+def test_every_revision_rebuilds_across_checkpoints(mongo):
+    store = make_store(mongo)
+    edits = [{"business_name": f"Shop {i}"} if i % 2 else {"colors": {"primary": f"#00000{i}"}} for i in range(9)]
+
+    async def run():
+        states = await record_history(store, edits)
+        kinds = [doc["kind"] for doc in await store.db.website_revisions.find().sort("number", 1).to_list(None)]
+        rebuilt = [await store.state_at("site-1", number) for number in range(len(states))]
+        return states, kinds, rebuilt
+
+    states, kinds, rebuilt = asyncio.run(run())
+    assert kinds == ["checkpoint", "delta", "delta", "delta"] * 2 + ["checkpoint", "delta"]
+    assert rebuilt == states
+
+
+def test_blob_referenced_images_round_trip(mongo):
+    store = make_store(mongo)
+    logo, hero, photo = "bG9nbw==" * 100, "aGVybw==" * 100, "cGhvdG8=" * 100
+    edits = [
+        {"logo_base64": logo},
+        {"products": [{"name": "A", "image_base64": photo}, {"name": "B", "image_base64": None}]},
+        {"business_name": "Renamed"},
+        {"hero_image_base64": hero},
+        # Same image again on another product: stored once
+        {"products": [{"name": "A", "image_base64": photo}, {"name": "C", "image_base64": photo}]},
+        {"logo_base64": None},
+    ]
+
+    async def run():
+        states = await record_history(store, edits)
+        rebuilt = [await store.state_at("site-1", number) for number in range(len(states))]
+        raw = await store.db.website_revisions.find({}, {"_id": 0}).to_list(None)
+        blobs = await store.db.revision_blobs.count_documents({})
+        return states, rebuilt, raw, blobs
+
+    states, rebuilt, raw, blobs = asyncio.run(run())
+    assert rebuilt == states
+    # Revisions hold references, never the image data itself
+    assert not any(value in str(doc) for doc in raw for value in (logo, hero, photo))
+    assert blobs == 3
+
+
+def test_missing_revisions_are_none(mongo):
+    store = make_store(mongo)
+
+    async def run():
+        await record_history(store, [{"business_name": "Two"}])
+        return await store.state_at("site-1", 5), await store.state_at("other-site", 0)
+
+    assert asyncio.run(run()) == (None, None)
+
+
+def test_lost_number_races_retry_as_checkpoints(mongo):
+    store = make_store(mongo)
+
+    async def run():
+        await record_history(store, [{"business_name": "Two"}, {"business_name": "Three"}])
+        next_number, stale = store._next_number, iter([1, 2])
+
+        async def racing_next_number(website_id):
+            # Two concurrent writers take the numbers this writer picks first
+            return next(stale, None) or await next_number(website_id)
+
+        store._next_number = racing_next_number
+        website = {"id": "site-1", "user_id": "user-1", "business_name": "Four", "colors": {}, "products": []}
+        number = await store.record(website, {"business_name": "Four"})
+        kind = (await mongo.website_revisions.find_one({"number": number}))["kind"]
+        return number, kind, (await store.state_at("site-1", number))["business_name"]
+
+    assert asyncio.run(run()) == (3, revisions.CHECKPOINT, "Four")
+
+
+def test_retries_are_bounded(mongo):
+    store = make_store(mongo)
+
+    async def run():
+        await record_history(store, [])
+
+        async def always_taken(website_id):
+            return 0
+
+        store._next_number = always_taken
+        await store.record({"id": "site-1", "user_id": "user-1"}, {"business_name": "Two"})
+
+    with pytest.raises(revisions.DuplicateKeyError):
+        asyncio.run(run())
+
+
+def test_deleting_history_drops_blobs_no_other_site_uses(mongo, monkeypatch):
+    monkeypatch.setattr(revisions, "BLOB_GRACE_SECONDS", -1)
+    store = make_store(mongo)
+    shared, own = "c2hhcmVk" * 50, "b3du" * 50
+
+    async def run():
+        await store.ensure_indexes()
+        for website_id, logo in (("site-1", own), ("site-1", shared), ("site-2", shared)):
+            await store.record({"id": website_id, "user_id": "user-1", "logo_base64": logo}, {"logo_base64": logo})
+        deleted = await store.delete(["site-1"])
+        blobs = [doc["data"] for doc in await mongo.revision_blobs.find().to_list(None)]
+        return deleted, blobs, (await store.state_at("site-2", 0))["logo_base64"]
+
+    deleted, blobs, site_2_logo = asyncio.run(run())
+    assert deleted == 1
+    assert blobs == [shared]
+    assert site_2_logo == shared
+
+
+def test_recently_written_blobs_survive_a_purge(mongo):
+    store = make_store(mongo)
+
+    async def run():
+        await store.record({"id": "site-1", "user_id": "user-1", "logo_base64": "bG9nbw=="})
+        # A write in flight may have stored this blob without having inserted its revision yet
+        return await store.delete(["site-1"]), await mongo.revision_blobs.count_documents({})
+
+    assert asyncio.run(run()) == (0, 1)
@@ -0,0 +1,202 @@
+"""Render coalescing, visit counting and pre-rendering of site pages.
+
+SingleFlight and SiteWarmer run on plain coroutines; VisitCounter and the
+page render that feeds the cache use an in-memory Motor mock.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+import site_warmup  # noqa: E402
+from cache import InProcessCache  # noqa: E402
+
+
+def test_concurrent_calls_share_one_render():
+    flight = site_warmup.SingleFlight()
+    renders = []
+
+    async def render():
+        renders.append(1)
+        await asyncio.sleep(0.01)
+        return "html"
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("page", render) for _ in range(5)))
+        return results, len(flight)
+
+    results, in_flight = asyncio.run(run())
+    assert results == ["html"] * 5
+    assert len(renders) == 1
+    assert flight.coalesced == 4
+    assert in_flight == 0
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    flight = site_warmup.SingleFlight()
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("no such page")
+
+    async def run():
+        results = await asyncio.gather(flight.do("page", render), flight.do("page", render), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flight.do("page", render)
+        return results
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert len(calls) == 2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_render():
+    flight = site_warmup.SingleFlight()
+
+    async def render():
+        await asyncio.sleep(0.02)
+        return "html"
+
+    async def run():
+        first = asyncio.create_task(flight.do("page", render))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("page", render))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "html"
+
+
+def test_invalidation_starts_a_fresh_render():
+    cache = InProcessCache()
+    flight = site_warmup.SingleFlight(generation=lambda: cache.generation)
+    versions = iter(["before edit", "after edit"])
+
+    async def render():
+        version = next(versions)
+        await asyncio.sleep(0.02)
+        return version
+
+    async def run():
+        stale = asyncio.create_task(flight.do("page", render))
+        await asyncio.sleep(0)
+        await cache.invalidate_tags(["website:1"])
+        fresh = await flight.do("page", render)
+        return await stale, fresh
+
+    assert asyncio.run(run()) == ("before edit", "after edit")
+    assert flight.coalesced == 0
+
+
+def test_render_overtaken_by_an_invalidation_is_not_cached(monkeypatch, mongo, server):
+    import tenancy
+
+    cache = InProcessCache()
+    shard = tenancy.Shard(tenancy.PRIMARY_SHARD, mongo, mongo)
+    user = {"id": "user-1", "email": "owner@example.com"}
+    website = {
+        "id": "site-1", "user_id": "user-1", "business_name": "Shop", "business_description": "Fresh bread",
+        "industry": "restaurant", "contact_email": "owner@example.com", "contact_phone": "555-0100",
+        "address": "1 Main St", "slug": "shop", "products": [], "colors": {}, "social_links": {}, "is_active": True,
+    }
+    generate_website_html = server.generate_website_html
+    edits = []
+
+    def render_during_edit(website_obj):
+        # The owner saves an edit after the render read the site, before it's cached
+        for tag in edits:
+            cache.invalidate_tags_local([tag])
+        return generate_website_html(website_obj)
+
+    async def find_by_email(email):
+        return "user-1", shard
+
+    monkeypatch.setattr(server, "page_cache", cache)
+    monkeypatch.setattr(server, "generate_website_html", render_during_edit)
+    monkeypatch.setattr(server.tenants, "find_by_email", find_by_email)
+
+    async def run():
+        await mongo.users.insert_one(dict(user))
+        await mongo.websites.insert_one(dict(website))
+        edits.append("website:site-1")
+        overtaken = await server.load_site_page("owner@example.com", "shop")
+        cached_after_edit = await server.get_cached_site_page("owner@example.com", "shop")
+        edits.clear()
+        await server.load_site_page("owner@example.com", "shop")
+        return overtaken, cached_after_edit, await server.get_cached_site_page("owner@example.com", "shop")
+
+    overtaken, cached_after_edit, cached = asyncio.run(run())
+    assert "Shop" in overtaken
+    assert cached_after_edit is None
+    assert cached == overtaken
+
+
+def test_visits_are_flushed_and_ranked(mongo):
+    counter = site_warmup.VisitCounter(mongo)
+    for page, visits in [(("a", "shop"), 3), (("b", "cafe"), 5), (("a", "blog"), 1)]:
+        for _ in range(visits):
+            counter.hit(*page)
+
+    async def run():
+        await counter.ensure_indexes()
+        flushed = await counter.flush()
+        counter.hit("a", "shop")
+        counter.hit("a", "shop")
+        await counter.flush()
+        return flushed, await counter.flush(), await counter.top(2), await counter.db.site_visits.count_documents({})
+
+    flushed, empty, top, documents = asyncio.run(run())
+    assert (flushed, empty) == (3, 0)
+    assert top == [("a", "shop"), ("b", "cafe")]
+    # One document per page and day, incremented by later flushes
+    assert documents == 3
+
+
+def test_failed_flush_keeps_the_counts():
+    class FailingCollection:
+        async def bulk_write(self, requests, ordered=True):
+            raise RuntimeError("primary stepped down")
+
+    class FailingDb:
+        site_visits = FailingCollection()
+
+    counter = site_warmup.VisitCounter(FailingDb())
+    counter.hit("a", "shop")
+    with pytest.raises(RuntimeError):
+        asyncio.run(counter.flush())
+    counter.hit("a", "shop")
+    assert counter._counts == {("a", "shop"): 2}
+
+
+def test_warmer_renders_uncached_pages_with_bounded_concurrency():
+    pages = [("a", "shop"), ("b", "cafe"), ("c", "blog"), ("d", "broken"), ("e", "gym")]
+    running, peak, rendered = [0], [0], []
+
+    async def candidates():
+        return pages
+
+    async def is_cached(username, slug):
+        return username == "b"
+
+    async def render(username, slug):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        if slug == "broken":
+            raise RuntimeError("template error")
+        rendered.append(username)
+
+    warmer = site_warmup.SiteWarmer(candidates, is_cached, render, concurrency=2)
+    stats = asyncio.run(warmer.run())
+
+    assert {k: stats[k] for k in ("pages", "rendered", "cached", "failed")} == {
+        "pages": 5, "rendered": 3, "cached": 1, "failed": 1,
+    }
+    assert sorted(rendered) == ["a", "c", "e"]
+    assert peak[0] == 2
+    assert warmer.stats is stats
@@ -0,0 +1,36 @@
+"""Startup budget for the backend process.
+
+Imports ``server`` in fresh interpreters (no Mongo needed: the client connects
+lazily and start-up I/O is deferred to warm-up) and fails if the median import
+time exceeds STARTUP_BUDGET_SECONDS or an optional heavy dependency is loaded
+before first use. See backend/benchmarks/profile_startup.py for the full report.
+"""
+import statistics
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend" / "benchmarks"))
+
+# The probe imports the whole app in this interpreter, so its dependencies must be installed
+for module in ("fastapi", "motor", "dotenv", "bcrypt", "jwt", "slugify", "email_validator", "orjson", "multipart"):
+    pytest.importorskip(module)
+
+from profile_startup import LAZY_MODULES, STARTUP_BUDGET_SECONDS, measure_import  # noqa: E402
+
+RUNS = 3
+
+
+def test_server_import_within_budget():
+    timings = [measure_import()[0] for _ in range(RUNS)]
+    median = statistics.median(timings)
+    assert median <= STARTUP_BUDGET_SECONDS, (
+        f"import server took {median:.3f}s (budget {STARTUP_BUDGET_SECONDS}s); "
+        f"run backend/benchmarks/profile_startup.py for the slowest imports"
+    )
+
+
+def test_optional_dependencies_load_lazily():
+    _, loaded, _ = measure_import()
+    assert not loaded, f"imported at startup instead of on first use: {', '.join(loaded)} (of {LAZY_MODULES})"
@@ -0,0 +1,183 @@
+"""Tenant placement and online moves across two in-memory shards.
+
+Covers ring placement and the directory lookups built on it, a move that
+keeps the tenant readable while its writes are paused, a move that fails and
+rolls back, and registration undoing its directory entry when the user can't
+be written.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+import tenancy  # noqa: E402
+
+USER_COLLECTIONS = {"websites": "user_id", "media": "user_id"}
+
+
+def make_router(client, cache_ttl: float = 0.05) -> tenancy.TenantRouter:
+    directory, other = client["primary"], client["other"]
+    shards = {
+        tenancy.PRIMARY_SHARD: tenancy.Shard(tenancy.PRIMARY_SHARD, directory, directory),
+        "b": tenancy.Shard("b", other, other),
+    }
+    return tenancy.TenantRouter(directory, shards, cache_ttl=cache_ttl)
+
+
+def user_on(router: tenancy.TenantRouter, shard: str) -> str:
+    return next(f"user-{i}" for i in range(1000) if router.ring.node_for(f"user-{i}") == shard)
+
+
+async def create_tenant(router: tenancy.TenantRouter, user_id: str, websites: int = 3) -> tenancy.Shard:
+    shard = await router.register(user_id, f"{user_id}@example.com")
+    await shard.db.users.insert_one({"id": user_id, "email": f"{user_id}@example.com"})
+    await shard.db.websites.insert_many([{"id": f"{user_id}-site-{i}", "user_id": user_id} for i in range(websites)])
+    await shard.db.media.insert_one({"id": f"{user_id}-logo", "user_id": user_id})
+    return shard
+
+
+async def website_count(router: tenancy.TenantRouter, user_id: str) -> int:
+    shard = await router.shard_for(user_id)
+    return await shard.db.websites.count_documents({"user_id": user_id})
+
+
+def test_placement_follows_the_ring_and_the_directory(mongo_client):
+    router = make_router(mongo_client)
+    on_primary, on_b = user_on(router, tenancy.PRIMARY_SHARD), user_on(router, "b")
+
+    async def run():
+        await router.ensure_indexes()
+        await create_tenant(router, on_primary)
+        await create_tenant(router, on_b)
+        # An account created before the directory existed, only on the primary shard
+        await router.shards[tenancy.PRIMARY_SHARD].db.users.insert_one({"id": "legacy", "email": "old@example.com"})
+        return (
+            (await router.shard_for(on_primary)).name,
+            (await router.shard_for(on_b)).name,
+            await router.find_by_email(f"{on_b}@example.com"),
+            await router.find_by_email("old@example.com"),
+            await router.directory.tenants.count_documents({"user_id": "legacy"}),
+            await router.find_by_email("nobody@example.com"),
+        )
+
+    primary, b, found, legacy, backfilled, missing = asyncio.run(run())
+    assert (primary, b) == (tenancy.PRIMARY_SHARD, "b")
+    assert (found[0], found[1].name) == (on_b, "b")
+    assert (legacy[0], legacy[1].name) == ("legacy", tenancy.PRIMARY_SHARD)
+    assert backfilled == 1
+    assert missing is None
+
+
+def test_duplicate_email_is_rejected(mongo_client):
+    router = make_router(mongo_client)
+
+    async def run():
+        await router.ensure_indexes()
+        await router.register("one", "same@example.com")
+        await router.register("two", "same@example.com")
+
+    with pytest.raises(tenancy.DuplicateKeyError):
+        asyncio.run(run())
+
+
+def test_move_keeps_reads_working_and_pauses_writes(mongo_client):
+    router = make_router(mongo_client)
+    user_id = user_on(router, tenancy.PRIMARY_SHARD)
+    mover = tenancy.TenantMover(router, settle_seconds=0.2, log=lambda message: None)
+
+    async def run():
+        await create_tenant(router, user_id)
+        move = asyncio.create_task(mover.move(user_id, "b"))
+        observed = []
+        while not move.done():
+            await asyncio.sleep(0.02)
+            _, state = await router.placement(user_id)
+            try:
+                await router.shard_for(user_id, write=True)
+                writable = True
+            except tenancy.TenantMovingError:
+                writable = False
+            observed.append((state, writable, await website_count(router, user_id)))
+        result = await move
+        source = router.shards[tenancy.PRIMARY_SHARD].db
+        leftovers = sum([await source[name].count_documents({field: user_id}) for name, field in USER_COLLECTIONS.items()])
+        return result, observed, (await router.shard_for(user_id, write=True)).name, leftovers
+
+    result, observed, final_shard, leftovers = asyncio.run(run())
+    assert result["moved"] and result["documents"]["websites"] == 3
+    # Reads found every website at every point of the move
+    assert {count for _, _, count in observed} == {3}
+    # Writes were refused exactly while the tenant was marked moving
+    assert any(state == tenancy.MOVING for state, _, _ in observed)
+    assert all(writable == (state != tenancy.MOVING) for state, writable, _ in observed)
+    assert final_shard == "b"
+    assert leftovers == 0
+
+
+def test_failed_move_rolls_back(mongo_client):
+    router = make_router(mongo_client)
+    user_id = user_on(router, tenancy.PRIMARY_SHARD)
+
+    class FailingMover(tenancy.TenantMover):
+        async def _wait_for_jobs(self, user_id):
+            raise RuntimeError("lost the target shard")
+
+    mover = FailingMover(router, settle_seconds=0, log=lambda message: None)
+
+    async def run():
+        await create_tenant(router, user_id)
+        with pytest.raises(RuntimeError, match="lost the target shard"):
+            await mover.move(user_id, "b")
+        await asyncio.sleep(router.cache_ttl)
+        entry = await router.directory.tenants.find_one({"user_id": user_id})
+        shard = await router.shard_for(user_id, write=True)
+        return entry, shard.name, await website_count(router, user_id)
+
+    entry, shard, websites = asyncio.run(run())
+    assert (entry["shard"], entry["state"]) == (tenancy.PRIMARY_SHARD, tenancy.ACTIVE)
+    assert shard == tenancy.PRIMARY_SHARD
+    assert websites == 3
+
+
+def test_register_failure_releases_the_directory_entry(monkeypatch, mongo_client, server):
+    router = make_router(mongo_client)
+
+    class FailingOutbox:
+        async def write(self, messages, change):
+            raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(server, "tenants", router)
+    monkeypatch.setattr(server, "outboxes", {name: FailingOutbox() for name in router.shards})
+
+    async def run():
+        with pytest.raises(RuntimeError, match="database unavailable"):
+            await server.register(server.UserCreate(name="New", email="new@example.com", password="secret"))
+        return await router.directory.tenants.count_documents({}), await router.find_by_email("new@example.com")
+
+    assert asyncio.run(run()) == (0, None)
+
+
+def test_concurrent_backfill_of_a_legacy_account_is_not_an_error(mongo_client):
+    router = make_router(mongo_client)
+
+    async def run():
+        await router.ensure_indexes()
+        await router.shards[tenancy.PRIMARY_SHARD].db.users.insert_one({"id": "legacy", "email": "old@example.com"})
+        await router.backfill_user("legacy", "old@example.com")
+        # The upsert a concurrent lookup loses, against the unique user_id index
+        class RacingTenants:
+            async def update_one(self, *args, **kwargs):
+                raise tenancy.DuplicateKeyError("E11000 duplicate key error: user_id")
+
+        directory = router.directory
+        router.directory = SimpleNamespace(tenants=RacingTenants())
+        try:
+            await router.backfill_user("legacy", "old@example.com")
+        finally:
+            router.directory = directory
+        return await router.find_by_email("old@example.com")
+
+    found = asyncio.run(run())
+    assert (found[0], found[1].name) == ("legacy", tenancy.PRIMARY_SHARD)